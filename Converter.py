@@ -1,26 +1,117 @@
-import copy
+import array
+import math
+import multiprocessing
+import numpy
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from .FisnarCommands import FisnarCommands
-from .gcodeBuddy.marlin import Command
+from .gcodeBuddy.fisnar import COMMAND_NAMES, NAME_OPCODES, OP_DUMMY_POINT, OP_END_PROGRAM, OP_LINE_END, OP_LINE_PASSING, OP_LINE_SPEED, OP_LINE_START, OP_OUTPUT, OP_Z_CLEARANCE
+from .gcodeBuddy.marlin import Command, CommandTable, UnknownCommandError, OP_G0, OP_G1, OP_TOOL_CHANGE
 from .PrinterAttributes import PrintSurface
 from .UltimusV import UltimusV
 
 from UM.Logger import Logger
 
 
+class EndpointGrid:
+    # simple spatial index (uniform grid) over the endpoints of extrusion segments, for
+    # finding the nearest unvisited segment endpoint during travel optimization. Each
+    # segment has two endpoints, as segments can be printed in either direction
+
+    def __init__(self, start_points, end_points):
+        self._points = numpy.concatenate((start_points, end_points))[:, :2]  # only x/y are used
+        self._num_segments = len(start_points)
+        self._visited = numpy.zeros(self._num_segments, dtype=bool)
+
+        mins = self._points.min(axis=0)
+        maxs = self._points.max(axis=0)
+        self._origin = mins
+        self._cell_size = max(float(numpy.max(maxs - mins)) / max(numpy.sqrt(self._num_segments), 1.0), 1e-3)
+
+        self._cells = {}
+        cell_coords = numpy.floor((self._points - self._origin) / self._cell_size).astype(int)
+        for i in range(len(cell_coords)):
+            self._cells.setdefault((cell_coords[i][0], cell_coords[i][1]), []).append(i)
+        self._max_ring = int(numpy.max(cell_coords)) + 1 if len(cell_coords) > 0 else 0
+
+    def markVisited(self, segment):
+        self._visited[segment] = True
+
+    def nearest(self, point):
+        # get the (segment index, reversed) of the closest unvisited segment endpoint
+        # to the given point, or None if all segments have been visited
+        cx = int(numpy.floor((point[0] - self._origin[0]) / self._cell_size))
+        cy = int(numpy.floor((point[1] - self._origin[1]) / self._cell_size))
+
+        best = None
+        best_dist = None
+        ring = 0
+        while ring <= self._max_ring + abs(cx) + abs(cy):
+            for x in range(cx - ring, cx + ring + 1):
+                for y in range(cy - ring, cy + ring + 1):
+                    if max(abs(x - cx), abs(y - cy)) != ring:  # only the outside of the ring
+                        continue
+                    for i in self._cells.get((x, y), ()):
+                        if self._visited[i % self._num_segments]:
+                            continue
+                        dist = (self._points[i][0] - point[0])**2 + (self._points[i][1] - point[1])**2
+                        if best_dist is None or dist < best_dist:
+                            best, best_dist = i, dist
+            # any point in a further ring is at least ring * cell_size away
+            if best_dist is not None and best_dist <= (ring * self._cell_size)**2:
+                break
+            ring += 1
+
+        if best is None:
+            return None
+        return best % self._num_segments, best >= self._num_segments
+
+
 class Converter:
     # class that facilitates the translation of commands between gcode and
     # fisnar commands in several different formats
     #
 
-    XYZ_COMMANDS = ("Dummy Point", "Line Start", "Line Passing", "Line End")
+    XYZ_COMMANDS = frozenset((OP_DUMMY_POINT, OP_LINE_START, OP_LINE_PASSING, OP_LINE_END))
+
+    DEFAULT_TRAVEL_TOGGLE_THRESHOLD = 5.0  # mm - travels shorter than this don't toggle outputs in continuous mode
+
+    LINE_SPEED_RESOLUTION = 0.1  # mm/sec - line speeds are quantized to this, so nearly equal speeds aren't resent
+
+    VA_REGISTER_LIMIT = 99  # max number of VA commands the fisnar can hold before it has to be flushed with ID
+
+    # what is done with g-code lines that aren't recognized Marlin commands, or whose parameters
+    # can't be read (like 'M117 hello'): 'skip' them silently, skip them and log a 'warn'ing for
+    # each distinct command, or raise an 'error'
+    UNKNOWN_COMMAND_POLICIES = ("skip", "warn", "error")
+    DEFAULT_UNKNOWN_COMMAND_POLICY = "warn"
+
+    # gcode is only split between worker processes if each gets at least this many lines. Below
+    # that, starting the processes and sending the lines and results between them takes about as
+    # long as it saves, so the gcode is converted in this process
+    MIN_LINES_PER_WORKER = 100000
+
+    # kinds of the entries returned by convertGcodeSlice()
+    SLICE_LINE_SPEED = 0
+    SLICE_MOVE = 1
+    SLICE_TOOL_CHANGE = 2
 
     def __init__(self):
         self.gcode_commands_str = None  # gcode commands as string separated by \n characters
-        self.gcode_commands_lst = None  # gcode commands as a list of Command objects
+        self.gcode_commands_lst = None  # gcode commands as a CommandTable
+        self.gcode_slice_results = None  # results of convertGcodeSlice(), if the gcode was parsed by worker processes
+        self.gcode_boundaries = None  # command indices bounding the conversion, found while parsing (see parseGcodeLines())
         self.last_converted_fisnar_commands = None  # the last converted fisnar command list
 
         self.print_surface = None  # type: PrintSurface
         self.continuous_extrusion = False
+        self.travel_toggle_threshold = Converter.DEFAULT_TRAVEL_TOGGLE_THRESHOLD
+        self.travel_optimization = False
+        self.travel_optimization_report = None  # travel distance/time before and after the last travel optimization
+        self.unknown_command_policy = Converter.DEFAULT_UNKNOWN_COMMAND_POLICY
+        self.conversion_workers = 0  # max number of worker processes (0 for one per core, 1 to convert in this process)
 
         self.information = None  # for error reporting
 
@@ -53,17 +144,87 @@ class Converter:
         # get the continuous extrusion state (True for continuous extrusion, False if not)
         return self.continuous_extrusion
 
+    def setTravelToggleThreshold(self, threshold):
+        # set the travel distance (mm) above which outputs are toggled off and back
+        # on during continuous extrusion with more than one output
+        self.travel_toggle_threshold = float(threshold)
+
+    def getTravelToggleThreshold(self):
+        # get the travel distance (mm) above which outputs are toggled in continuous extrusion
+        return self.travel_toggle_threshold
+
+    def setTravelOptimization(self, state):
+        # set whether extrusion segments in each layer are reordered to minimize travel moves
+        self.travel_optimization = state
+
+    def getTravelOptimization(self):
+        # get whether extrusion segments in each layer are reordered to minimize travel moves
+        return self.travel_optimization
+
+    def getTravelOptimizationReport(self):
+        # get a dictionary describing the travel distance (mm) and time (sec) before and after
+        # the last travel optimization, or None if travel optimization hasn't been done
+        return self.travel_optimization_report
+
+    def setUnknownCommandPolicy(self, policy):
+        # set what is done with unrecognized g-code commands - one of UNKNOWN_COMMAND_POLICIES
+        if policy not in Converter.UNKNOWN_COMMAND_POLICIES:
+            Logger.log("w", f"invalid unknown command policy '{policy}', using '{Converter.DEFAULT_UNKNOWN_COMMAND_POLICY}'")
+            policy = Converter.DEFAULT_UNKNOWN_COMMAND_POLICY
+        self.unknown_command_policy = policy
+
+    def getUnknownCommandPolicy(self):
+        # get what is done with unrecognized g-code commands
+        return self.unknown_command_policy
+
+    def setConversionWorkers(self, num_workers):
+        # set the max number of worker processes large gcode is converted in (0 for one per core,
+        # 1 to always convert in this process)
+        self.conversion_workers = max(0, int(num_workers))
+
+    def getConversionWorkers(self):
+        # get the max number of worker processes large gcode is converted in
+        return self.conversion_workers
+
+    def getNumWorkers(self, num_lines):
+        # get the number of worker processes to convert the given number of gcode lines in (1 if
+        # they should be converted in this process). Workers are started from a fork server (see
+        # convertGcodeLinesInWorkers()), which is started as a plain python interpreter - so they
+        # aren't used where there's no fork server (windows), or where cura is a frozen executable
+        # that can't be started as one
+        if "forkserver" not in multiprocessing.get_all_start_methods() or getattr(sys, "frozen", False):
+            return 1
+        max_workers = self.conversion_workers if self.conversion_workers > 0 else (os.cpu_count() or 1)
+        return max(1, min(max_workers, num_lines // Converter.MIN_LINES_PER_WORKER))
+
     def setGcode(self, gcode_str):
-        # sets the gcode string (and gcode list)
+        # sets the gcode string and parses it. Large gcode is parsed (and converted) by worker
+        # processes - the results are put together in convertCommands(). Raises the same errors
+        # as parseGcodeLines() either way
         self.gcode_commands_str = gcode_str
-        self.gcode_commands_lst = Converter.getStrippedCommands(gcode_str.split("\n"))
+        gcode_lines = gcode_str.split("\n")
+        self.gcode_commands_lst = None
+        self.gcode_boundaries = None
+        self.gcode_slice_results = None
+        num_workers = self.getNumWorkers(len(gcode_lines))
+        if num_workers > 1:
+            self.gcode_slice_results = self.convertGcodeLinesInWorkers(gcode_lines, num_workers)
+        if self.gcode_slice_results is not None:
+            unknown_commands = {}
+            for result in self.gcode_slice_results:
+                for unknown_command in result["unknown_commands"]:
+                    unknown_commands[unknown_command] = unknown_commands.get(unknown_command, 0) + result["unknown_commands"][unknown_command]
+        else:
+            self.gcode_commands_lst, unknown_commands, self.gcode_boundaries = Converter.parseGcodeLines(gcode_lines, self.unknown_command_policy)
+        if self.unknown_command_policy == "warn":
+            Converter.logUnknownCommands(unknown_commands)
 
     def getFisnarCommands(self):
         # get the fisnar command list from the last set gcode commands and settings.
         # returns False if an error occurs, and sets its information to an error description
 
         # ensuring gcode commands exist
-        if self.gcode_commands_lst is None:
+        if self.gcode_commands_lst is None and self.gcode_slice_results is None:
             self.setInformation("internal error: in getFisnarCommands(), gcode_commands_lst is None")
             return False
 
@@ -84,102 +245,279 @@ class Converter:
         # convert gcode to fisnar command 2d list. Assumes the extruder outputs given are valid.
         # returns False if there aren't enough gcode commands to deduce any Fisnar commands.
         # Works for both i/o card and non i/o card commands
-
-        # useful information for the conversion process
-        first_relevant_command_index = Converter.getFirstPositionalCommandIndex(self.gcode_commands_lst)
-        last_relevant_command_index = Converter.getLastExtrudingCommandIndex(self.gcode_commands_lst)
-
-        # in case there isn't enough commands (this should never happen in slicer output)
-        if first_relevant_command_index is None or last_relevant_command_index is None:
-            self.setInformation("not enough gcode commands to deduce Fisnar commands")
+        if self.gcode_slice_results is not None:
+            fisnar_commands = self.stitchGcodeSlices()
+        else:
+            fisnar_commands = self.convertGcodeCommands()
+        if fisnar_commands is False:  # error info will already be set
             return False
 
-        # default fisnar initial commands
-        fisnar_commands = [["Line Speed", 30], ["SET ME AFTER CONVERTING COORD SYSTEM"]]
-
-        # finding first extruder used in gcode
-        curr_extruder = 0
-        for command in self.gcode_commands_lst:
-            if command.get_command()[0] == "T":
-                curr_extruder = int(command.get_command()[1])
-                break
-
-        curr_pos = [0, 0, 0]
-        curr_speed = 30.0
-        for i in range(len(self.gcode_commands_lst)):
-            command = self.gcode_commands_lst[i]
-
-            # line speed change and converting from mm/min to mm/sec
-            if command.has_param("F") and (command.get_param("F") / 60) != curr_speed:
-                curr_speed = command.get_param("F") / 60
-                fisnar_commands.append(["Line Speed", curr_speed])
-
-            if first_relevant_command_index <= i <= last_relevant_command_index:  # command needs to be converted
-                if command.get_command() in ("G0", "G1"):
-                    new_commands = Converter.g0g1WithIO(command, curr_extruder + 1, curr_pos)
-                    for command in new_commands:
-                        fisnar_commands.append(command)
-                elif command.get_command() in ("G2", "G3"):
-                    pass  # might implement eventually. probably not, these are _rarely_ used.
-                elif command.get_command() == "G90":
-                    pass  # assuming all commands are absolute coords for now.
-                elif command.get_command() == "G91":
-                    pass  # assuming all commands are absolute coords for now.
-                elif command.get_command()[0] == "T":
-                    curr_extruder = int(command.get_command()[1])
-
         # turning off necessary outputs
         gcode_outputs = Converter.getOutputsInFisnarCommands(fisnar_commands)
         Logger.log("d", "gcode outputs: " + str(gcode_outputs))
         for i in range(4):
             if gcode_outputs[i]:
-                fisnar_commands.append(["Output", i + 1, 0])
-        fisnar_commands.append(["End Program"])
+                fisnar_commands.append([OP_OUTPUT, i + 1, 0])
+        fisnar_commands.append([OP_END_PROGRAM])
 
         # inverting and shifting coordinate system from gcode to fisnar, then putting home travel command
         Converter.invertCoords(fisnar_commands, self.print_surface.getZMax())
 
         # put home coordinates into home dummy point
-        fisnar_commands[1] = ["Dummy Point", self.print_surface.getXMin(), self.print_surface.getYMin(), self.print_surface.getZMax()]
+        fisnar_commands[1] = [OP_DUMMY_POINT, self.print_surface.getXMin(), self.print_surface.getYMin(), self.print_surface.getZMax()]
 
         # removing redundant output and line speed commands
         Converter.optimizeFisnarOutputCommands(fisnar_commands)
-        Converter.optimizeLineSpeedCommands(fisnar_commands)  # ensures no consectuive line speed commands
+        removed_speed_count = Converter.removeRedundantLineSpeedCommands(fisnar_commands)  # only keeps line speeds that change the speed
+        Logger.log("i", f"removed {removed_speed_count} redundant line speed commands (SP round trips)")
+
+        # reordering extrusion segments in each layer to minimize travel
+        self.travel_optimization_report = None
+        if self.travel_optimization:
+            self.travel_optimization_report = Converter.optimizeTravelMoves(fisnar_commands)
+            Logger.log("i", "travel optimization: travel distance reduced from {:.1f} mm to {:.1f} mm, saving an estimated {:.1f} sec".format(
+                self.travel_optimization_report["distance_before"], self.travel_optimization_report["distance_after"], self.travel_optimization_report["time_saved"]))
 
         # Logger.log("d", f"Converter: {self.continuous_extrusion}")
         if self.continuous_extrusion:
             num_outputs = Converter.getOutputsInFisnarCommands(fisnar_commands).count(True)
             # Logger.log("d", f"converter num_outputs: {num_outputs}")
             if num_outputs == 1:  # only one extruder. keep printing continuously
-                first_on_command_ind = None  # first extruding command
-                last_off_command_ind = None  # last command that turns off extrusion (first output off after the last output on)
-
-                for i in range(len(fisnar_commands)):
-                    if fisnar_commands[i][0] == "Output" and fisnar_commands[i][2] == 1:  # output on
-                        if first_on_command_ind is None:  # first extruding command
-                            first_on_command_ind = i
-                        
-                        j = i + 1
-                        next_off_found = False
-                        while j < len(fisnar_commands) and not next_off_found:  # getting next output off after output on
-                            if fisnar_commands[j][0] == "Output" and fisnar_commands[j][2] == 0:
-                                last_off_command_ind = j
-                                next_off_found = True
-                            j += 1
-            
-                # removing all output off and on commands in between the first on and last off commands
-                i = first_on_command_ind + 1  # starting at command after first on command
-                while i < last_off_command_ind:  # ending before last off command
-                    if fisnar_commands[i][0] == "Output":
-                        del fisnar_commands[i]
-                        last_off_command_ind -= 1  # bumping back one index
-                    else:  # not output
-                        i += 1 
-            else:  # more than one output
-                pass  # TODO: implement this                  
+                Converter.removeContinuousExtrusionToggles(fisnar_commands)
+            elif num_outputs > 1:  # multiple extruders. only toggle at tool changes and long travels
+                Converter.removeShortTravelToggles(fisnar_commands, self.travel_toggle_threshold)
 
         return fisnar_commands
 
+    def convertGcodeCommands(self):
+        # convert the parsed gcode commands to the start of a fisnar command 2d list (before the
+        # outputs are turned off at the end and the coordinate system is converted). Returns False
+        # if there aren't enough gcode commands to deduce any Fisnar commands
+
+        # useful information for the conversion process - the range of commands to convert is from the
+        # start of the first extruding movement to the last extruding command, found while parsing
+        first_relevant_command_index = None
+        if self.gcode_boundaries["first_extruding"] is not None:
+            first_relevant_command_index = self.gcode_boundaries["positional_before_extruding"]
+        last_relevant_command_index = self.gcode_boundaries["last_extruding"]
+
+        # in case there isn't enough commands (this should never happen in slicer output)
+        if first_relevant_command_index is None or last_relevant_command_index is None:
+            self.setInformation("not enough gcode commands to deduce Fisnar commands")
+            return False
+
+        # default fisnar initial commands
+        fisnar_commands = [[OP_LINE_SPEED, 30], [OP_DUMMY_POINT, 0.0, 0.0, 0.0]]  # the home point is set after converting the coord system
+
+        # first extruder used in gcode
+        curr_extruder = 0
+        if self.gcode_boundaries["first_tool"] is not None:
+            curr_extruder = self.gcode_boundaries["first_tool"]
+
+        # commands are dispatched on their integer opcode, and parameters are read straight from
+        # the command slots. G2/G3 aren't implemented (they are _rarely_ used), and all commands
+        # are assumed to be absolute coords (G90/G91 are ignored)
+        gcode_commands = self.gcode_commands_lst
+        isnan = math.isnan
+        opcodes, xs, ys, zs, es, feedrates = gcode_commands.opcodes, gcode_commands.x, gcode_commands.y, gcode_commands.z, gcode_commands.e, gcode_commands.f
+        x, y, z = 0, 0, 0
+        curr_speed = 30.0
+        for i in range(len(gcode_commands)):
+            # line speed change and converting from mm/min to mm/sec
+            feedrate = feedrates[i]
+            if not isnan(feedrate) and (feedrate / 60) != curr_speed:
+                curr_speed = feedrate / 60
+                fisnar_commands.append([OP_LINE_SPEED, curr_speed])
+
+            if first_relevant_command_index <= i <= last_relevant_command_index:  # command needs to be converted
+                opcode = opcodes[i]
+                if opcode == OP_G0 or opcode == OP_G1:  # same as g0g1WithIO(), reading the table arrays
+                    if not isnan(xs[i]):
+                        x = xs[i]
+                    if not isnan(ys[i]):
+                        y = ys[i]
+                    if not isnan(zs[i]):
+                        z = zs[i]
+                    fisnar_commands.append([OP_OUTPUT, curr_extruder + 1, 1 if es[i] > 0 else 0])  # es[i] > 0 is false for NaN (no e parameter)
+                    fisnar_commands.append([OP_DUMMY_POINT, x, y, z])
+                elif opcode == OP_TOOL_CHANGE:
+                    curr_extruder = gcode_commands.tools[i]
+
+        return fisnar_commands
+
+    def convertGcodeLinesInWorkers(self, gcode_lines, num_workers):
+        # split the gcode lines into slices that are parsed and converted in parallel by worker
+        # processes (see convertGcodeSlice()). Returns the slice results in order, or None if the
+        # workers couldn't be started (the lines should then be parsed in this process). An error
+        # parsing a slice is re-raised here as the worker raised it - the same error
+        # parseGcodeLines() raises in this process
+        slice_length = -(-len(gcode_lines) // num_workers)  # rounded up
+        slices = [(gcode_lines[i:i + slice_length], self.unknown_command_policy) for i in range(0, len(gcode_lines), slice_length)]
+
+        # workers aren't forked from cura, which has other threads running (qt's, and the serial,
+        # device discovery, dispenser and trace threads) - a forked worker would keep any lock one
+        # of them held at the fork. They're forked from a fork server instead, a plain python
+        # interpreter that only imports this module. Neither may import cura's main script, which
+        # would start cura again: the fork server doesn't, as this module is its only preload, and
+        # the workers don't, as __main__'s file is hidden while they're started. The plugin's
+        # directory is put on the path so that both can import this module by name
+        plugins_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if plugins_dir not in sys.path:
+            sys.path.append(plugins_dir)
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        main_module = sys.modules["__main__"]
+        main_path = main_module.__dict__.pop("__file__", None)
+        try:
+            executor = ProcessPoolExecutor(num_workers, mp_context=context)
+            futures = [executor.submit(Converter.convertGcodeSlice, gcode_slice) for gcode_slice in slices]  # starts the workers
+        finally:
+            if main_path is not None:
+                main_module.__file__ = main_path
+
+        with executor:
+            try:
+                return [future.result() for future in futures]
+            except BrokenProcessPool as e:  # a worker couldn't start (or import this module)
+                Logger.log("w", f"gcode conversion workers failed, converting in this process instead: {e}")
+                return None
+
+    def stitchGcodeSlices(self):
+        # same as convertGcodeCommands(), but from the slice results of the workers (see
+        # convertGcodeLinesInWorkers()). The state carried over from earlier slices (position,
+        # line speed and extruder) and the range of commands that need to be converted are only
+        # known once all slices are done, so the slice results are stitched together in order,
+        # filling in that state
+        results = self.gcode_slice_results
+
+        # finding the range of commands that need to be converted and the first extruder
+        first_relevant_command_index = None
+        last_relevant_command_index = None
+        first_extruding_found = False
+        first_extruder = None
+        offset = 0
+        for result in results:
+            if not first_extruding_found:  # the first relevant command is the last positional command before the first extruding command
+                if result["positional_before_extruding"] is not None:
+                    first_relevant_command_index = offset + result["positional_before_extruding"]
+                first_extruding_found = result["first_extruding"] is not None
+            if result["last_extruding"] is not None:
+                last_relevant_command_index = offset + result["last_extruding"]
+            if first_extruder is None:
+                first_extruder = result["first_tool"]
+            offset += result["num_commands"]
+
+        # in case there isn't enough commands (this should never happen in slicer output)
+        if first_relevant_command_index is None or last_relevant_command_index is None or not first_extruding_found:
+            self.setInformation("not enough gcode commands to deduce Fisnar commands")
+            return False
+
+        # joining the slice entries, and only keeping line speeds and entries in the relevant range
+        kinds = numpy.concatenate([numpy.frombuffer(result["kinds"], dtype=numpy.int8) for result in results])
+        values = numpy.concatenate([numpy.frombuffer(result["values"], dtype=numpy.float64) for result in results]).reshape(-1, 4)
+        offsets = numpy.cumsum([0] + [result["num_commands"] for result in results[:-1]])
+        indices = numpy.concatenate([numpy.frombuffer(results[i]["indices"], dtype=numpy.int64) + offsets[i] for i in range(len(results))])
+        keep = (kinds == Converter.SLICE_LINE_SPEED) | ((indices >= first_relevant_command_index) & (indices <= last_relevant_command_index))
+        kinds, values = kinds[keep], values[keep]
+
+        # line speeds are only kept if they change the speed (slices only know the speed since their first line speed)
+        speed_mask = kinds == Converter.SLICE_LINE_SPEED
+        speeds = values[speed_mask, 0]
+        changes = speeds != numpy.concatenate(([30.0], speeds[:-1]))
+        speed_keep = numpy.ones(len(kinds), dtype=bool)
+        speed_keep[numpy.flatnonzero(speed_mask)[~changes]] = False
+        kinds, values = kinds[speed_keep], values[speed_keep]
+
+        # moves get the extruder of the last tool change before them
+        tool_change_ind = numpy.maximum.accumulate(numpy.where(kinds == Converter.SLICE_TOOL_CHANGE, numpy.arange(len(kinds)), -1))
+        extruders = numpy.where(tool_change_ind >= 0, values[numpy.maximum(tool_change_ind, 0), 0], 0 if first_extruder is None else first_extruder)
+
+        # and any coordinates that weren't set yet in their slice are the last set coordinates of an earlier move
+        move_mask = kinds == Converter.SLICE_MOVE
+        for axis in range(1, 4):
+            coords = values[:, axis]
+            set_ind = numpy.maximum.accumulate(numpy.where(move_mask & ~numpy.isnan(coords), numpy.arange(len(kinds)), -1))
+            values[:, axis] = numpy.where(set_ind >= 0, coords[numpy.maximum(set_ind, 0)], 0.0)
+
+        # building the fisnar commands - an output and a dummy point for each move, with the line
+        # speeds (which are much rarer) put in between
+        moves = values[move_mask]
+        outputs = [[OP_OUTPUT, output, state] for output, state in zip((extruders[move_mask].astype(int) + 1).tolist(), moves[:, 0].astype(int).tolist())]
+        dummy_points = [[OP_DUMMY_POINT, x, y, z] for x, y, z in zip(moves[:, 1].tolist(), moves[:, 2].tolist(), moves[:, 3].tolist())]
+        move_commands = [None] * (2 * len(moves))
+        move_commands[0::2] = outputs
+        move_commands[1::2] = dummy_points
+
+        fisnar_commands = [[OP_LINE_SPEED, 30], [OP_DUMMY_POINT, 0.0, 0.0, 0.0]]  # the home point is set after converting the coord system
+        speed_mask = kinds == Converter.SLICE_LINE_SPEED
+        moves_before_speeds = numpy.cumsum(move_mask)[speed_mask].tolist()  # number of moves before each line speed
+        prev_moves = 0
+        for num_moves, speed in zip(moves_before_speeds, values[speed_mask, 0].tolist()):
+            fisnar_commands.extend(move_commands[2 * prev_moves:2 * num_moves])
+            fisnar_commands.append([OP_LINE_SPEED, speed])
+            prev_moves = num_moves
+        fisnar_commands.extend(move_commands[2 * prev_moves:])
+
+        return fisnar_commands
+
+    @staticmethod
+    def convertGcodeSlice(args):
+        # parse and convert a slice of gcode lines in a worker process. args is (gcode lines,
+        # unknown command policy). Every line speed change, G0/G1 move and tool change in the
+        # slice is returned as an entry in compact arrays (which are quick to send back): the
+        # entry kinds (SLICE_ constants), the index of the gcode command each came from, and four
+        # values per entry - the speed for line speeds, the output state and x/y/z for moves (NaN
+        # for coordinates that aren't set yet in the slice), and the tool for tool changes. Also
+        # returned is the information needed to find the range of commands that need converting
+        gcode_lines, unknown_command_policy = args
+        gcode_commands, unknown_commands, boundaries = Converter.parseGcodeLines(gcode_lines, unknown_command_policy)
+
+        kinds = array.array("b")
+        indices = array.array("q")
+        values = array.array("d")
+        nan = float("nan")
+        x, y, z = nan, nan, nan
+        curr_speed = None
+        isnan = math.isnan
+        opcodes, xs, ys, zs, es, feedrates = gcode_commands.opcodes, gcode_commands.x, gcode_commands.y, gcode_commands.z, gcode_commands.e, gcode_commands.f
+        for i in range(len(gcode_commands)):
+            # line speed change and converting from mm/min to mm/sec
+            feedrate = feedrates[i]
+            if not isnan(feedrate) and (feedrate / 60) != curr_speed:
+                curr_speed = feedrate / 60
+                kinds.append(Converter.SLICE_LINE_SPEED)
+                indices.append(i)
+                values.extend((curr_speed, 0.0, 0.0, 0.0))
+
+            opcode = opcodes[i]
+            if opcode == OP_G0 or opcode == OP_G1:
+                extruding = es[i] > 0  # false for NaN (no e parameter)
+                if not isnan(xs[i]):
+                    x = xs[i]
+                if not isnan(ys[i]):
+                    y = ys[i]
+                if not isnan(zs[i]):
+                    z = zs[i]
+                kinds.append(Converter.SLICE_MOVE)
+                indices.append(i)
+                values.extend((1.0 if extruding else 0.0, x, y, z))
+            elif opcode == OP_TOOL_CHANGE:
+                kinds.append(Converter.SLICE_TOOL_CHANGE)
+                indices.append(i)
+                values.extend((gcode_commands.tools[i], 0.0, 0.0, 0.0))
+
+        return {
+            "num_commands": len(gcode_commands),
+            "kinds": kinds,
+            "indices": indices,
+            "values": values,
+            "first_extruding": boundaries["first_extruding"],
+            "last_extruding": boundaries["last_extruding"],
+            "positional_before_extruding": boundaries["positional_before_extruding"],
+            "first_tool": boundaries["first_tool"],
+            "unknown_commands": unknown_commands
+        }
+
     def boundaryCheck(self, fisnar_commands):
         # check that all coordinates are within the user specified area. If ANY
         # coordinates fall outside the volume, False will be returned - if all
@@ -198,16 +536,272 @@ class Converter:
         return True  # functioned hasn't returned False, so all good
 
     @staticmethod
-    def optimizeLineSpeedCommands(fisnar_commands):
-        i = len(fisnar_commands) - 1
-        while i >= 0:
-            if fisnar_commands[i][0] == "Line Speed":
-                i -= 1
-                while fisnar_commands[i][0] == "Line Speed":
-                    fisnar_commands.pop(i)
-                    i -= 1
+    def removeRedundantLineSpeedCommands(fisnar_commands, resolution=None):
+        # remove every line speed command that doesn't change the speed in effect at the next
+        # movement command (modifies the given list). Line speeds are first quantized to the given
+        # resolution (mm/sec). Returns the number of line speed commands that were removed
+        if resolution is None:
+            resolution = Converter.LINE_SPEED_RESOLUTION
+
+        remove_indices = set()
+        effective_speed = None  # speed of the last movement command
+        pending_index = None  # index of the last line speed command since the last movement command
+        for i in range(len(fisnar_commands)):
+            command = fisnar_commands[i]
+            if command[0] == OP_LINE_SPEED:
+                command[1] = round(round(command[1] / resolution) * resolution, 3)
+                if pending_index is not None:  # overridden before any movement
+                    remove_indices.add(pending_index)
+                pending_index = i
+            elif command[0] in Converter.XYZ_COMMANDS and pending_index is not None:
+                if fisnar_commands[pending_index][1] == effective_speed:
+                    remove_indices.add(pending_index)
+                effective_speed = fisnar_commands[pending_index][1]
+                pending_index = None
+        if pending_index is not None:  # no movement after the last line speed
+            remove_indices.add(pending_index)
+
+        fisnar_commands[:] = [fisnar_commands[i] for i in range(len(fisnar_commands)) if i not in remove_indices]
+        return len(remove_indices)
+
+    @staticmethod
+    def removeContinuousExtrusionToggles(fisnar_commands):
+        # remove all output commands between the first output on and the last output off (the
+        # first output off after the last output on) from the given list of fisnar commands
+        # (modifies the given list), so a single extruder prints continuously
+        first_on_command_ind = None  # first extruding command
+        last_off_command_ind = None  # last command that turns off extrusion
+        on_since_off = False  # whether an output has been turned on since the last output off
+        for i in range(len(fisnar_commands)):
+            command = fisnar_commands[i]
+            if command[0] == OP_OUTPUT:
+                if command[2] == 1:  # output on
+                    if first_on_command_ind is None:
+                        first_on_command_ind = i
+                    on_since_off = True
+                elif on_since_off:  # first output off after an output on
+                    last_off_command_ind = i
+                    on_since_off = False
+
+        if first_on_command_ind is None or last_off_command_ind is None:
+            return
+        fisnar_commands[:] = [fisnar_commands[i] for i in range(len(fisnar_commands))
+                              if not (first_on_command_ind < i < last_off_command_ind and fisnar_commands[i][0] == OP_OUTPUT)]
+
+    @staticmethod
+    def removeShortTravelToggles(fisnar_commands, travel_threshold):
+        # remove output off/on pairs from the given list of fisnar commands (modifies the given list)
+        # where an output is turned off and then back on after a travel of travel_threshold
+        # mm or less. Toggles at tool changes (a different output turning on next) are kept
+        remove_indices = set()
+        curr_pos = None
+        i = 0
+        while i < len(fisnar_commands):
+            command = fisnar_commands[i]
+            if command[0] in Converter.XYZ_COMMANDS:
+                curr_pos = command[1:4]
+            elif command[0] == OP_OUTPUT and command[2] == 0 and curr_pos is not None:
+                # finding the next output command and the travel distance up to it
+                travel_dist = 0.0
+                travel_pos = curr_pos
+                j = i + 1
+                while j < len(fisnar_commands) and fisnar_commands[j][0] != OP_OUTPUT:
+                    if fisnar_commands[j][0] in Converter.XYZ_COMMANDS:
+                        next_pos = fisnar_commands[j][1:4]
+                        travel_dist += ((next_pos[0] - travel_pos[0])**2 + (next_pos[1] - travel_pos[1])**2 + (next_pos[2] - travel_pos[2])**2)**0.5
+                        travel_pos = next_pos
+                    j += 1
+
+                if j < len(fisnar_commands) and fisnar_commands[j][1] == command[1] and fisnar_commands[j][2] == 1:  # same output back on
+                    if travel_dist <= travel_threshold:
+                        remove_indices.add(i)
+                        remove_indices.add(j)
+            i += 1
+
+        fisnar_commands[:] = [fisnar_commands[i] for i in range(len(fisnar_commands)) if i not in remove_indices]
+
+    @staticmethod
+    def getMoves(fisnar_commands):
+        # get the dummy points of a list of fisnar commands as a list of moves in the form
+        # [(x, y, z), line speed, (outputs on during the move)]
+        moves = []
+        speed = None
+        outputs_on = ()
+        for command in fisnar_commands:
+            if command[0] == OP_LINE_SPEED:
+                speed = command[1]
+            elif command[0] == OP_OUTPUT:
+                if command[2] == 1 and command[1] not in outputs_on:
+                    outputs_on = outputs_on + (command[1],)
+                elif command[2] == 0 and command[1] in outputs_on:
+                    outputs_on = tuple(output for output in outputs_on if output != command[1])
+            elif command[0] == OP_DUMMY_POINT:
+                moves.append([(command[1], command[2], command[3]), speed, outputs_on])
+        return moves
+
+    @staticmethod
+    def getTravelStats(moves):
+        # get the total (distance, time) of the non-extruding moves in a list of moves
+        # (in the format returned by getMoves())
+        if len(moves) < 2:
+            return 0.0, 0.0
+        points = numpy.array([move[0] for move in moves], dtype=float)
+        speeds = numpy.array([move[1] if move[1] else numpy.inf for move in moves[1:]], dtype=float)
+        is_travel = numpy.array([len(move[2]) == 0 for move in moves[1:]])
+        move_dists = numpy.linalg.norm(numpy.diff(points, axis=0), axis=1)[is_travel]
+        return float(numpy.sum(move_dists)), float(numpy.sum(move_dists / speeds[is_travel]))
+
+    @staticmethod
+    def optimizeTravelMoves(fisnar_commands):
+        # reorder (and reverse, if needed) the extrusion segments in each layer of the given fisnar
+        # commands to minimize the total travel distance (modifies the given list). Travel moves
+        # between reordered segments are replaced with direct travels at the layer height. Returns
+        # a dictionary with the travel distance and time before and after optimization
+        dummy_indices = [i for i in range(len(fisnar_commands)) if fisnar_commands[i][0] == OP_DUMMY_POINT]
+        if len(dummy_indices) < 2:
+            return {"distance_before": 0.0, "distance_after": 0.0, "time_saved": 0.0}
+
+        moves = Converter.getMoves(fisnar_commands)
+        distance_before, time_before = Converter.getTravelStats(moves)
+
+        # splitting moves into blocks: extruding segments ("segment", start point, moves), and
+        # everything else ("other", moves)
+        blocks = []
+        i = 0
+        while i < len(moves):
+            if len(moves[i][2]) == 1 and i > 0:
+                j = i
+                while j < len(moves) and moves[j][2] == moves[i][2]:
+                    j += 1
+                blocks.append(["segment", moves[i - 1][0], moves[i:j]])
+                i = j
             else:
-                i -= 1
+                blocks.append(["other", [moves[i]]])
+                i += 1
+
+        # finding 'layers': runs of segments of the same output and height, separated only by travels
+        new_blocks = []
+        i = 0
+        while i < len(blocks):
+            if blocks[i][0] != "segment":
+                new_blocks.append(blocks[i])
+                i += 1
+                continue
+
+            layer_z = blocks[i][1][2]
+            layer_output = blocks[i][2][0][2]
+            layer_segments = []
+            travel_speed = None
+            j = i
+            while j < len(blocks):
+                if blocks[j][0] == "segment":
+                    if blocks[j][2][0][2] != layer_output or any(abs(move[0][2] - layer_z) > 1e-6 for move in blocks[j][2]) or abs(blocks[j][1][2] - layer_z) > 1e-6:
+                        break
+                    layer_segments.append(blocks[j])
+                    j += 1
+                else:  # only continue past travels that lead to another segment
+                    k = j
+                    while k < len(blocks) and blocks[k][0] == "other" and len(blocks[k][1][0][2]) == 0:
+                        k += 1
+                    if k == j or k == len(blocks) or blocks[k][0] != "segment":
+                        break
+                    if travel_speed is None:
+                        travel_speed = blocks[j][1][0][1]
+                    j = k
+            while blocks[j - 1][0] != "segment":  # don't swallow trailing travels
+                j -= 1
+
+            if len(layer_segments) < 3:  # nothing to reorder
+                new_blocks.extend(blocks[i:j])
+                i = j
+                continue
+
+            entry_point = layer_segments[0][1]
+            exit_point = blocks[j][1][0][0] if j < len(blocks) and blocks[j][0] == "other" else None
+            order = Converter.getTravelOrder(layer_segments, entry_point, exit_point)
+
+            for k in range(len(order)):
+                segment, reverse = layer_segments[order[k][0]], order[k][1]
+                if reverse:  # moves are traversed backwards, keeping the speed of each move
+                    points = [segment[1]] + [move[0] for move in segment[2]]
+                    seg_moves = [[points[m - 1], segment[2][m - 1][1], segment[2][m - 1][2]] for m in range(len(points) - 1, 0, -1)]
+                    segment = ["segment", points[-1], seg_moves]
+                if k > 0 or segment[1] != entry_point:
+                    speed = travel_speed if travel_speed is not None else segment[2][0][1]
+                    new_blocks.append(["other", [[segment[1], speed, ()]]])
+                new_blocks.append(segment)
+            i = j
+
+        # rebuilding fisnar commands
+        new_moves = []
+        for block in new_blocks:
+            new_moves.extend(block[2] if block[0] == "segment" else block[1])
+
+        new_commands = fisnar_commands[:dummy_indices[0]]
+        speed, outputs_on = None, ()
+        for command in new_commands:  # state before the first dummy point
+            if command[0] == OP_LINE_SPEED:
+                speed = command[1]
+            elif command[0] == OP_OUTPUT and command[2] == 1:
+                outputs_on = outputs_on + (command[1],)
+        for point, move_speed, move_outputs in new_moves:
+            if move_speed != speed and move_speed is not None:
+                new_commands.append([OP_LINE_SPEED, move_speed])
+                speed = move_speed
+            for output in outputs_on:
+                if output not in move_outputs:
+                    new_commands.append([OP_OUTPUT, output, 0])
+            for output in move_outputs:
+                if output not in outputs_on:
+                    new_commands.append([OP_OUTPUT, output, 1])
+            outputs_on = move_outputs
+            new_commands.append([OP_DUMMY_POINT, point[0], point[1], point[2]])
+        new_commands.extend(fisnar_commands[dummy_indices[-1] + 1:])
+        fisnar_commands[:] = new_commands
+
+        distance_after, time_after = Converter.getTravelStats(new_moves)
+        return {"distance_before": distance_before, "distance_after": distance_after, "time_saved": time_before - time_after}
+
+    @staticmethod
+    def getTravelOrder(segments, entry_point, exit_point=None):
+        # get the order of the given extrusion segments that minimizes travel distance, starting
+        # from entry_point (and ending at exit_point, if given) as a list of (segment index, reversed).
+        # uses a greedy nearest neighbour tour improved with 2-opt
+        starts = numpy.array([segment[1] for segment in segments], dtype=float)
+        ends = numpy.array([segment[2][-1][0] for segment in segments], dtype=float)
+
+        # greedy nearest neighbour tour
+        grid = EndpointGrid(starts, ends)
+        order = []
+        pos = entry_point
+        for k in range(len(segments)):
+            segment, reverse = grid.nearest(pos)
+            grid.markVisited(segment)
+            order.append([segment, reverse])
+            pos = starts[segment] if reverse else ends[segment]
+
+        # 2-opt - reversing the sub-tour [i, j] also reverses the direction of each segment in it
+        entry_point = numpy.array(entry_point, dtype=float)
+        for iteration in range(50):
+            tour_starts = numpy.array([ends[seg] if rev else starts[seg] for seg, rev in order])
+            tour_ends = numpy.array([starts[seg] if rev else ends[seg] for seg, rev in order])
+            next_starts = numpy.concatenate((tour_starts[1:], [exit_point if exit_point is not None else [numpy.nan] * 3]))
+            next_dists = numpy.nan_to_num(numpy.linalg.norm(tour_ends - next_starts, axis=1))  # no cost after the last segment if no exit point
+
+            best_delta, best_i, best_j = -1e-6, None, None
+            for i in range(len(order)):
+                prev_end = entry_point if i == 0 else tour_ends[i - 1]
+                old_cost = numpy.linalg.norm(tour_starts[i] - prev_end) + next_dists[i:]
+                new_cost = numpy.linalg.norm(tour_ends[i:] - prev_end, axis=1) + numpy.nan_to_num(numpy.linalg.norm(next_starts[i:] - tour_starts[i], axis=1))
+                deltas = new_cost - old_cost
+                j = int(numpy.argmin(deltas))
+                if deltas[j] < best_delta:
+                    best_delta, best_i, best_j = deltas[j], i, i + j
+            if best_i is None:
+                break
+            order[best_i:best_j + 1] = [[seg, not rev] for seg, rev in reversed(order[best_i:best_j + 1])]
+
+        return order
 
     @staticmethod
     def g0g1NoIO(command, next_command, curr_pos):
@@ -216,14 +810,14 @@ class Converter:
         command_type = None
         if command.has_param("E") and command.get_param("E") > 0:
             if next_command.has_param("E") and next_command.get_param("E") > 0:  # E -> E
-                command_type = "Line Passing"
+                command_type = OP_LINE_PASSING
             else:  # E -> no E
-                command_type = "Line End"
+                command_type = OP_LINE_END
         else:
             if next_command.has_param("E") and next_command.get_param("E") > 0:  # no E -> E
-                command_type = "Line Start"
+                command_type = OP_LINE_START
             else:  # no E -> no E
-                command_type = "Dummy Point"
+                command_type = OP_DUMMY_POINT
 
         # determining command positions (and updating current position)
         if command.has_param("X"):
@@ -240,25 +834,17 @@ class Converter:
     def g0g1WithIO(command, curr_output, curr_pos):
         # turn a g0 or g1 command into a list of the corresponding fisnar commands
         # update the given curr_pos list
-        ret_commands = []
-
-        if command.has_param("E") and command.get_param("E") > 0:  # turn output on
-            ret_commands.append(["Output", curr_output, 1])
+        if command.e is not None and command.e > 0:  # turn output on
+            output_command = [OP_OUTPUT, curr_output, 1]
         else:  # turn output off
-            ret_commands.append(["Output", curr_output, 0])
+            output_command = [OP_OUTPUT, curr_output, 0]
 
-        x, y, z = curr_pos[0], curr_pos[1], curr_pos[2]
-        if command.has_param("X"):
-            x = command.get_param("X")
-        if command.has_param("Y"):
-            y = command.get_param("Y")
-        if command.has_param("Z"):
-            z = command.get_param("Z")
+        x = curr_pos[0] if command.x is None else command.x
+        y = curr_pos[1] if command.y is None else command.y
+        z = curr_pos[2] if command.z is None else command.z
 
         curr_pos[0], curr_pos[1], curr_pos[2] = x, y, z
-        ret_commands.append(["Dummy Point", x, y, z])
-
-        return ret_commands
+        return [output_command, [OP_DUMMY_POINT, x, y, z]]
 
     @staticmethod
     def getOutputsInFisnarCommands(commands):
@@ -266,23 +852,86 @@ class Converter:
         # fisnar commands
         outputs = [False, False, False, False]
         for command in commands:
-            if command[0] == "Output":
+            if command[0] == OP_OUTPUT:
                 outputs[int(command[1]) - 1] = True
         return outputs
 
     @staticmethod
-    def getStrippedCommands(gcode_lines):
-        # convert a list of gcode lines (in string form) to a list of gcode Command objects
-        # commands are subsequently stripped of comments and empty lines. Only commands are interpreted
-        ret_command_list = []  # list to hold Command objects
+    def getStrippedCommands(gcode_lines, unknown_command_policy="error"):
+        # convert a list of gcode lines (in string form) to a CommandTable of gcode commands
+        # commands are subsequently stripped of comments and empty lines. Only commands are interpreted.
+        # lines with unrecognized commands or unreadable parameters are handled by unknown_command_policy (see UNKNOWN_COMMAND_POLICIES)
+        ret_command_list, unknown_commands, boundaries = Converter.parseGcodeLines(gcode_lines, unknown_command_policy)
+        if unknown_command_policy == "warn":
+            Converter.logUnknownCommands(unknown_commands)
+        return ret_command_list
+
+    @staticmethod
+    def parseGcodeLines(gcode_lines, unknown_command_policy="error"):
+        # same as getStrippedCommands(), but skipped lines aren't logged. Returns the CommandTable,
+        # a dictionary of the number of lines skipped by (reason, command) - see logUnknownCommands() -
+        # and a dictionary of the command indices that bound the conversion, found while parsing:
+        #   'first_extruding': same as getFirstExtrudingCommandIndex()
+        #   'last_extruding': same as getLastExtrudingCommandIndex()
+        #   'positional_before_extruding': the last positional command (g0/g1 with x, y and z and
+        #       no extrusion) before the first extruding command, or in all commands if none extrude
+        #   'first_tool': the tool of the first tool change command
+        # all are None if not found
+        ret_command_list = CommandTable()  # table to hold the commands
+        unknown_commands = {}  # number of lines skipped, by (reason, command)
+        first_extruding = None
+        last_extruding = None
+        positional_before_extruding = None
+        first_tool = None
         for line in gcode_lines:
             line = line.strip()  # removing whitespace from both ends of string
             if len(line) > 0 and line[0] != ";":  # only considering non comment and non empty lines
                 if ";" in line:
                     line = line[:line.find(";")]  # removing comments
                 line = line.strip()  # removing whitespace from both ends of string
-                ret_command_list.append(Command(line))
-        return ret_command_list
+                try:
+                    command = Command(line)
+                except UnknownCommandError:
+                    if unknown_command_policy == "error":
+                        raise
+                    skipped = ("unrecognized g-code command", line.split(" ")[0])
+                    unknown_commands[skipped] = unknown_commands.get(skipped, 0) + 1
+                    continue
+                except (TypeError, ValueError):  # recognized command, but its parameters can't be read
+                    if unknown_command_policy == "error":
+                        raise
+                    skipped = ("unreadable parameters for g-code command", line.split()[0])
+                    unknown_commands[skipped] = unknown_commands.get(skipped, 0) + 1
+                    continue
+
+                opcode = command.opcode
+                if opcode == OP_G0 or opcode == OP_G1:
+                    if command.e is not None and command.e > 0:  # extruding
+                        if command.x is not None or command.y is not None or command.z is not None:
+                            if first_extruding is None:
+                                first_extruding = len(ret_command_list)
+                            last_extruding = len(ret_command_list)
+                    elif first_extruding is None and command.x is not None and command.y is not None and command.z is not None:
+                        positional_before_extruding = len(ret_command_list)
+                elif opcode == OP_TOOL_CHANGE and first_tool is None:
+                    first_tool = command.tool
+                ret_command_list.append(command)
+
+        boundaries = {
+            "first_extruding": first_extruding,
+            "last_extruding": last_extruding,
+            "positional_before_extruding": positional_before_extruding,
+            "first_tool": first_tool
+        }
+        return ret_command_list, unknown_commands, boundaries
+
+    @staticmethod
+    def logUnknownCommands(unknown_commands):
+        # log a warning for each distinct command skipped, given a dictionary of the number of lines
+        # skipped by (reason, command) - the reason is 'unrecognized g-code command' or
+        # 'unreadable parameters for g-code command'
+        for reason, command in unknown_commands:
+            Logger.log("w", f"skipped {unknown_commands[(reason, command)]} line(s) with {reason} '{command}'")
 
     @staticmethod
     def getFirstExtrudingCommandIndex(gcode_commands):
@@ -290,9 +939,9 @@ class Converter:
         # this command must be g0/g1, have an x or y or z parameter, and have a non-zero e parameter.
         for i in range(len(gcode_commands)):
             command = gcode_commands[i]
-            if command.get_command() in ("G0", "G1"):
-                if command.has_param("X") or command.has_param("Y") or command.has_param("Z"):
-                    if command.has_param("E") and (command.get_param("E") > 0):
+            if command.opcode == OP_G0 or command.opcode == OP_G1:
+                if command.x is not None or command.y is not None or command.z is not None:
+                    if command.e is not None and command.e > 0:
                         return i
         return None  # no extruding commands. Don't know how a gcode file wouldn't have an extruding command but just in case
 
@@ -307,9 +956,9 @@ class Converter:
 
         for i in range(first_extruding_index, -1, -1):
             command = gcode_commands[i]
-            if command.get_command() in ("G0", "G1"):
-                if command.has_param("X") and command.has_param("Y") and command.has_param("Z"):
-                    if not (command.has_param("E") and command.get_param("E") > 0):
+            if command.opcode == OP_G0 or command.opcode == OP_G1:
+                if command.x is not None and command.y is not None and command.z is not None:
+                    if not (command.e is not None and command.e > 0):
                         return i
         return None  # this could be for a variety of reasons, some of which aren't that unlikely. This way of doing things is kind of ghetto. Ultimately, a more sophisticated solution should be enacted.
 
@@ -319,30 +968,25 @@ class Converter:
         # this command must have an x and/or y and/or z parameter, and have a nonzero e parameter
         for i in range(len(gcode_commands) - 1, -1, -1):
             command = gcode_commands[i]
-            if command.get_command() in ("G0", "G1"):
-                if command.has_param("X") or command.has_param("Y") or command.has_param("Z"):
-                    if command.has_param("E") and command.get_param("E") > 0:
+            if command.opcode == OP_G0 or command.opcode == OP_G1:
+                if command.x is not None or command.y is not None or command.z is not None:
+                    if command.e is not None and command.e > 0:
                         return i
         return None  # this should never happen in any reasonable gcode file.
 
     @staticmethod
     def optimizeFisnarOutputCommands(fisnar_commands):
-        # remove any redundant output commands from fisnar command list
-        for output in range(1, 5):  # for each output (integer from 1 to 4)
-            output_state = None
-            i = 0
-            while i < len(fisnar_commands):
-                if fisnar_commands[i][0] == "Output" and fisnar_commands[i][1] == output:  # is an output 1 command
-                    if output_state is None:  # is the first output 1 command
-                        output_state = fisnar_commands[i][2]
-                        i += 1
-                    elif fisnar_commands[i][2] == output_state:  # command is redundant
-                        fisnar_commands.pop(i)
-                    else:
-                        output_state = fisnar_commands[i][2]
-                        i += 1
-                else:
-                    i += 1
+        # remove any redundant output commands (ones that set an output 1-4 to the state it's
+        # already in) from fisnar command list (modifies the given list)
+        output_states = [None, None, None, None]  # state of each output, None before its first command
+        keep = []
+        for command in fisnar_commands:
+            if command[0] == OP_OUTPUT and 1 <= command[1] <= 4:
+                if command[2] == output_states[command[1] - 1]:  # command is redundant
+                    continue
+                output_states[command[1] - 1] = command[2]
+            keep.append(command)
+        fisnar_commands[:] = keep
 
     @staticmethod
     def invertCoords(commands, z_dim):
@@ -374,9 +1018,9 @@ class Converter:
         ret_commands = []
         temp_commands = []
         for command in fisnar_commands:
-            if command[0] == "Dummy Point":
-                temp_commands.append(copy.deepcopy(command))
-            elif command[0] in ("Line Speed", "Output", "End Program"):
+            if command[0] == OP_DUMMY_POINT:
+                temp_commands.append(command[:])
+            elif command[0] in (OP_LINE_SPEED, OP_OUTPUT, OP_END_PROGRAM):
                 if temp_commands != []:
                     ret_commands.append(temp_commands)
                     temp_commands = []
@@ -390,32 +1034,16 @@ class Converter:
         for i in range(len(ret_commands)):
             if isinstance(ret_commands[i][0], list):  # is a dummy point sublist
                 ret_commands[i].append([output_states[0], output_states[1], output_states[2], output_states[3]])
-            elif ret_commands[i][0] == "Output":  # isn't a sublist, so check if is an output
+            elif ret_commands[i][0] == OP_OUTPUT:  # isn't a sublist, so check if is an output
                 output_states[ret_commands[i][1] - 1] = ret_commands[i][2]
 
         # deleting output commands
-        i = 0
-        while i < len(ret_commands):
-            if ret_commands[i][0] == "Output":
-                ret_commands.pop(i)
-            else:
-                i += 1
-
-        return ret_commands
+        return [command for command in ret_commands if command[0] != OP_OUTPUT]
 
     @staticmethod
     def fisnarCommandsToCSVString(fisnar_commands):
-        # turn a 2d list of fisnar commands into a csv string
-        ret_string = ""
-        for i in range(len(fisnar_commands)):
-            for j in range(len(fisnar_commands[i])):
-                ret_string += str(fisnar_commands[i][j])
-                if j == len(fisnar_commands[i]) - 1:
-                    ret_string += "\n"
-                else:
-                    ret_string += ","
-
-        return ret_string
+        # turn a 2d list of fisnar commands into a csv string, with the command names in place of their opcodes
+        return "".join(",".join([COMMAND_NAMES[command[0]]] + [str(param) for param in command[1:]]) + "\n" for command in fisnar_commands)
 
     @staticmethod
     def fisnarCommandsToBytes(fisnar_commands, continuous_extrusion):
@@ -432,83 +1060,187 @@ class Converter:
         ret_bytes = []
         i = 0
 
-        if continuous_extrusion:  # might lead to shittier prints (ID() leads to delay in movement - similar issue that octoprint faces - consequence of asynchronous printing)
+        if continuous_extrusion:
+            # dummy points are queued in the fisnar registers and blended together. ID (wait for
+            # idle) is only sent where the robot has to be stopped: before a dispenser toggle, before
+            # a line speed change (so it doesn't apply to already queued moves), at the planned
+            # register flush points (which also serve as pause checkpoints), and at the end
+            split_indices = Converter.getSegmentSplitIndices(fisnar_commands, extruding_only=False)
+            output_states = [0, 0, 0, 0]
+            queued_dummies = 0
             while i < len(fisnar_commands):
-                if fisnar_commands[i][0] == "Output":
-                    ret_bytes.append(FisnarCommands.OU(fisnar_commands[i][1], fisnar_commands[i][2]))
-                elif fisnar_commands[i][0] == "Line Speed":
+                if fisnar_commands[i][0] == OP_OUTPUT:
+                    if output_states[fisnar_commands[i][1] - 1] != fisnar_commands[i][2]:
+                        if queued_dummies > 0:
+                            ret_bytes.append(FisnarCommands.ID())
+                            queued_dummies = 0
+                        ret_bytes.append(FisnarCommands.OU(fisnar_commands[i][1], fisnar_commands[i][2]))
+                        output_states[fisnar_commands[i][1] - 1] = fisnar_commands[i][2]
+                elif fisnar_commands[i][0] == OP_LINE_SPEED:
+                    if queued_dummies > 0:
+                        ret_bytes.append(FisnarCommands.ID())
+                        queued_dummies = 0
                     ret_bytes.append(FisnarCommands.SP(fisnar_commands[i][1]))
-                elif fisnar_commands[i][0] == "Dummy Point":
+                elif fisnar_commands[i][0] == OP_DUMMY_POINT:
                     ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
-                    ret_bytes.append(FisnarCommands.ID())
+                    queued_dummies += 1
+                    if i in split_indices or queued_dummies >= Converter.VA_REGISTER_LIMIT:
+                        ret_bytes.append(FisnarCommands.ID())
+                        queued_dummies = 0
                 i += 1
+            if queued_dummies > 0:
+                ret_bytes.append(FisnarCommands.ID())
             return ret_bytes
         else:
+            # dummy points while an output is on are queued in the fisnar registers, and are only
+            # executed as a whole once the output is turned on and an ID is sent. The register
+            # limit forces a flush every so often - these are done at the planned split points,
+            # and the dispenser is left on through them
+            split_indices = Converter.getSegmentSplitIndices(fisnar_commands)
+            output = None  # output of the dummy points currently being queued
+            dispensing = False  # whether the OU on command for the current output has been sent
+            queued_dummies = 0
+            pending_speed = None  # line speed to send once the queued dummy points are flushed
             while i < len(fisnar_commands):
-                if fisnar_commands[i][0] == "Output" and fisnar_commands[i][2] == 1:
-                    output = fisnar_commands[i][1]
-                    i += 1
-                    consecutive_dummies = 0
-                    while i < len(fisnar_commands) and fisnar_commands[i][0] == "Dummy Point":
-                        if consecutive_dummies >= 99:
+                if fisnar_commands[i][0] == OP_OUTPUT:
+                    if fisnar_commands[i][2] == 1:
+                        output = fisnar_commands[i][1]
+                    elif fisnar_commands[i][1] == output:  # output off - flush queued dummy points
+                        if queued_dummies > 0:
                             ret_bytes.append(FisnarCommands.OU(output, 1))  # output on
                             ret_bytes.append(FisnarCommands.ID())
+                            dispensing = True
+                        if dispensing:
                             ret_bytes.append(FisnarCommands.OU(output, 0))  # output off
-                            consecutive_dummies = 0
-
-                        ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
-                        i += 1
-                        consecutive_dummies += 1
-
-                    line_speed = fisnar_commands[i][1]
-                    i += 2  # skip the output command that comes afterward
-
-                    ret_bytes.append(FisnarCommands.OU(output, 1))  # output on
-                    ret_bytes.append(FisnarCommands.ID())
-                    ret_bytes.append(FisnarCommands.OU(output, 0))  # output off
-                    ret_bytes.append(FisnarCommands.SP(line_speed))
-                else:
-                    if fisnar_commands[i][0] == "Dummy Point":
+                        output = None
+                        dispensing = False
+                        queued_dummies = 0
+                    if output is None and pending_speed is not None:
+                        ret_bytes.append(FisnarCommands.SP(pending_speed))
+                        pending_speed = None
+                elif fisnar_commands[i][0] == OP_DUMMY_POINT:
+                    if output is None:
                         ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
                         ret_bytes.append(FisnarCommands.ID())
-                        i += 1
-                    elif fisnar_commands[i][0] == "Line Speed":
-                        ret_bytes.append(FisnarCommands.SP(fisnar_commands[i][1]))
-                        i += 1
                     else:
-                        Logger.log("w", "unaccounted for command in fisnar_commands: " + str(fisnar_commands[i]))
-                        i += 1
+                        if pending_speed is not None:  # speed change mid-extrusion - flush without turning the dispenser off
+                            if queued_dummies > 0:
+                                ret_bytes.append(FisnarCommands.OU(output, 1))
+                                ret_bytes.append(FisnarCommands.ID())
+                                dispensing = True
+                                queued_dummies = 0
+                            ret_bytes.append(FisnarCommands.SP(pending_speed))
+                            pending_speed = None
+
+                        ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
+                        queued_dummies += 1
+                        if i in split_indices or queued_dummies >= Converter.VA_REGISTER_LIMIT:
+                            ret_bytes.append(FisnarCommands.OU(output, 1))
+                            ret_bytes.append(FisnarCommands.ID())
+                            dispensing = True
+                            queued_dummies = 0
+                elif fisnar_commands[i][0] == OP_LINE_SPEED:
+                    if output is None:
+                        ret_bytes.append(FisnarCommands.SP(fisnar_commands[i][1]))
+                    else:  # dummy points are queued, so the speed is sent after they are flushed
+                        pending_speed = fisnar_commands[i][1]
+                elif fisnar_commands[i][0] != OP_END_PROGRAM:
+                    Logger.log("w", "unaccounted for command in fisnar_commands: " + str(fisnar_commands[i]))
+                i += 1
             return ret_bytes
 
+    @staticmethod
+    def getCornerSharpness(points):
+        # given an (n, 3) array of consecutive points, get an array of length n with the
+        # 'sharpness' of the corner at each point - 0 for no change in direction, up to 2
+        # for a complete reversal. The robot slows down the most at the sharpest corners.
+        # endpoints have no corner, so are given a sharpness of 0
+        sharpness = numpy.zeros(len(points))
+        if len(points) < 3:
+            return sharpness
+
+        directions = numpy.diff(points, axis=0)
+        lengths = numpy.linalg.norm(directions, axis=1)
+        lengths[lengths == 0.0] = 1.0  # zero length moves have no direction
+        directions = directions / lengths[:, numpy.newaxis]
+        cos_angles = numpy.einsum("ij,ij->i", directions[:-1], directions[1:])
+        sharpness[1:-1] = 1.0 - numpy.clip(cos_angles, -1.0, 1.0)
+        return sharpness
+
+    @staticmethod
+    def getSegmentSplitIndices(fisnar_commands, register_limit=None, extruding_only=True):
+        # get a set of indices of dummy points in the given fisnar commands after which the
+        # queued dummy points of a run must be flushed (so the fisnar registers don't overflow).
+        # if extruding_only is True, only dummy points while an output is on are queued (non
+        # continuous printing), otherwise all dummy points are. split points are placed at the
+        # sharpest corner in the back half of each register window, where the robot is moving
+        # slowest anyways
+        if register_limit is None:
+            register_limit = Converter.VA_REGISTER_LIMIT
+
+        dummy_indices = [i for i in range(len(fisnar_commands)) if fisnar_commands[i][0] == OP_DUMMY_POINT]
+        if len(dummy_indices) == 0:
+            return set()
+        points = numpy.array([fisnar_commands[i][1:4] for i in dummy_indices], dtype=float)
+        sharpness = Converter.getCornerSharpness(points)
+
+        # finding runs of queued dummy points (as [start, end) ranges in dummy_indices). line
+        # speed changes and output commands flush the queued dummy points, so they end a run
+        runs = []
+        output = None
+        run_start = None
+        dummy_ind = 0
+        for i in range(len(fisnar_commands)):
+            command = fisnar_commands[i]
+            if command[0] == OP_DUMMY_POINT:
+                if (output is not None or not extruding_only) and run_start is None:
+                    run_start = dummy_ind
+                dummy_ind += 1
+            elif command[0] in (OP_OUTPUT, OP_LINE_SPEED):
+                if run_start is not None:
+                    runs.append((run_start, dummy_ind))
+                    run_start = None
+                if command[0] == OP_OUTPUT:
+                    if command[2] == 1:
+                        output = command[1]
+                    elif command[1] == output:
+                        output = None
+        if run_start is not None:
+            runs.append((run_start, dummy_ind))
+
+        split_indices = set()
+        for start, end in runs:
+            while end - start > register_limit:
+                window_start = start + register_limit // 2
+                window_end = start + register_limit  # exclusive
+                split = window_start + int(numpy.argmax(sharpness[window_start:window_end]))
+                split_indices.add(dummy_indices[split])
+                start = split + 1
+
+        return split_indices
+
     @staticmethod
     def readFisnarCommandsFromCSV(csv_string):
-        # given a string in CSV format, return a 2d array of fisnar commands
+        # given a string in CSV format, return a 2d array of fisnar commands (with opcodes in place of the command names)
 
         # get the csv cells into a 2D array (again, no error checking)
-        commands = [line.split(",") for line in csv_string.split("\n")]
-
-        # converting all 2D array entries into proper types
-        i = 0
-        while i < len(commands):
-            if commands[i][0] == "Output":
-                for j in range(1, 3):
-                    commands[i][j] = int(commands[i][j])
-            elif commands[i][0] == "Dummy Point":
-                for j in range(1, 4):
-                    commands[i][j] = float(commands[i][j])
-            elif commands[i][0] == "Line Speed":
-                commands[i][1] = float(commands[i][1])
-            elif commands[i][0] == "Z Clearance":
-                commands[i][1] = int(commands[i][1])
-            elif commands[i][0] == "End Program":
-                pass
-            elif commands[i][0] in ("Line Start", "Line End", "Line Passing"):
-                for j in range(1, 4):
-                    commands[i][j] = float(commands[i][j])
+        commands = []
+        for line in csv_string.split("\n"):
+            command = line.split(",")
+            opcode = NAME_OPCODES.get(command[0], None)
+
+            # converting all 2D array entries into proper types
+            if opcode == OP_OUTPUT:
+                commands.append([opcode, int(command[1]), int(command[2])])
+            elif opcode in Converter.XYZ_COMMANDS:
+                commands.append([opcode, float(command[1]), float(command[2]), float(command[3])])
+            elif opcode == OP_LINE_SPEED:
+                commands.append([opcode, float(command[1])])
+            elif opcode == OP_Z_CLEARANCE:
+                commands.append([opcode, int(command[1])])
+            elif opcode == OP_END_PROGRAM:
+                commands.append([opcode])
             else:
-                Logger.log("d", "Unexpected command: '" + str(commands[i][0]) + "'")  # for debugging
-                commands.pop(i)
-                i -= 1  # to be immediately cancelled out by the following line - stay at the same index
-            i += 1
+                Logger.log("d", "Unexpected command: '" + str(command[0]) + "'")  # for debugging
 
-        return copy.deepcopy(commands)
+        return commands
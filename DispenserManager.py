@@ -13,14 +13,13 @@ catalog = i18nCatalog("cura")
 
 class DispenserManager:
     # a class that holds multiple UltimusV objects that has methods for
-    # getting information about their status
+    # getting information about their status. Each fisnar in the fleet has its
+    # own DispenserManager - getInstance() returns the primary fisnar's one
 
     dispenserConnectionStatesUpdated = Signal()
 
     def __init__(self):
-        if DispenserManager._instance is not None:
-            Logger.log("e", "tried to create singleton 'DispenserManager' more than once")
-        else:
+        if DispenserManager._instance is None:
             DispenserManager._instance = self
 
         self._dispensers = []
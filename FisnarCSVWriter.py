@@ -1,5 +1,4 @@
 from .FisnarRobotExtension import FisnarRobotExtension
-from .Converter import Converter
 
 from UM.Mesh.MeshWriter import MeshWriter
 from UM.Application import Application
@@ -20,12 +19,20 @@ class FisnarCSVWriter(MeshWriter):
             FisnarCSVWriter._instance = self
 
         self._fre_instance = FisnarRobotExtension.getInstance()
-        self.converter = Converter()
+        self.converter = None  # created on the first write, so the conversion stack isn't imported while cura is starting
 
     def write(self, stream, nodes, mode=MeshWriter.OutputMode.TextMode):
+        from .Converter import Converter
+        if self.converter is None:
+            self.converter = Converter()
+
         # getting updated extension parameters
         self.converter.setPrintSurface(self._fre_instance.print_surface)
         self.converter.setContinuousExtrusion(self._fre_instance.continuous_extrusion)
+        self.converter.setTravelToggleThreshold(self._fre_instance.travel_toggle_threshold)
+        self.converter.setTravelOptimization(self._fre_instance.travel_optimization)
+        self.converter.setUnknownCommandPolicy(self._fre_instance.unknown_command_policy)
+        self.converter.setConversionWorkers(self._fre_instance.conversion_workers)
 
         # TODO: figure out a way to get the filename of the saved file, and add it as a parameter in the extension plugin
 
@@ -51,8 +58,12 @@ class FisnarCSVWriter(MeshWriter):
             #     Logger.log("d", str(element))
 
             # setting converter gcode and attempting to convert
-            self.converter.setGcode("".join([str(chunk) for chunk in gcode_list]))
-            fisnar_commands = self.converter.getFisnarCommands()
+            try:
+                self.converter.setGcode("".join([str(chunk) for chunk in gcode_list]))
+                fisnar_commands = self.converter.getFisnarCommands()
+            except (TypeError, ValueError) as e:  # unrecognized command or unreadable parameters (with the 'error' policy)
+                self.setInformation(catalog.i18nc("@warning:status", f"Gcode could not be read: {str(e)}"))
+                return False  # error
 
             if fisnar_commands is False:  # error was caught in conversion, get error info from converter object
                 self.setInformation(catalog.i18nc("@warning:status", self.converter.getInformation()))
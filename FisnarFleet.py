@@ -0,0 +1,145 @@
+import threading
+from collections import deque
+from io import StringIO
+from UM.Application import Application
+from UM.Logger import Logger
+from UM.Message import Message
+from .FisnarCSVWriter import FisnarCSVWriter
+from .FisnarOutputDevice import FisnarOutputDevice
+from .PrintTimeEstimator import PrintTimeEstimator
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+
+class FisnarFleet:
+    # registry of the fisnar robots driven by this plugin (one FisnarOutputDevice per robot,
+    # each with its own RS232 thread and dispensers), and a job scheduler that sends compiled
+    # programs to whichever robot is idle. Jobs wait in a queue until a robot that can print
+    # them (idle, with the dispensers the job needs connected) is available.
+    #
+    # A program can also be broadcast: printed on every robot that can print it at once. The
+    # program is stored once as a tuple (so no robot can change it) and shared, along with its
+    # print time estimate, by all of the robots. Each robot streams it from its own RS232
+    # thread with its own command index, so each keeps its own progress and error state and
+    # a slow robot doesn't hold back the others
+
+    def __init__(self):
+        self._robots = []  # type: list[FisnarOutputDevice]
+        self._jobs = deque()  # (name, command bytes) waiting for an idle robot
+        self._lock = threading.RLock()  # jobs can be submitted while a deferred dispatch() is running
+        self._job_count = 0
+        self._broadcast = None  # (name, program, robots) of the last broadcast
+
+    def addRobot(self, robot):
+        if robot not in self._robots:
+            self._robots.append(robot)
+            # robots change state from their RS232 threads, partway through stopping a print, so
+            # dispatching is deferred to the Qt thread instead of re-entering the robot from its signals
+            robot.printingStatusUpdated.connect(self._scheduleDispatch)
+            robot.stopCompleted.connect(self._scheduleDispatch)
+            robot.connectionStateChanged.connect(self._onRobotConnectionStateChanged)
+
+    def getRobots(self):
+        return self._robots
+
+    def getRobot(self, device_id):
+        for robot in self._robots:
+            if robot.getId() == device_id:
+                return robot
+        return None
+
+    def getIdleRobots(self):
+        return [robot for robot in self._robots if robot.isIdle()]
+
+    def getNumQueuedJobs(self):
+        return len(self._jobs)
+
+    def submitJob(self, name, command_bytes):
+        # queue a compiled program to be printed on the next idle robot
+        with self._lock:
+            self._jobs.append((name, command_bytes))
+        Logger.log("i", f"fleet job '{name}' queued ({len(self._jobs)} jobs waiting, {len(self.getIdleRobots())} robots idle)")
+        self.dispatch()
+
+    def dispatch(self):
+        # start queued jobs on any robots that can print them, in the order they were submitted
+        with self._lock:
+            while len(self._jobs) > 0:
+                name, command_bytes = self._jobs[0]
+                robot = next((robot for robot in self._robots if robot.canPrint(command_bytes)), None)
+                if robot is None:
+                    return
+                self._jobs.popleft()
+                Logger.log("i", f"fleet job '{name}' started on {robot.getName()}")
+                robot.printProgram(command_bytes)
+
+    def broadcast(self, name, command_bytes, robots=None):
+        # print a compiled program on every robot in robots (all robots by default) that can
+        # print it. Returns the robots the print was started on
+        program = tuple(command_bytes)
+        print_time_estimator = PrintTimeEstimator(program)
+        started_robots = []
+        with self._lock:
+            for robot in (self._robots if robots is None else robots):
+                if robot.canPrint(program):
+                    robot.printProgram(program, print_time_estimator)
+                    started_robots.append(robot)
+        self._broadcast = (name, program, started_robots)
+        Logger.log("i", f"fleet broadcast '{name}' started on {len(started_robots)} robots: {', '.join(robot.getName() for robot in started_robots)}")
+        return started_robots
+
+    def getBroadcastStatus(self):
+        # get the print status of each robot in the last broadcast (an empty list if there hasn't been one)
+        if self._broadcast is None:
+            return []
+        name, program, robots = self._broadcast
+        return [robot.getPrintStatus() for robot in robots]
+
+    def _scheduleDispatch(self):
+        # run dispatch() on the Qt thread once the robot that signalled has finished what it's doing
+        Application.getInstance().callLater(self.dispatch)
+
+    def _onRobotConnectionStateChanged(self, device_id):
+        self._scheduleDispatch()
+
+    @staticmethod
+    def compileCurrentScene(continuous_extrusion):
+        # compile the current scene into a fisnar program (list of command bytes), or return None
+        # and show an error message if it can't be compiled
+        from .Converter import Converter  # the conversion stack is only imported when it's first needed
+        fisnar_csv_writer = FisnarCSVWriter.getInstance()
+        fisnar_command_csv_io = StringIO()
+        if not fisnar_csv_writer.write(fisnar_command_csv_io, None):
+            Logger.log("e", f"FisnarCSVWriter failed in compileCurrentScene(): {str(fisnar_csv_writer.getInformation())}")
+            err_msg = Message(text = catalog.i18nc("@message", f"An error occured while preparing print: {str(fisnar_csv_writer.getInformation())}"),
+                              title = catalog.i18nc("@message", "Error Preparing Print"))
+            err_msg.show()
+            return None
+
+        commands = Converter.readFisnarCommandsFromCSV(fisnar_command_csv_io.getvalue())
+        return Converter.fisnarCommandsToBytes(commands, continuous_extrusion)
+
+    def broadcastCurrentScene(self, continuous_extrusion):
+        # compile the current scene and print it on every robot that can print it
+        command_bytes = FisnarFleet.compileCurrentScene(continuous_extrusion)
+        if command_bytes is None:
+            return
+        self._job_count += 1
+        started_robots = self.broadcast(f"job {self._job_count}", command_bytes)
+        if len(started_robots) == 0:
+            msg = Message(text = catalog.i18nc("@message", "No Fisnar is available to print on. Ensure the robots and the dispensers the print needs are connected and idle."),
+                          title = catalog.i18nc("@message", "No Fisnar Available"))
+            msg.show()
+
+    def submitCurrentScene(self, continuous_extrusion):
+        # compile the current scene and queue it as a job
+        command_bytes = FisnarFleet.compileCurrentScene(continuous_extrusion)
+        if command_bytes is None:
+            return
+        self._job_count += 1
+        self.submitJob(f"job {self._job_count}", command_bytes)
+        if self.getNumQueuedJobs() > 0:
+            msg = Message(text = catalog.i18nc("@message", f"No Fisnar is available to print job {self._job_count} yet, it will start when one is idle. Jobs waiting: {self.getNumQueuedJobs()}"),
+                          title = catalog.i18nc("@message", "Print Queued"))
+            msg.show()
@@ -1,21 +1,24 @@
 import os
 import os.path
 import time
+from collections import deque
 from cura.CuraApplication import CuraApplication
 from cura.PrinterOutput.PrinterOutputDevice import PrinterOutputDevice, ConnectionType, ConnectionState
 from io import StringIO
 from PyQt6.QtCore import pyqtProperty, pyqtSignal, pyqtSlot, QTimer
 from queue import Queue
 from serial import Serial, SerialException, SerialTimeoutException
-from threading import Event, Thread
+from threading import Event, Lock, Thread
 from UM.Resources import Resources
 from UM.Logger import Logger
 from UM.Message import Message
-from .Converter import Converter
 from .FisnarCommands import FisnarCommands
 from .FisnarCSVWriter import FisnarCSVWriter
 from .FisnarRobotExtension import FisnarRobotExtension
-from .PickAndPlaceGenerator import PickAndPlaceGenerator
+from .PluginLog import TraceRing
+from .PrintJournal import PrintJournal
+from .PositionTelemetry import PositionTelemetry
+from .PrintTimeEstimator import PrintTimeEstimator
 from .UltimusV import PressureUnits, UltimusV
 
 from UM.i18n import i18nCatalog
@@ -60,14 +63,83 @@ class FisnarOutputTracker:
         return True
 
 
+class PauseController:
+    # thread-safe pause/resume state for printing. Pause and resume can be requested from any
+    # thread, but they are only carried out by the thread that owns the serial port. A pause
+    # waits for the next segment boundary (every queued move has been executed), so it never
+    # cuts a segment short
+
+    RUNNING = 0
+    PAUSE_REQUESTED = 1
+    PAUSING = 2  # outputs off (and z lift) commands have been sent
+    PAUSED = 3
+    RESUME_REQUESTED = 4
+    RESUMING = 5  # z return and outputs on commands have been sent
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = PauseController.RUNNING
+        self._request_time = None
+        self.wake = Event()  # set when the serial thread should act on a request without waiting for the fisnar
+
+    def reset(self):
+        with self._lock:
+            self._state = PauseController.RUNNING
+            self._request_time = None
+            self.wake.clear()
+
+    def getState(self):
+        return self._state
+
+    def isPaused(self):
+        # True if a pause has been requested or the print is paused
+        return self._state in (PauseController.PAUSE_REQUESTED, PauseController.PAUSING, PauseController.PAUSED)
+
+    def requestPause(self):
+        with self._lock:
+            if self._state in (PauseController.RUNNING, PauseController.RESUMING):
+                self._state = PauseController.PAUSE_REQUESTED
+                self._request_time = time.perf_counter()
+            elif self._state == PauseController.RESUME_REQUESTED:  # resume hasn't started, so just cancel it
+                self._state = PauseController.PAUSED
+
+    def requestResume(self):
+        # returns True if the serial thread needs to be woken up (the fisnar is idle while paused)
+        with self._lock:
+            if self._state == PauseController.PAUSE_REQUESTED:  # pause hasn't started, so just cancel it
+                self._state = PauseController.RUNNING
+            elif self._state in (PauseController.PAUSING, PauseController.PAUSED):
+                was_idle = self._state == PauseController.PAUSED
+                self._state = PauseController.RESUME_REQUESTED
+                self._request_time = time.perf_counter()
+                self.wake.set()
+                return was_idle
+            return False
+
+    def transition(self, from_state, to_state):
+        # change state if the state is still from_state - returns whether the state was changed
+        with self._lock:
+            if self._state != from_state:
+                return False
+            self._state = to_state
+            return True
+
+    def getRequestLatency(self):
+        # time (sec) since the last pause or resume request
+        return time.perf_counter() - self._request_time if self._request_time is not None else 0.0
+
+
 class FisnarOutputDevice(PrinterOutputDevice):
     # class for printing with the Fisnar over RS232 port
 
-    def __init__(self):
-        super().__init__("fisnar_f5200n", ConnectionType.UsbConnection)
+    def __init__(self, device_id="fisnar_f5200n", name="Fisnar F5200N", dispenser_manager=None):
+        # device_id and name identify the robot when there are several in the fleet. Each robot
+        # has its own dispenser manager - if none is given, the extension's one is used and this
+        # is the primary robot (the one set up in the 'Define Setup' window)
+        super().__init__(device_id, ConnectionType.UsbConnection)
 
         # OutputDevice plugin UI stuff
-        self.setName("Fisnar F5200N")
+        self.setName(name)
         self.setShortDescription("Print Over RS232")
         self.setDescription("Print Over RS232")
         self.setIconName("print")
@@ -75,21 +147,32 @@ class FisnarOutputDevice(PrinterOutputDevice):
         # Fisnar command storage/tracking during printing
         self._printing_commands = []  # type: list[list[str, bytes]] (fisnar/dispenser mixed command format)
         self._current_index = 0
+        self._print_time_estimator = None  # type: PrintTimeEstimator
+        self._print_start_time = None  # type: float
 
         # Fisnar/dispenser command storage tracking for pick and place
         self._pick_place_commands = []  # type: list[tuple(str, bytes)]
         self._pick_place_index = 0
 
+        # journal of print progress, for resuming interrupted prints
+        self._journal = PrintJournal(os.path.join(Resources.getStoragePathForType(Resources.Resources), device_id + "_print_journal"))
+
         # for tracking printing state
         self._is_printing = False
-        self._is_paused = False
+        self._pause_controller = PauseController()
+        self._paused_outputs = []  # outputs that were on when the print was paused
+        self._pause_position = None  # fisnar position the print was paused at, if the z was lifted
         self._pick_place_in_progress = False
 
         # for segmenting
         self._va_register_count = 0
         self._outputs = FisnarOutputTracker()
 
-        self._command_queue = Queue()  # queue to hold commands to be sent
+        self._command_queue = Queue()  # queue to hold commands to be sent, as (command, time queued) tuples
+        self._priority_lane = deque()  # stop/emergency commands - these are sent before anything in the command queue
+        self._priority_in_flight = False  # whether a priority command has been sent and its confirmation hasn't been received yet
+        self._priority_wake = Event()  # set when priority commands have been queued, so the RS232 thread sends them without waiting for the fisnar
+        self._exit_pending = False  # whether cura is waiting for the fisnar to be finalized before exiting
         self._command_received = Event()  # event that is set when the Fisnar sends 'ok!' and cleared when waiting for an 'ok!' confirm from the Fisnar
 
         self._empty_byte_count = 0
@@ -109,9 +192,16 @@ class FisnarOutputDevice(PrinterOutputDevice):
         self._most_recent_position = [0.0, 0.0, 0.0]
         self._button_move_confirm_received = Event()
         self._button_move_confirms_received = 0
-        self._x_feedback_received = Event()
-        self._y_feedback_received = Event()
-        self._z_feedback_received = Event()
+        self._pending_feedback = deque()  # what each expected feedback value is for, in the order the queries were sent (0, 1, 2 for x, y, z or "confirm")
+        self._last_position_sample_time = 0.0  # for sampling position periodically while printing
+
+        # position telemetry - the UI is only updated by a timer, so the redraw rate doesn't depend on the sample rate
+        self._telemetry = PositionTelemetry()
+        self._telemetry_samples_shown = 0  # number of telemetry samples when the UI was last updated
+        self._ui_update_timer = QTimer()
+        self._ui_update_timer.setInterval(200)
+        self._ui_update_timer.timeout.connect(self._onUIUpdateTimer)
+        self._ui_update_timer.start()
 
         # for showing monitor while printing
         self._plugin_path = os.path.join(Resources.getStoragePath(Resources.Resources, "plugins", "FisnarRobotPlugin", "FisnarRobotPlugin"))
@@ -122,21 +212,27 @@ class FisnarOutputDevice(PrinterOutputDevice):
 
         # fre instance
         self._fre_instance = FisnarRobotExtension.getInstance()
-        self._dispenser_manager = self._fre_instance.getDispenserManager()
+        self._is_primary = dispenser_manager is None
+        self._dispenser_manager = self._fre_instance.getDispenserManager() if dispenser_manager is None else dispenser_manager
         self._dispenser_command_sent = Event()
 
+        # for profiling the RS232 link - check self._link_profiler.enabled before profiling, so profiling costs nothing when off
+        self._link_profiler = self._fre_instance.createLinkProfiler(device_id, name)
+        self._commands_sent = 0  # for sampling which commands are logged
+
+        # plugin logging and RS232 trace - check self._trace.enabled before tracing, so tracing costs nothing when off
+        self._log = self._fre_instance.getPluginLogger()
+        self._trace = self._fre_instance.getRS232TraceRing()
+
         # for checking if Fisnar is printing while trying to exit app
         CuraApplication.getInstance().getOnExitCallbackManager().addCallback(self._checkActivePritingOnAppExit)
+        self.stopCompleted.connect(self._onStopCompleted)
 
     def _checkActivePritingOnAppExit(self):
         # called when user tries to exit app - checks if Fisnar is trying to print
         application = CuraApplication.getInstance()
         if not (self._is_printing or self._pick_place_in_progress):  # not printing, so lose serial port and continue with exit checks
-            if self._connection_state == ConnectionState.Connected:
-                self.stopPrintingAndFinalize()  # print is already stopped but doesn't matter
-            self.close()
-            self._dispenser_manager.closeAll()
-            application.triggerNextExitCheck()
+            self._finalizeAndExit()
             return
 
         application.setConfirmExitDialogCallback(self._onConfirmExitDialogResult)
@@ -145,10 +241,27 @@ class FisnarOutputDevice(PrinterOutputDevice):
     def _onConfirmExitDialogResult(self, result):
         # triggers when user clicks cancel or confirm on the confirm exit dialog
         if result:
-            self.stopPrintingAndFinalize()
-            self.close()  # ensuring fisnar is finalized and port is closed when exiting app
-            self._dispenser_manager.closeAll()
-            CuraApplication.getInstance().triggerNextExitCheck()
+            self._finalizeAndExit()
+
+    def _finalizeAndExit(self):
+        # finalize the fisnar if it's connected, then close the serial ports and continue with the
+        # exit checks. This doesn't block - exiting continues when the stop completes, or after
+        # a timeout if the fisnar doesn't respond
+        self._exit_pending = True
+        if self._connection_state != ConnectionState.Connected:
+            self._onStopCompleted()
+            return
+        QTimer.singleShot(3000, self._onStopCompleted)
+        self.stopPrintingAndFinalize()
+
+    def _onStopCompleted(self):
+        # called when the priority lane is done (or has timed out) - continues exiting if cura is waiting for it
+        if not self._exit_pending:
+            return
+        self._exit_pending = False
+        self.close()  # ensuring fisnar is finalized and port is closed when exiting app
+        self._dispenser_manager.closeAll()
+        CuraApplication.getInstance().triggerNextExitCheck()
 
     def setConnectionState(self, connection_state):
         # method to set the connection state - needs to override the base method in PrinterOutputDevice so that
@@ -156,7 +269,9 @@ class FisnarOutputDevice(PrinterOutputDevice):
 
         if self.connectionState != connection_state:
             self._connection_state = connection_state
-            self._fre_instance.setFisnarConnectionState(self._connection_state == ConnectionState.Connected)
+            if self._is_primary:
+                self._fre_instance.setFisnarConnectionState(self._connection_state == ConnectionState.Connected)
+            self.fisnarPortNameUpdated.emit()
             application = CuraApplication.getInstance()
             if application is not None:  # Might happen during the closing of Cura or in a test.
                 global_stack = application.getGlobalContainerStack()
@@ -167,6 +282,7 @@ class FisnarOutputDevice(PrinterOutputDevice):
     def requestWrite(self, nodes, file_name=None, limit_mimetypes=False, file_handler=None, filter_by_machine=False, **kwargs):
         # called when 'Print Over RS232' button is pressed - all parameters are ignored.
         # generates fisnar commands and gives csv string to _printFisnarCommands()
+        from .Converter import Converter  # the conversion stack is only imported when it's first needed
 
         if self._is_printing:  # show message if the fisnar is already printing
             printing_msg = Message(text = catalog.i18nc("@message", "The Fisnar is currently printing. Another print cannot begin until the current one completes."),
@@ -191,7 +307,8 @@ class FisnarOutputDevice(PrinterOutputDevice):
             necessary_outputs = Converter.getOutputsInFisnarCommands(Converter.readFisnarCommandsFromCSV(fisnar_command_csv_io.getvalue()))
             for i in range(4):  # ensure necessray dispensers are connected
                 if necessary_outputs[i]:
-                    if not self._dispenser_manager.getDispenser("dispenser_" + str(i + 1)).isConnected():
+                    dispenser = self._dispenser_manager.getDispenser("dispenser_" + str(i + 1))
+                    if dispenser is None or not dispenser.isConnected():
                         printing_msg = Message(text = catalog.i18nc("@message", f"Dispenser {i + 1} is not yet connected. Ensure the proper serial port name has been entered under 'Fisnar Actions' -> 'Define Setup' and that the dispenser is on."),
                                                title = catalog.i18nc("@message", "Dispenser Not Connected"))
                         printing_msg.show()
@@ -206,33 +323,77 @@ class FisnarOutputDevice(PrinterOutputDevice):
 
     def _printFisnarCommands(self, fisnar_command_csv):
         # start a print based on a fisnar command csv
-
-        # updating fisnar command bytes from fisnar_command_csv
+        from .Converter import Converter
         commands = Converter.readFisnarCommandsFromCSV(fisnar_command_csv)
-        self._printing_commands.clear()
-        self._printing_commands = Converter.fisnarCommandsToBytes(commands, self._fre_instance.continuous_extrusion)
+        self.printProgram(Converter.fisnarCommandsToBytes(commands, self._fre_instance.continuous_extrusion))
+
+    def printProgram(self, command_bytes, print_time_estimator=None):
+        # start a print of a compiled program (list or tuple of command bytes, as returned by
+        # Converter.fisnarCommandsToBytes()). The program is only read, so it can be shared
+        # between robots, along with its print time estimator (which is made if not given)
+        self._printing_commands = command_bytes
 
         self._current_index = 0  # resetting command index
+        self._print_time_estimator = PrintTimeEstimator(self._printing_commands) if print_time_estimator is None else print_time_estimator
+        self._print_start_time = time.time()
+        self._telemetry.clear()
+        self._journal.begin(self._printing_commands)
+        Logger.log("i", f"estimated print time: {round(self._print_time_estimator.getTotalTime())} sec")
+        Logger.log("i", "estimated layer times (fisnar z: sec): " + ", ".join(f"{z:g}: {round(layer_time)}" for z, layer_time in self._print_time_estimator.getLayerTimes()))
 
         # print status stuff
         self.setPrintingState(True)
-        self._is_paused = False
+        self._pause_controller.reset()
 
         for i in range(2):
             self._sendNextFisnarLine()  # push the first command to start the ok loop
 
+    @staticmethod
+    def getProgramOutputs(command_bytes):
+        # get the sorted list of output numbers used in a compiled program
+        return sorted(set(int(chr(command[3])) for command in command_bytes if command[:3] == b"OU "))
+
+    def getPrintStatus(self):
+        # get the print state of this fisnar as a dictionary, for monitoring several robots
+        return {
+            "name": self.getName(),
+            "connected": self._connection_state == ConnectionState.Connected,
+            "printing": self._is_printing,
+            "paused": self._pause_controller.getState() == PauseController.PAUSED,
+            "progress": self._getPrintingProgress(),
+            "remaining_time": self._getRemainingPrintTime()
+        }
+
+    def isIdle(self):
+        # True if the fisnar is connected, not printing or doing a pick and place, and done with any stop commands
+        if self._connection_state != ConnectionState.Connected or self._is_printing or self._pick_place_in_progress:
+            return False
+        return not self._priority_in_flight and len(self._priority_lane) == 0
+
+    def canPrint(self, command_bytes):
+        # True if the fisnar is idle and every dispenser the compiled program uses is connected
+        if not self.isIdle():
+            return False
+        for output in FisnarOutputDevice.getProgramOutputs(command_bytes):
+            dispenser = self._dispenser_manager.getDispenser("dispenser_" + str(output))
+            if dispenser is None or not dispenser.isConnected():
+                return False
+        return True
+
+    def getDispenserManager(self):
+        return self._dispenser_manager
+
     def stopPrintingAndFinalize(self):
-        # stop printing and finalize the Fisnar
+        # stop printing and finalize the Fisnar. stopCompleted is emitted once the finalizer is sent
         self.setPrintingState(False)  # ensure not printing
 
-        self._sendCommand(FisnarCommands.HM())
-        self.sendCommand(FisnarCommands.finalizer())
+        self.sendPriorityCommand(FisnarCommands.HM())
+        self.sendPriorityCommand(FisnarCommands.finalizer())
 
-        while not self._command_queue.empty():
-            time.sleep(1)
-
-    def connect(self, serial_name):
-        # try to establish serial connection and store Serial object. called whenever a print is started
+    def connect(self, serial_name, timeout=5.0, cancel=None):
+        # try to establish serial connection and store Serial object. The fisnar has timeout sec
+        # to respond to the initializer, and the attempt is given up early if the cancel event
+        # (optional) is set
         Logger.log("i", "Attempting to connect to Fisnar...")
         self._fisnar_serial_port_name = serial_name
 
@@ -254,21 +415,35 @@ class FisnarOutputDevice(PrinterOutputDevice):
                 return
 
         # if not returned, the serial port is connected to the fisnar, but it may not be on yet.
+        self._clearCommandQueues()  # stop/motion commands queued when the link dropped mustn't replay into the new connection
         self.setConnectionState(ConnectionState.Connecting)
         self._sendCommand(FisnarCommands.initializer())
         self._init_connect_send_time = time.time()
-        while time.time() - self._init_connect_send_time < 5.0:  # 5 sec timeout to get initialization response
+        self._serial.timeout = 0.25  # short reads, so the timeout and cancel event are checked often
+        received = bytes()
+        while time.time() - self._init_connect_send_time < timeout:  # timeout to get initialization response
+            if cancel is not None and cancel.is_set():
+                Logger.log("i", "Fisnar connection attempt cancelled")
+                break
             try:
-                curr_line = self._serial.readline()
+                received += self._serial.readline()
             except:
                 continue
+            if not received.endswith(b"\n"):  # nothing or only part of a line received yet
+                continue
+            curr_line = received
+            received = bytes()
 
             if curr_line == FisnarCommands.expectedReturn(FisnarCommands.initializer()):  # succesfully connected
+                self._serial.timeout = self._timeout
                 self._command_received.set()  # not expecting a command anymore
+                self._journal.clearInFlight()  # the initializer's response has been read here
+                self._link_profiler.clearInFlight()
                 Logger.log("i", "Fisnar connection successful.")
                 self.setConnectionState(ConnectionState.Connected)
                 self._update_thread.start()
                 self.home()
+                self._offerResume()
                 return
 
         self._sendCommand(FisnarCommands.finalizer())  # in case couldn't connect because already initialized
@@ -284,42 +459,74 @@ class FisnarOutputDevice(PrinterOutputDevice):
         if self._serial is not None:
             self._serial.close()
         self._serial = None
+        self._pending_feedback.clear()  # any outstanding feedback is lost
+        self._journal.clearInFlight()  # and so are the 'ok!'s of any commands in flight
+        self._link_profiler.clearInFlight()
+        self._clearCommandQueues()
 
         self._update_thread = Thread(target=self._update, daemon=True, name="FisnarRobotPlugin RS232 Control")
 
+    def _clearCommandQueues(self):
+        # drop every command waiting to be sent, so nothing queued for a closed connection is sent after reconnecting
+        with self._command_queue.mutex:
+            self._command_queue.queue.clear()
+        self._priority_lane.clear()
+        self._priority_in_flight = False
+        self._priority_wake.clear()
+
     def _update(self):
         # this continually runs while connected to device, reading lines and
         # sending fisnar commands if necessary
         while self._connection_state == ConnectionState.Connected and self._serial is not None:
-            if not self._dispenser_command_sent.is_set():
+            if not (self._dispenser_command_sent.is_set() or self._pause_controller.wake.is_set() or self._priority_wake.is_set()):
                 try:
+                    readline_start = time.perf_counter()
                     curr_line = self._serial.readline()
+                    if self._link_profiler.enabled:
+                        self._link_profiler.record("readline_idle", time.perf_counter() - readline_start)
                 except:
                     continue
+                if self._trace.enabled and len(curr_line) > 0:
+                    self._trace.add(TraceRing.RECEIVE, curr_line)
             else:
                 curr_line = b""
 
-            if self._dispenser_command_sent.is_set() or curr_line.startswith(b"ok!"):
+            if self._dispenser_command_sent.is_set() or self._pause_controller.wake.is_set() or self._priority_wake.is_set() or curr_line.startswith(b"ok!"):
 
                 if self._dispenser_command_sent.is_set():
                     self._dispenser_command_sent.clear()
+                elif not curr_line.startswith(b"ok!"):  # woken up to act on a pause, resume or stop request
+                    self._pause_controller.wake.clear()
+                    self._priority_wake.clear()
+                    if not self._command_received.is_set():
+                        continue  # a command is in flight, so its ok! will continue the print
                 elif curr_line.startswith(b"ok!"):
+                    if self._link_profiler.enabled:
+                        self._link_profiler.okReceived()
                     self._empty_byte_count = 0
                     self._command_received.set()
+                    self._journal.okReceived()  # acknowledges the oldest command in flight
 
                     if not self._button_move_confirm_received.is_set():  # need to update position
                         self._button_move_confirms_received += 1
                         if self._button_move_confirms_received == 2:
                             self._button_move_confirms_received = 0
                             self._button_move_confirm_received.set()
-                            self._x_feedback_received.clear()  # this will trigger the PX->PY->PZ 'cascade'
-                            self.sendCommand(FisnarCommands.PX())
-
-                if not self._command_queue.empty():
-                    self._sendCommand(self._command_queue.get())
+                            self.requestPosition()
+
+                if self._priority_in_flight and len(self._priority_lane) == 0:  # last priority command confirmed
+                    self._priority_in_flight = False
+                    self.stopCompleted.emit()
+
+                if len(self._priority_lane) > 0:
+                    self._sendNextPriorityCommand()
+                elif not self._command_queue.empty():
+                    command, queue_time = self._command_queue.get()
+                    if self._link_profiler.enabled:
+                        self._link_profiler.record("queue_wait", time.perf_counter() - queue_time)
+                    self._sendCommand(command)
                 elif self._is_printing:  # still printing but queue is empty
-                    if not self._is_paused:
-                        self._sendNextFisnarLine()
+                    self._continuePrint()
                 elif self._pick_place_in_progress:
                     self._sendNextPickPlaceCommand()
 
@@ -328,6 +535,7 @@ class FisnarOutputDevice(PrinterOutputDevice):
                     self._empty_byte_count += 1
                     if self._empty_byte_count >= 5:  # send connect confirmation command and wait for return bytes
                         Logger.log("i", "fisnar may be unresponsive, will attempt to confirm connection status")
+                        self._pending_feedback.append("confirm")
                         self.sendCommand(FisnarCommands.PX())
                         self._connect_confirm_send_time = time.time()
                         self._connect_confirm_received.clear()
@@ -335,6 +543,8 @@ class FisnarOutputDevice(PrinterOutputDevice):
                 else:  # trying to confirm
                     if time.time() - self._connect_confirm_send_time > 5.0:  # 10 sec since sending confirm command
                         Logger.log("w", "fisnar unresponsive, will disconnect and attempt to reconnect")
+                        if self._trace.enabled:
+                            self._log.log("w", "last RS232 traffic before disconnecting:\n%s", "\n".join(TraceRing.formatEntry(entry) for entry in self._trace.getEntries()[-20:]))
                         self._connect_confirm_received.set()  # reset in case it reconnects and begins checking again
                         msg = Message(text = catalog.i18nc("@message", "Fisnar F5200N is unresponsive, will attempt to regain connection..."),
                                       title = catalog.i18nc("@message", "Unresponsive Peripheral"))
@@ -343,56 +553,117 @@ class FisnarOutputDevice(PrinterOutputDevice):
             elif FisnarCommands.isFeedback(curr_line):  # check if value was received
                 self._empty_byte_count = 0
                 # Logger.log("d", str(curr_line))
-                if not self._connect_confirm_received.is_set():  # PX() sent to confirm connection status
+                if not self._connect_confirm_received.is_set():  # any feedback confirms the connection status
                     Logger.log("i", "Fisnar connection status confirmed")
                     self._connect_confirm_received.set()  # connection status confirmed
-                elif not self._x_feedback_received.is_set():  # value is x position
-                    self._most_recent_position[0] = float(curr_line[:-2]) if float(curr_line[:-2]) > 0.0 else 0.0  # this is to fix slightly negative reporting bug
-                    # Logger.log("d", "fisnar x updated: " + str(self._most_recent_position[0]))
-                    self._x_feedback_received.set()
-                    self.xPosUpdated.emit()
-                    self._y_feedback_received.clear()
-                    self.sendCommand(FisnarCommands.PY())
-                elif not self._y_feedback_received.is_set():  # value is y position
-                    self._most_recent_position[1] = float(curr_line[:-2]) if float(curr_line[:-2]) > 0.0 else 0.0
-                    # Logger.log("d", "fisnar y updated: " + str(self._most_recent_position[1]))
-                    self._y_feedback_received.set()
-                    self.yPosUpdated.emit()
-                    self._z_feedback_received.clear()
-                    self.sendCommand(FisnarCommands.PZ())
-                elif not self._z_feedback_received.is_set():  # value is z position
-                    self._most_recent_position[2] = float(curr_line[:-2]) if float(curr_line[:-2]) > 0.0 else 0.0
-                    # Logger.log("d", "fisnar z updated: " + str(self._most_recent_position[2]))
-                    self._z_feedback_received.set()
-                    self.zPosUpdated.emit()
-
-        if self._is_printing:  # connection broken
-            self.terminatePrint()
+
+                # feedback values come back in the order the queries were sent
+                feedback_type = self._pending_feedback.popleft() if len(self._pending_feedback) > 0 else None
+                if feedback_type in (0, 1, 2):
+                    value = float(curr_line[:-2])
+                    self._most_recent_position[feedback_type] = value if value > 0.0 else 0.0  # this is to fix slightly negative reporting bug
+                    if feedback_type == 2:  # full position received
+                        self._telemetry.addSample(self._most_recent_position, self._current_index, [self._outputs.getOutput(i) for i in range(1, 5)])
+
+        if self._is_printing:  # connection broken - keep the journal so the print can be resumed
+            Logger.log("w", "Fisnar connection lost while printing, print can be resumed after reconnecting")
+            self._journal.interrupt()
+            self._turnOutputsOff()
+            self._stopPrint()
+
+    def _onUIUpdateTimer(self):
+        # update the position shown in the UI if there are new telemetry samples
+        if self._telemetry.getNumSamples() != self._telemetry_samples_shown:
+            self._telemetry_samples_shown = self._telemetry.getNumSamples()
+            self.positionUpdated.emit()
+
+    def getTelemetry(self):
+        return self._telemetry
+
+    def requestPosition(self):
+        # query the x, y, and z position of the fisnar. The three queries are queued back
+        # to back, and the replies are matched to axes by the order they come back in
+        if any(feedback_type in (0, 1, 2) for feedback_type in self._pending_feedback):
+            return  # a position request is already in progress
+        self._last_position_sample_time = time.time()
+        self._pending_feedback.extend((0, 1, 2))
+        for command in FisnarCommands.feedbackCommands():
+            self.sendCommand(command)
+
+    def _positionSampleDue(self):
+        # determine if the position should be sampled while printing, based on the
+        # position sample rate (Hz) set in the extension. A rate of 0 disables sampling
+        sample_rate = self._fre_instance.position_sample_rate
+        if not sample_rate or sample_rate <= 0.0:
+            return False
+        return time.time() - self._last_position_sample_time >= 1.0 / sample_rate
 
     def sendCommand(self, command):
         # command: fisnar command as bytes
         # send a fisar command (or put into command queue if waiting for Fisnar command confirmation)
         if not self._command_received.is_set():  # if waiting for confirmation (ok! hasn't been received yet)
-            self._command_queue.put(command)
+            self._command_queue.put((command, time.perf_counter()))
         else:
             self._sendCommand(command)
 
-    def _sendCommand(self, command):
+    stopCompleted = pyqtSignal()  # emitted when every command in the priority lane has been confirmed
+
+    def sendPriorityCommand(self, command):
+        # command: fisnar command as bytes
+        # send a stop, pause or emergency command ahead of any queued commands - it is sent as soon as
+        # the fisnar confirms the command it is currently executing. stopCompleted is emitted when
+        # the priority lane has been drained. Nothing is queued if the port is closed. This can be
+        # called from any thread - the command is only queued here, and the RS232 thread (which
+        # owns the port and the rest of the priority lane state) is woken up to send it
+        if self._serial is None:
+            return
+        self._priority_lane.append(command)
+        self._priority_wake.set()
+        if self._command_received.is_set():  # fisnar is idle, so stop waiting on readline() (otherwise the next 'ok!' wakes the RS232 thread)
+            try:
+                self._serial.cancel_read()
+            except (AttributeError, SerialException):
+                pass  # the command will be sent when readline() times out
+
+    def _sendNextPriorityCommand(self):
+        # send the next command in the priority lane - only called from the RS232 thread. Commands
+        # that don't get a response (the finalizer) are sent back to back with the next one
+        while len(self._priority_lane) > 0:
+            self._priority_in_flight = True
+            self._sendCommand(self._priority_lane.popleft())
+            if not self._command_received.is_set() or self._dispenser_command_sent.is_set():
+                return  # wait for the response
+        self._priority_in_flight = False
+        self.stopCompleted.emit()
+
+    def _sendCommand(self, command, program_index=None):
         # given a fisnar command as a byte array, send it to the fisnar.
         # this function doesn't check for anything besides Serial Exceptions.
         # this functio also clears the command recieved event, so this should
-        # only be called if there are no expected confirmation responses
+        # only be called if there are no expected confirmation responses.
+        # program_index is the index of the command in the program being printed, if it's part of
+        # it - the journal acknowledges it when its 'ok!' is received
 
         if self._serial is None or self._connection_state not in (ConnectionState.Connected, ConnectionState.Connecting):  # both connecting and connected mean the port is open
             return
 
-        Logger.log("d", "command sent: " + str(command))
+        if self._trace.enabled:
+            self._trace.add(TraceRing.SEND, command)
+        if self._log.debug_enabled and self._fre_instance.command_log_sample_interval > 0:  # per-command logging is slow, so only log a sample of commands
+            self._commands_sent += 1
+            if self._commands_sent % self._fre_instance.command_log_sample_interval == 0:
+                self._log.log("d", "command sent: %s", command)
+
         if len(command) > 2 and command[:2] == bytes("OU", "ascii"):  # is an output command - assumes format 'OU n, s'
             if self._outputs.getOutput(int(chr(command[3]))) != (int(chr(command[6])) == 1):  # if change in output state
                 self._outputs.setOutput(int(chr(command[3])), int(chr(command[6])) == 1)
-                dispenser_name = "dispenser_" + str(chr(command[3]))
-                self._dispenser_manager.busy = True
-                self._dispenser_manager.getDispenser(dispenser_name).sendCommand(UltimusV.dispenseToggle())  # TODO: handle potential errors here
+                dispenser = self._dispenser_manager.getDispenser("dispenser_" + str(chr(command[3])))
+                if dispenser is not None:  # outputs without a dispenser are only tracked
+                    self._dispenser_manager.busy = True
+                    toggle_start = time.perf_counter()
+                    dispenser.sendCommand(UltimusV.dispenseToggle())  # TODO: handle potential errors here
+                    if self._link_profiler.enabled:
+                        self._link_profiler.record("dispenser_toggle", time.perf_counter() - toggle_start)
             self._dispenser_command_sent.set()
             return
 
@@ -401,6 +672,10 @@ class FisnarOutputDevice(PrinterOutputDevice):
             if command != FisnarCommands.finalizer():  # finalizer has no response, so don't set flag to wait for one
                 self._command_received.clear()
             self._serial.write(command)
+            if command != FisnarCommands.finalizer():
+                self._journal.commandSent(program_index)
+                if self._link_profiler.enabled:
+                    self._link_profiler.commandSent(command)
             # Logger.log("d", f"bytes written: {command}")
         except SerialTimeoutException:
             self._command_received.set()
@@ -409,26 +684,98 @@ class FisnarOutputDevice(PrinterOutputDevice):
             self.setConnectionState(ConnectionState.Error)
             Logger.log("w", "Unexpected serial error occured when trying to send bytes: " + str(command))
 
+    def _continuePrint(self):
+        # called from the serial thread when the fisnar is ready for the next print command -
+        # carries out pause and resume requests, otherwise sends the next command
+        state = self._pause_controller.getState()
+        if state == PauseController.PAUSE_REQUESTED:
+            if self._atSegmentBoundary() and self._pause_controller.transition(PauseController.PAUSE_REQUESTED, PauseController.PAUSING):
+                self._sendCommandSequence(self._getPauseCommands())
+                return
+        elif state == PauseController.PAUSING:  # pause commands have been confirmed
+            if self._pause_controller.transition(PauseController.PAUSING, PauseController.PAUSED):
+                if self._link_profiler.enabled:
+                    self._link_profiler.record("pause_latency", self._pause_controller.getRequestLatency())
+                Logger.log("i", f"Fisnar serial print paused at command {self._current_index} ({1000 * self._pause_controller.getRequestLatency():.1f} ms after request)")
+            return
+        elif state == PauseController.PAUSED:
+            return
+        elif state == PauseController.RESUME_REQUESTED:
+            if self._pause_controller.transition(PauseController.RESUME_REQUESTED, PauseController.RESUMING):
+                self._sendCommandSequence(self._getResumeCommands())
+                return
+        elif state == PauseController.RESUMING:  # resume commands have been confirmed
+            if self._pause_controller.transition(PauseController.RESUMING, PauseController.RUNNING):
+                if self._link_profiler.enabled:
+                    self._link_profiler.record("resume_latency", self._pause_controller.getRequestLatency())
+                Logger.log("i", f"Fisnar serial print resumed ({1000 * self._pause_controller.getRequestLatency():.1f} ms after request)")
+
+        if self._positionSampleDue():
+            self.requestPosition()
+        else:
+            self._sendNextFisnarLine()
+
+    def _atSegmentBoundary(self):
+        # True if every move sent so far has been executed (the last command sent was an ID)
+        return self._current_index == 0 or self._printing_commands[self._current_index - 1] == FisnarCommands.ID()
+
+    def _getPauseCommands(self):
+        # get the commands to pause at the current segment boundary - outputs off, then lift
+        # the z by the pause z lift set in the extension (if any)
+        self._paused_outputs = [output for output in range(1, 5) if self._outputs.getOutput(output)]
+        commands = [FisnarCommands.OU(output, 0) for output in self._paused_outputs]
+
+        self._pause_position = None
+        z_lift = self._fre_instance.pause_z_lift
+        if z_lift > 0.0:
+            for i in range(self._current_index - 1, -1, -1):  # find the current position
+                if self._printing_commands[i][:3] == b"VA ":
+                    self._pause_position = [float(coord) for coord in self._printing_commands[i][3:-1].split(b",")]
+                    break
+        if self._pause_position is not None:  # fisnar z is inverted, so lifting is towards 0
+            commands.append(FisnarCommands.VA(self._pause_position[0], self._pause_position[1], max(self._pause_position[2] - z_lift, 0.0)))
+            commands.append(FisnarCommands.ID())
+        return commands
+
+    def _getResumeCommands(self):
+        # get the commands to undo the pause commands - return to the pause position, then turn the outputs back on
+        commands = []
+        if self._pause_position is not None:
+            commands.append(FisnarCommands.VA(*self._pause_position))
+            commands.append(FisnarCommands.ID())
+        commands += [FisnarCommands.OU(output, 1) for output in self._paused_outputs]
+        return commands
+
+    def _sendCommandSequence(self, commands):
+        # send the first command and queue the rest. If there are no commands, the print is
+        # continued straight away (so an empty pause or resume completes immediately)
+        if len(commands) == 0:
+            self._continuePrint()
+            return
+        for command in commands[1:]:
+            self._command_queue.put((command, time.perf_counter()))
+        self._sendCommand(commands[0])
+
     def _sendNextFisnarLine(self):
         try:
             command_bytes = self._printing_commands[self._current_index]
         except IndexError:  # done printing!
             Logger.log("i", "Fisnar done with print.")
-
-            # stop printing
-            self.setPrintingState(False)
-            self._is_paused = False
+            self._journal.finish()
 
             # clean things up
+            self._pause_controller.reset()
             self._sendCommand(FisnarCommands.OU(1, 0))
             self._sendCommand(FisnarCommands.OU(2, 0))
             self._sendCommand(FisnarCommands.HM())
 
-            # reset to prep for another print
+            # reset to prep for another print, then stop printing - this is on the RS232 thread, and
+            # the state change is emitted last so nothing connected to it sees a half torn down print
             self._resetPrintingInternalState()
+            self.setPrintingState(False)
             return
 
-        self._sendCommand(command_bytes)  # send bytes
+        self._sendCommand(command_bytes, self._current_index)  # send bytes
 
         self._current_index += 1  # update current index
         self.printProgressUpdated.emit()  # recalculate progress and update QML
@@ -491,12 +838,24 @@ class FisnarOutputDevice(PrinterOutputDevice):
 
             self.pickPlaceStatusUpdated.emit()
 
+    def _turnOutputsOff(self):
+        # turn off the dispensers of every output that is on, and reset the tracked output state.
+        # For when the fisnar link is lost - the dispensers have their own serial ports, so they
+        # are toggled off directly, and a resumed print then turns them back on from a known state
+        for output in range(1, 5):
+            if self._outputs.getOutput(output):
+                dispenser = self._dispenser_manager.getDispenser("dispenser_" + str(output))
+                if dispenser is not None and dispenser.isConnected():
+                    dispenser.sendCommand(UltimusV.dispenseToggle())
+        self._outputs = FisnarOutputTracker()
+
     def _resetPrintingInternalState(self):
         # resets internal printing state - called after user terminates print
-        # or after print is finished. Assumes self._is_printing has already
-        # been set to false
-        self._printing_commands.clear()
+        # or after print is finished
+        self._printing_commands = []  # not cleared in place, the program list may be shared
         self._current_index = 0
+        self._print_time_estimator = None
+        self._print_start_time = None
         self.printProgressUpdated.emit()  # reset UI
 
     def _resetPickAndPlaceInternalState(self):
@@ -506,10 +865,21 @@ class FisnarOutputDevice(PrinterOutputDevice):
         self._pick_place_index = 0
 
     def _getPrintingProgress(self):
-        try:
-            return self._current_index / len(self._printing_commands)
-        except ZeroDivisionError:
+        # get the time-weighted progress of the current print (0 to 1)
+        if self._print_time_estimator is None:
             return None  # print hasn't started yet
+        return self._print_time_estimator.getProgress(self._current_index)
+
+    def _getRemainingPrintTime(self):
+        # get the estimated time remaining in the current print in seconds. The kinematic
+        # estimate is scaled by how the actual elapsed time compares to the estimated elapsed time
+        if self._print_time_estimator is None:
+            return None
+        remaining_time = self._print_time_estimator.getRemainingTime(self._current_index)
+        estimated_elapsed = self._print_time_estimator.getElapsedTime(self._current_index)
+        if self._print_start_time is not None and estimated_elapsed > 0.01 * self._print_time_estimator.getTotalTime():
+            remaining_time *= (time.time() - self._print_start_time) / estimated_elapsed
+        return remaining_time
 
     @pyqtSlot(str)
     def sendRawCommand(self, command_str):
@@ -520,6 +890,7 @@ class FisnarOutputDevice(PrinterOutputDevice):
     @pyqtSlot()
     def executePickPlace(self):
         # start pick and place procedure
+        from .PickAndPlaceGenerator import PickAndPlaceGenerator
 
         # TODO: ensure parameters and connections are such that pick and place can be done
         if not self._dispenser_manager.getPickPlaceDispenser().isConnected():  # if dispenser not connected
@@ -598,28 +969,99 @@ class FisnarOutputDevice(PrinterOutputDevice):
 
     @pyqtSlot()
     def pauseOrResumePrint(self):
-        Logger.log("i", "Fisnar serial print has been " + ("resumed" if self._is_paused else "paused"))
-        self._is_paused = not self._is_paused  # flips whether print is paused or not
-        if not self._is_paused:  # if being resumed, send the next command to restart the ok! loop
-            self._sendNextFisnarLine()
+        # request a pause or resume - these are carried out by the serial thread, see PauseController
+        if self._pause_controller.isPaused():
+            Logger.log("i", "Fisnar serial print resume requested")
+            if self._pause_controller.requestResume() and self._serial is not None:  # fisnar is idle, so stop waiting on readline()
+                try:
+                    self._serial.cancel_read()
+                except (AttributeError, SerialException):
+                    pass  # the request will be acted on when readline() times out
+        else:
+            Logger.log("i", "Fisnar serial print pause requested - will pause at the next segment boundary")
+            self._pause_controller.requestPause()
 
     @pyqtSlot()
     def terminatePrint(self):
         # called when the user presses the 'Terminate' button. this stops
         # sending commands and homes the Fisnar
         Logger.log("i", "Fisnar serial print has been terminated.")
+        self._journal.finish()  # terminated by the user, so it shouldn't be resumed
+        self._stopPrint()
 
-        # this combination of states signals that no print has started or a print has been terminated
+    def _stopPrint(self):
+        # stop sending print commands, turn the outputs off and home the fisnar
+
+        # this combination of states signals that no print has started or a print has been terminated.
+        # This is set first so the RS232 thread stops sending the print - the fleet only dispatches
+        # a new job to this fisnar later, once the stop commands below have been confirmed
         self.setPrintingState(False)
-        self._is_paused = False
+        self._pause_controller.reset()
 
-        # # ensure outputs are off, then home
-        self.sendCommand(FisnarCommands.OU(1, 0))
-        self.sendCommand(FisnarCommands.OU(2, 0))
-        self.sendCommand(FisnarCommands.HM())
+        # ensure outputs are off, then home - these jump ahead of any queued commands
+        self.sendPriorityCommand(FisnarCommands.OU(1, 0))
+        self.sendPriorityCommand(FisnarCommands.OU(2, 0))
+        self.sendPriorityCommand(FisnarCommands.HM())
 
         self._resetPrintingInternalState()  # resets fisnar commands, current command index
 
+    def _offerResume(self):
+        # if the journal has an interrupted print, ask the user if it should be resumed
+        if self._is_printing or self._journal.getInterruptedPrint() is None:
+            return
+        msg = Message(text = catalog.i18nc("@message", "A Fisnar print was interrupted before it finished. It can be resumed from the last extrusion segment boundary the Fisnar completed."),
+                      title = catalog.i18nc("@message", "Resume Interrupted Print"))
+        msg.addAction("resume", catalog.i18nc("@action", "Resume"), "", "")
+        msg.addAction("discard", catalog.i18nc("@action", "Discard"), "", "")
+        msg.actionTriggered.connect(self._onResumeMessageAction)
+        msg.show()
+
+    def _onResumeMessageAction(self, msg, action):
+        msg.hide()
+        if action == "resume":
+            self.resumeInterruptedPrint()
+        elif action == "discard":
+            self._journal.discard()
+
+    @pyqtSlot()
+    def resumeInterruptedPrint(self):
+        # resume the print recorded in the journal at the last safe extrusion segment boundary,
+        # using the saved program so nothing is recompiled
+        if self._is_printing or self._pick_place_in_progress or self._connection_state != ConnectionState.Connected:
+            return
+        interrupted_print = self._journal.getInterruptedPrint()
+        if interrupted_print is None:
+            return
+        command_bytes, last_ack = interrupted_print
+
+        for output in FisnarOutputDevice.getProgramOutputs(command_bytes):  # ensure necessary dispensers are connected
+            dispenser = self._dispenser_manager.getDispenser("dispenser_" + str(output))
+            if dispenser is None or not dispenser.isConnected():
+                msg = Message(text = catalog.i18nc("@message", f"Dispenser {output} is not yet connected, so the print can't be resumed yet."),
+                              title = catalog.i18nc("@message", "Dispenser Not Connected"))
+                msg.show()
+                return
+
+        resume_index, restore_commands = PrintJournal.getResumePoint(command_bytes, last_ack)
+        Logger.log("i", f"resuming interrupted print at command {resume_index} of {len(command_bytes)} (last acknowledged: {last_ack})")
+
+        self._printing_commands = command_bytes
+        self._current_index = resume_index
+        self._print_time_estimator = PrintTimeEstimator(self._printing_commands)
+        self._print_start_time = time.time() - self._print_time_estimator.getElapsedTime(resume_index)
+        self._telemetry.clear()
+        self._journal.begin(self._printing_commands, resume_index)
+        self._turnOutputsOff()  # the restore commands turn the outputs that should be on back on
+
+        self.setPrintingState(True)
+        self._pause_controller.reset()
+
+        # restore the state at the resume index - the first of these (line speed or move) starts the ok loop
+        for command in restore_commands:
+            self.sendCommand(command)
+        if len(restore_commands) == 0:
+            self._sendNextFisnarLine()
+
     @pyqtSlot()
     def terminatePickPlace(self):
         # terminate the pick and place procedure
@@ -628,7 +1070,7 @@ class FisnarOutputDevice(PrinterOutputDevice):
         self.setPickPlaceStatus(False)
         self._resetPickAndPlaceInternalState()
 
-        self.sendCommand(FisnarCommands.HM())
+        self.sendPriorityCommand(FisnarCommands.HM())
         self._dispenser_manager.getPickPlaceDispenser().sendCommand(UltimusV.setVacuum(0, PressureUnits.V_KPA))
 
     @pyqtSlot(str, result=str)
@@ -797,28 +1239,32 @@ class FisnarOutputDevice(PrinterOutputDevice):
 
 # ----------------------------------------------------------------------
 
-    xPosUpdated = pyqtSignal()
-    @pyqtProperty(str, notify=xPosUpdated)
+    positionUpdated = pyqtSignal()
+    @pyqtProperty(str, notify=positionUpdated)
     def x_pos(self):
         return str(round(self._most_recent_position[0], 3))
 
-    yPosUpdated = pyqtSignal()
-    @pyqtProperty(str, notify=yPosUpdated)
+    @pyqtProperty(str, notify=positionUpdated)
     def y_pos(self):
         return str(round(self._most_recent_position[1], 3))
 
-    zPosUpdated = pyqtSignal()
-    @pyqtProperty(str, notify=zPosUpdated)
+    @pyqtProperty(str, notify=positionUpdated)
     def z_pos(self):
         return str(round(self._most_recent_position[2], 3))
 
+    @pyqtProperty("QVariantList", notify=positionUpdated)
+    def position_history(self):
+        # decimated [x, y, z] position history of the current print for the monitor
+        samples = self._telemetry.getHistory(500)
+        return [[float(sample["x"]), float(sample["y"]), float(sample["z"])] for sample in samples]
+
     fisnarPortNameUpdated = pyqtSignal()
     @pyqtProperty(str, notify=fisnarPortNameUpdated)
     def fisnar_serial_port(self):
         if not self._connection_state == ConnectionState.Connected:
             return "Not connected..."
         else:
-            return str(self._fre_instance.com_port)
+            return str(self._fisnar_serial_port_name)
 
     pickPlaceStatusUpdated = pyqtSignal()
     @pyqtProperty(bool, notify=pickPlaceStatusUpdated)
@@ -838,3 +1284,22 @@ class FisnarOutputDevice(PrinterOutputDevice):
             return "n/a"
         else:
             return str(round(printing_prog * 100, 2))
+
+    @pyqtProperty(str, notify=printProgressUpdated)
+    def print_time_remaining(self):
+        remaining_time = self._getRemainingPrintTime()
+        if remaining_time is None:
+            return "n/a"
+        remaining_time = int(round(remaining_time))
+        return f"{remaining_time // 3600}:{(remaining_time % 3600) // 60:02d}:{remaining_time % 60:02d}"
+
+    @pyqtProperty(str, notify=printProgressUpdated)
+    def print_layer(self):
+        # the layer being printed, and its estimated time
+        if self._print_time_estimator is None:
+            return "n/a"
+        layer = self._print_time_estimator.getLayer(self._current_index)
+        if layer is None:
+            return "n/a"
+        layer_time = int(round(self._print_time_estimator.getLayerTimes()[layer][1]))
+        return f"{layer + 1} of {self._print_time_estimator.getNumLayers()} (estimated {layer_time // 3600}:{(layer_time % 3600) // 60:02d}:{layer_time % 60:02d})"
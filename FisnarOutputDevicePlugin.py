@@ -1,10 +1,7 @@
-import threading
-import time
 from cura.CuraApplication import CuraApplication
 from UM.Logger import Logger
 from UM.Message import Message
 from UM.OutputDevice.OutputDevicePlugin import OutputDevicePlugin
-from .FisnarOutputDevice import FisnarOutputDevice
 from .FisnarRobotExtension import FisnarRobotExtension
 
 from UM.i18n import i18nCatalog
@@ -21,6 +18,20 @@ class FisnarOutputDevicePlugin(OutputDevicePlugin):
     # by its own, it can't do anything with slicer output - it is merely a peripheral
     # used by the Fisnar. In order to execute pick and place manuevers, however, it must
     # be controled independently over RS232, so this class also manages that connection
+    #
+    # Besides the primary fisnar (set up in the 'Define Setup' window), one FisnarOutputDevice
+    # is created for each robot in the extension's 'fleet_robots' preference. Each has its own
+    # RS232 thread and dispensers, and they are all held in a FisnarFleet. Every fisnar and
+    # dispenser is registered with a SerialDiscoveryService, which connects them as soon as
+    # their serial ports appear. At startup, the fisnars and dispensers are all connected in
+    # parallel, each with its own timeout
+    #
+    # start() only schedules the robots and dispensers to be set up once cura's event loop is
+    # running. The output device, fleet, discovery, dispenser and serial modules are imported
+    # then, so neither registering nor starting the plugin adds their import time to cura's launch
+
+    FISNAR_CONNECT_TIMEOUT = 5.0  # sec - for the fisnar to send the BIOS banner
+    DISPENSER_CONNECT_TIMEOUT = 3.0  # sec - for a dispenser to respond to the test command
 
     def __init__(self):
         super().__init__()
@@ -29,64 +40,113 @@ class FisnarOutputDevicePlugin(OutputDevicePlugin):
             Logger.log("e", "FisnarOutputDevicePlugin instantiated more than once")
         FisnarOutputDevicePlugin._instance = self
 
-        self._check_updates = True  # for controlling while loop in _updateThread
-
-        self._update_thread = threading.Thread(target=self._updateThread, name="FisnarRobotPlugin Serial Finder")
-        self._update_thread.daemon = True  # constantly checks for serial connections until shutdown
-
-        self._fisnar_port_name = None  # type: str, the name of the serial port from FisnarRobotExtension
+        self._robot_port_names = {}  # type: dict[str, str], serial port names of the fleet robots by device id
 
         self._application = CuraApplication.getInstance()
         self._fre_instance = FisnarRobotExtension.getInstance()
-        self._dispenser_manager = self._fre_instance.getDispenserManager()
+        self._fleet = None  # type: FisnarFleet, created once cura has launched
+        self._discovery = None  # type: SerialDiscoveryService, created once cura has launched
+        self._stopped = False
 
     def start(self):
-        # start checking for serial port updates
+        # set up the robots and start checking for serial port updates once cura has launched
         Logger.log("i", "FisnarOutputDevicePlugin instance starting...")
-
-        # creating FisnarOutputDevice
-        self.getOutputDeviceManager().addOutputDevice(FisnarOutputDevice())
-
-        # initializing com port name
-        self._fisnar_port_name = self._fre_instance.com_port
-
-        # start update thread to find open serial ports
-        self._check_updates = True
-        self._update_thread.start()
+        self._stopped = False
+        self._fre_instance.addMenuItem("Send Print To Idle Fisnar", self._submitCurrentScene)  # menus are built while cura launches
+        self._fre_instance.addMenuItem("Print On All Idle Fisnars", self._broadcastCurrentScene)
+        self._application.callLater(self._startDevices)
+
+    def _startDevices(self):
+        # create the output devices and dispensers, and start connecting to them
+        if self._stopped or self._discovery is not None:  # stopped before cura finished launching, or already started
+            return
+        from .FisnarFleet import FisnarFleet
+        from .FisnarOutputDevice import FisnarOutputDevice
+        from .SerialDiscovery import SerialDiscoveryService
+
+        self._fleet = FisnarFleet()
+        self._discovery = SerialDiscoveryService()
+        self._discovery.on_startup_complete = self._onStartupConnectionsComplete
+
+        # creating a FisnarOutputDevice for the primary fisnar and each fleet robot
+        self._addRobot(FisnarOutputDevice())
+        for i in range(len(self._fre_instance.fleet_robots)):
+            self._addFleetRobot(i + 2, self._fre_instance.fleet_robots[i])
+
+        # start connecting to the fisnars and dispensers - port name changes in the setup window are acted on straight away
+        self._fre_instance.comPortNameUpdated.connect(self._discovery.wake)
+        self._fre_instance.dispenserSerialPortUpdated.connect(self._discovery.wake)
+        self._discovery.start()
 
     def stop(self):
         # stop checking for serial port updates
         Logger.log("i", "FisnarOutputDevicePlugin instance stopping...")
-        self._check_updates = False  # stops while loop in _updateThread
-        self.getOutputDeviceManager().getOutputDevice("fisnar_f5200n").close()
-        self.getOutputDeviceManager().removeOutputDevice("fisnar_f5200n")
-        self._dispenser_manager.closeAll()
-
-    def _updateThread(self):
-        # try to connect to fisnar and dispenser serial port every 10 seconds if they aren't already connected
-        while self._check_updates:
-            self._fisnar_port_name = self._fre_instance.com_port
-            self.getOutputDeviceManager().getOutputDevice("fisnar_f5200n").fisnarPortNameUpdated.emit()
-            # TODO: put dispenser ports in manual control ui and emit signal here - basically the above line but for the dispensers
-
-            if not self.getOutputDeviceManager().getOutputDevice("fisnar_f5200n").isConnected():  # if fisnar port not connected, try to.
-                if self._fisnar_port_name not in (None, "None"):
-                    self.getOutputDeviceManager().getOutputDevice("fisnar_f5200n").connect(self._fisnar_port_name)
-                    if self.getOutputDeviceManager().getOutputDevice("fisnar_f5200n").isConnected():
-                        fis_msg = Message(text = catalog.i18nc("@message", "Fisnar F5200N successfully connected via: " + str(self._fisnar_port_name)),
-                                          title = catalog.i18nc("@message", "Connection Status Update"))
-                        fis_msg.show()
-
-            for dispenser in self._dispenser_manager.getDispensers():
-                if not dispenser.isConnected() and dispenser.available.is_set():
-                    if dispenser.getComPort() not in (None, "None"):
-                        dispenser.connect()
-                        if dispenser.isConnected():
-                            disp_msg = Message(text = catalog.i18nc("@message", f"UltimusV dispenser '{dispenser.name}' successfully connected via: {dispenser.getComPort()}"),
-                                               title = catalog.i18nc("@message", "Connection Status Update"))
-                            disp_msg.show()
-
-            time.sleep(3)
+        self._stopped = True
+        if self._discovery is None:  # devices never set up
+            return
+        self._discovery.stop()
+        for robot in self._fleet.getRobots():
+            robot.close()
+            robot.getDispenserManager().closeAll()
+            self.getOutputDeviceManager().removeOutputDevice(robot.getId())
+
+    def _addRobot(self, robot):
+        self._fleet.addRobot(robot)
+        self.getOutputDeviceManager().addOutputDevice(robot)
+
+        self._discovery.addTarget(robot.getName(), lambda: self._getRobotPortName(robot), robot.isConnected, robot.connect,
+                                  lambda port_name: self._onConnected(robot.getName(), port_name), FisnarOutputDevicePlugin.FISNAR_CONNECT_TIMEOUT, robot.close)
+        for dispenser in robot.getDispenserManager().getDispensers():
+            self._discovery.addTarget(dispenser.display_name, dispenser.getComPort, lambda dispenser=dispenser: dispenser.isConnected() or not dispenser.available.is_set(),
+                                      dispenser.connect, lambda port_name, dispenser=dispenser: self._onConnected(f"UltimusV dispenser '{dispenser.display_name}'", port_name),
+                                      FisnarOutputDevicePlugin.DISPENSER_CONNECT_TIMEOUT, dispenser.close)
+
+    def _onConnected(self, device_name, port_name):
+        msg = Message(text = catalog.i18nc("@message", f"{device_name} successfully connected via: {port_name}"),
+                      title = catalog.i18nc("@message", "Connection Status Update"))
+        msg.show()
+
+    def _onStartupConnectionsComplete(self, startup_time, connected, not_connected):
+        # startup time metric - also recorded in the link profiler
+        if self._fre_instance.getLinkProfiler().enabled:
+            self._fre_instance.getLinkProfiler().record("startup_connect", startup_time)
+
+    def _addFleetRobot(self, number, robot_config):
+        # create the output device and dispensers for a fleet robot. robot_config is a dictionary
+        # with the 'com_port', 'dispenser_com_ports' and (optionally) 'name' of the robot
+        from .DispenserManager import DispenserManager
+        from .FisnarOutputDevice import FisnarOutputDevice
+        from .UltimusV import UltimusV
+
+        device_id = "fisnar_f5200n_" + str(number)
+        name = robot_config.get("name", "Fisnar F5200N " + str(number))
+
+        dispenser_manager = DispenserManager()
+        dispenser_com_ports = robot_config.get("dispenser_com_ports", {})
+        for dispenser_number in (1, 2):
+            dispenser = UltimusV("dispenser_" + str(dispenser_number))
+            dispenser.display_name = name + " Dispenser " + str(dispenser_number)
+            dispenser.setComPort(dispenser_com_ports.get(dispenser.name, None))
+            dispenser_manager.addDispenser(dispenser)
+
+        self._robot_port_names[device_id] = robot_config.get("com_port", None)
+        self._addRobot(FisnarOutputDevice(device_id, name, dispenser_manager))
+
+    def _getRobotPortName(self, robot):
+        if robot.getId() in self._robot_port_names:
+            return self._robot_port_names[robot.getId()]
+        return self._fre_instance.com_port  # primary fisnar
+
+    def _submitCurrentScene(self):
+        if self._fleet is not None:
+            self._fleet.submitCurrentScene(self._fre_instance.continuous_extrusion)
+
+    def _broadcastCurrentScene(self):
+        if self._fleet is not None:
+            self._fleet.broadcastCurrentScene(self._fre_instance.continuous_extrusion)
+
+    def getFleet(self):
+        return self._fleet
 
     _instance = None
 
@@ -1,4 +1,5 @@
 import copy
+import hashlib
 import json
 import numpy
 import os
@@ -11,7 +12,7 @@ import zipfile
 from typing import Optional, Union, List
 from cura.BuildVolume import BuildVolume
 from cura.CuraApplication import CuraApplication
-from PyQt6.QtCore import QObject, QUrl, QTimer, pyqtSlot, pyqtProperty, pyqtSignal
+from PyQt6.QtCore import QObject, QUrl, pyqtSlot, pyqtProperty, pyqtSignal
 from PyQt6.QtQml import QQmlComponent, QQmlContext
 from UM.Application import Application
 from UM.Extension import Extension
@@ -21,10 +22,9 @@ from UM.Message import Message
 from UM.PluginRegistry import PluginRegistry
 from UM.Resources import Resources
 from UM.Scene.Iterator.BreadthFirstIterator import BreadthFirstIterator
-from .Converter import Converter
-from .DispenserManager import DispenserManager
+from .LinkProfiler import LinkProfiler
+from .PluginLog import PluginLogger, TraceRing
 from .PrinterAttributes import PrintSurface
-from .UltimusV import UltimusV
 
 from UM.i18n import i18nCatalog
 catalog = i18nCatalog("cura")
@@ -63,7 +63,18 @@ class FisnarRobotExtension(QObject, Extension):
             "place_dwell": 0.0,
             "reps": 0,
             "pick_place_dispenser_id": None,
-            "continuous_extrusion": False
+            "continuous_extrusion": False,
+            "travel_optimization": False,
+            "travel_toggle_threshold": 5.0,
+            "unknown_command_policy": "warn",
+            "conversion_workers": 0,
+            "position_sample_rate": 0.0,
+            "command_log_sample_interval": 0,
+            "log_level": "i",
+            "rs232_trace": False,
+            "link_profiling": False,
+            "pause_z_lift": 0.0,
+            "fleet_robots": []
         }
         self.preferences.addPreference("fisnar/setup", json.dumps(default_preferences))
 
@@ -83,6 +94,17 @@ class FisnarRobotExtension(QObject, Extension):
         self.place_dwell = 0.0
         self.reps = 1
         self.continuous_extrusion = False
+        self.travel_optimization = False
+        self.travel_toggle_threshold = 5.0  # mm - travels shorter than this don't toggle outputs in continuous extrusion
+        self.unknown_command_policy = "warn"  # what is done with unrecognized g-code commands or unreadable parameters ('skip', 'warn' or 'error')
+        self.conversion_workers = 0  # max worker processes large g-code is converted in (0 for one per core, 1 for none)
+        self.position_sample_rate = 0.0  # Hz - how often the fisnar position is queried while printing (0 for never)
+        self.command_log_sample_interval = 0  # log every n-th command sent to the fisnar (0 for never)
+        self.log_level = "i"  # minimum level of plugin log messages ('d', 'i', 'w', 'e', or 'c')
+        self.rs232_trace = False  # whether RS232 traffic is traced to file
+        self.link_profiling = False  # whether RS232 link latencies are profiled (see LinkProfiler)
+        self.pause_z_lift = 0.0  # mm - how far the z is lifted when a print is paused
+        self.fleet_robots = []  # additional fisnars, as dicts with 'com_port', 'dispenser_com_ports' and optionally 'name'
 
         # connection status of fisnar and dispenser for UI
         self.fisnar_connected = False
@@ -90,59 +112,177 @@ class FisnarRobotExtension(QObject, Extension):
         # setting up menus
         self.setMenuName("Fisnar Actions")
         self.addMenuItem("Define Setup", self.showDefineSetupWindow)
+        self.addMenuItem("RS232 Link Profile", self.showLinkProfile)
 
         # 'lazy loading' windows, so can be called later.
         self.define_setup_window = None
 
-        # timer for resetting disallowed areas when a file is loaded
-        self.reset_dis_areas_timer = QTimer()
-        self.reset_dis_areas_timer.setInterval(1000)  # every one second, update disallowed areas. kind of hacky, but works for now
-        self.reset_dis_areas_timer.timeout.connect(self.resetDisallowedAreas)
-        self.reset_dis_areas_timer.start()
+        # disallowed areas are set again only when cura has replaced them (when the build volume is
+        # rebuilt, it changes the scene) or when the print surface is changed
+        self._disallowed_areas_cache = {}  # disallowed area polygons, by print surface tuple
+        self._applied_disallowed_areas = None  # the polygon list last set on the build volume
+        self._application.getController().getScene().sceneChanged.connect(self._onSceneChanged)
 
         # filepaths to local resources
         self.this_plugin_path = os.path.join(Resources.getStoragePath(Resources.Resources, "plugins", "FisnarRobotPlugin", "FisnarRobotPlugin"))
         self.local_meshes_path = os.path.join(Resources.getStoragePathForType(Resources.Resources), "meshes")
         self.local_printer_defs_path = os.path.join(Resources.getStoragePathForType(Resources.DefinitionContainers))
-
-        # checking if plugin files are installed
-        update_necessary = False
-        if self.isInstalled():
-            if self.defFilesAreUpdated():  # up-to-date
-                Logger.log("i", "Up-to-date FisnarRobotPlugin extension files are already installed.")
-            else:  # need to be updated
-                Logger.log("i", "FisnarRobotPlugin files need to be updated.")
-                update_necessary = True
-        else:  # files not installed
-            Logger.log("i", "One or more FisnarRobotPlugin files needs to be installed")
-            update_necessary = True
-
-        if update_necessary:
+        self.def_files_zip_path = os.path.join(self.this_plugin_path, "resources", "definitions.zip")
+        self.def_files_manifest_path = os.path.join(Resources.getStoragePathForType(Resources.Resources), "fisnar_def_files_manifest.json")
+
+        # checking if plugin files are installed - normally this is just a stat of definitions.zip
+        if self.defFilesAreUpdated():  # up-to-date
+            Logger.log("i", "Up-to-date FisnarRobotPlugin extension files are already installed.")
+        else:  # need to be installed or updated
+            Logger.log("i", "FisnarRobotPlugin files need to be installed or updated.")
             self.installDefFiles()
-            Logger.log("i", "All FisnarRobotPlugin files are installed and up-to-date")
 
         # loading tooltip dictionary
         self.tooltips = json.load(open(os.path.join(self.this_plugin_path, "resources", "tooltips.json"), "r"))
 
-        # setting up dispenser manager
-        self.dispenser_manager = DispenserManager()
-        self.dispenser_manager.addDispenser(UltimusV("dispenser_1"))
-        self.dispenser_manager.getDispenser("dispenser_1").display_name = "Dispenser 1"
-        self.dispenser_manager.addDispenser(UltimusV("dispenser_2"))
-        self.dispenser_manager.getDispenser("dispenser_2").display_name = "Dispenser 2"
-        self.dispenser_manager.dispenserConnectionStatesUpdated.connect(self._onDispenserConnectStateUpdated)
+        # dispenser manager - created on first use (see getDispenserManager()), so the dispenser and
+        # serial modules aren't imported while cura is starting. Until then, the dispenser
+        # preference values are held here
+        self.dispenser_manager = None
+        self.dispenser_com_ports = {"dispenser_1": None, "dispenser_2": None}
+        self.pick_place_dispenser_id = None
+
+        # profilers for the RS232 links - one for plugin wide metrics (like the startup connect
+        # time), and one for each fisnar so that every 'ok!' is matched to its own robot's sends
+        self.link_profiler = LinkProfiler()
+        self.robot_link_profilers = {}  # (robot name, profiler) by device id
+
+        # plugin logging and RS232 trace
+        self.plugin_logger = PluginLogger()
+        self.rs232_trace_ring = TraceRing()
+        self.rs232_trace_path = os.path.join(Resources.getStoragePathForType(Resources.Resources), "fisnar_rs232_trace.log")
 
         # setting setting values to values stored in preferences
         self.updateFromPreferencedValues()
 
     def getDispenserManager(self):
+        # get the primary fisnar's dispenser manager, creating it the first time
+        if self.dispenser_manager is None:
+            from .DispenserManager import DispenserManager
+            from .UltimusV import UltimusV
+            self.dispenser_manager = DispenserManager()
+            self.dispenser_manager.addDispenser(UltimusV("dispenser_1"))
+            self.dispenser_manager.getDispenser("dispenser_1").display_name = "Dispenser 1"
+            self.dispenser_manager.addDispenser(UltimusV("dispenser_2"))
+            self.dispenser_manager.getDispenser("dispenser_2").display_name = "Dispenser 2"
+            self.dispenser_manager.dispenserConnectionStatesUpdated.connect(self._onDispenserConnectStateUpdated)
+            self._applyDispenserPreferences()
         return self.dispenser_manager
 
+    def _applyDispenserPreferences(self):
+        # set the held dispenser preference values on the dispenser manager
+        self.dispenser_manager.getDispenser("dispenser_1").setComPort(self.dispenser_com_ports.get("dispenser_1", None))
+        self.dispenser_manager.getDispenser("dispenser_2").setComPort(self.dispenser_com_ports.get("dispenser_2", None))
+        self.dispenser_manager.setPickPlaceDispenser(self.pick_place_dispenser_id)
+
+    def getLinkProfiler(self):
+        return self.link_profiler
+
+    def createLinkProfiler(self, device_id, name):
+        # create the link profiler of a fisnar output device - it is enabled with the others
+        profiler = LinkProfiler()
+        profiler.enabled = self.link_profiler.enabled
+        self.robot_link_profilers[device_id] = (name, profiler)
+        return profiler
+
+    def getLinkProfilers(self):
+        # get every link profiler as (label, profiler) tuples, the plugin wide one first
+        return [("Plugin", self.link_profiler)] + [self.robot_link_profilers[device_id] for device_id in sorted(self.robot_link_profilers)]
+
+    def getPluginLogger(self):
+        return self.plugin_logger
+
+    def getRS232TraceRing(self):
+        return self.rs232_trace_ring
+
+    def applyLogSettings(self):
+        # apply the log level, RS232 trace and link profiling settings
+        self.plugin_logger.setLevel(self.log_level)
+        for label, profiler in self.getLinkProfilers():
+            if self.link_profiling and not profiler.enabled:
+                profiler.clearInFlight()  # commands sent while it was off weren't recorded
+            profiler.enabled = bool(self.link_profiling)
+        if self.rs232_trace and not self.rs232_trace_ring.enabled:
+            Logger.log("i", f"tracing RS232 traffic to {self.rs232_trace_path}")
+            self.rs232_trace_ring.enable(self.rs232_trace_path)
+        elif not self.rs232_trace and self.rs232_trace_ring.enabled:
+            self.rs232_trace_ring.disable()
+
     def defFilesAreUpdated(self):
-        # return True if the locally installed def files are up to date,
-        # otherwise return False. Not sure the mechanism by which the version
-        # can be tracked, but probably just go off the Dremel plugin example
-        return False
+        # return True if the locally installed def files are up to date, otherwise return False.
+        # The manifest written by installDefFiles() holds the size, modification time and hash of
+        # definitions.zip when the files were installed - if the size and time still match, the
+        # zip hasn't changed. If they don't, the zip is hashed in case only its time changed (the
+        # plugin was reinstalled with the same files). The installed files are also checked for,
+        # as they can be deleted (e.g. by resetting cura's config) without the manifest
+        manifest = self._readDefFilesManifest()
+        if manifest is None or not self._defFilesArePresent(manifest):
+            return False
+
+        try:
+            zip_stat = os.stat(self.def_files_zip_path)
+        except OSError:
+            Logger.log("w", f"definitions zip file '{self.def_files_zip_path}' not found")
+            return True  # nothing to install from
+
+        if manifest.get("zip_size") == zip_stat.st_size and manifest.get("zip_mtime_ns") == zip_stat.st_mtime_ns:
+            return True
+        if manifest.get("zip_hash") != self._hashDefFilesZip():
+            return False
+
+        manifest["zip_size"] = zip_stat.st_size
+        manifest["zip_mtime_ns"] = zip_stat.st_mtime_ns
+        self._writeDefFilesManifest(manifest)
+        return True
+
+    def _defFilesArePresent(self, manifest):
+        # return True if every file recorded in the manifest is installed
+        for filename in manifest.get("files", {}):
+            folder = self._getDefFileFolder(filename)
+            if folder is not None and not os.path.isfile(os.path.join(folder, filename)):
+                Logger.log("i", f"file '{os.path.join(folder, filename)}' is not installed")
+                return False
+        return True
+
+    def _readDefFilesManifest(self):
+        # return the def files manifest dict, or None if it doesn't exist or can't be read
+        try:
+            with open(self.def_files_manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if isinstance(manifest, dict) else None
+
+    def _writeDefFilesManifest(self, manifest):
+        # write the def files manifest, replacing the old one only once it's fully written
+        temp_path = self.def_files_manifest_path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(temp_path, self.def_files_manifest_path)
+        except OSError as e:
+            Logger.log("w", f"couldn't write def files manifest: {e}")
+
+    def _hashDefFilesZip(self):
+        # return the sha1 hex digest of definitions.zip
+        zip_hash = hashlib.sha1()
+        with open(self.def_files_zip_path, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                zip_hash.update(block)
+        return zip_hash.hexdigest()
+
+    def _getDefFileFolder(self, filename):
+        # return the folder a file in definitions.zip is installed to, or None if it isn't recognized
+        if filename == "fisnar_buildplate.3mf":
+            return self.local_meshes_path
+        elif filename == "fisnar_f5200n.def.json":
+            return self.local_printer_defs_path
+        return None
 
     def isInstalled(self):
         # return True if all plugin files are already installed, and False if
@@ -160,33 +300,40 @@ class FisnarRobotExtension(QObject, Extension):
         return True  # all files are installed
 
     def installDefFiles(self):
-        # install definition files
+        # install definition files. Only files that are missing or whose CRC in the zip differs
+        # from the one recorded in the manifest when they were last installed are extracted
 
         try:
-            zipdata = os.path.join(self.this_plugin_path, "resources", "definitions.zip")
+            zipdata = self.def_files_zip_path
             Logger.log("i", f"found zipfile: {zipdata}")
+            zip_stat = os.stat(zipdata)
+
+            manifest = self._readDefFilesManifest()
+            installed_crcs = manifest.get("files", {}) if manifest is not None else {}
+            new_manifest = {"zip_size": zip_stat.st_size, "zip_mtime_ns": zip_stat.st_mtime_ns, "zip_hash": self._hashDefFilesZip(), "files": {}}
 
             with zipfile.ZipFile(zipdata, "r") as zip_files:
                 for info in zip_files.infolist():
-                    Logger.log("i", f"found in zip file: {info.filename}")
-
-                    folder = None
-                    if info.filename == "fisnar_buildplate.3mf":
-                        folder = self.local_meshes_path
-                        if not os.path.exists(folder):  # making the meshes folder because cura doesn't make it for some reason
-                            os.mkdir(folder)
-                    elif info.filename == "fisnar_f5200n.def.json":
-                        folder = self.local_printer_defs_path
-
-                    if folder is not None:
-                        extracted_path = zip_files.extract(info.filename, path=folder)
-                        permissions = os.stat(extracted_path).st_mode
-                        os.chmod(extracted_path, permissions | stat.S_IEXEC)  # bitwise OR?
-                        Logger.log("i", f"file {info.filename} installed to {extracted_path}")
-                    else:
+                    folder = self._getDefFileFolder(info.filename)
+                    if folder is None:
                         Logger.log("w", f"unrecognized file in definitions.zip: {info.filename}")
+                        continue
+
+                    new_manifest["files"][info.filename] = info.CRC
+                    installed_path = os.path.join(folder, info.filename)
+                    if installed_crcs.get(info.filename) == info.CRC and os.path.isfile(installed_path):
+                        Logger.log("d", f"file {info.filename} is up to date at {installed_path}")
+                        continue
+
+                    if not os.path.exists(folder):  # making the meshes folder because cura doesn't make it for some reason
+                        os.mkdir(folder)
+                    extracted_path = zip_files.extract(info.filename, path=folder)
+                    permissions = os.stat(extracted_path).st_mode
+                    os.chmod(extracted_path, permissions | stat.S_IEXEC)  # bitwise OR?
+                    Logger.log("i", f"file {info.filename} installed to {extracted_path}")
 
             if self.isInstalled():
+                self._writeDefFilesManifest(new_manifest)
                 Logger.log("i", "all Fisnar Robot Plugin files successfully installed")
         except:
             Logger.log("w", "An error occured while installing the Fisnar Robot Plugin files.")
@@ -203,8 +350,7 @@ class FisnarRobotExtension(QObject, Extension):
         if pref_dict.get("com_port", -1) != -1:
             self.com_port = pref_dict["com_port"]
         if pref_dict.get("dispenser_com_ports", -1) != -1:
-            self.dispenser_manager.getDispenser("dispenser_1").setComPort(pref_dict["dispenser_com_ports"]["dispenser_1"])
-            self.dispenser_manager.getDispenser("dispenser_2").setComPort(pref_dict["dispenser_com_ports"]["dispenser_2"])
+            self.dispenser_com_ports = pref_dict["dispenser_com_ports"]
         if pref_dict.get("pick_location", None) is not None:
             self.pick_location = pref_dict["pick_location"]
         if pref_dict.get("place_location", None) is not None:
@@ -226,17 +372,45 @@ class FisnarRobotExtension(QObject, Extension):
         if pref_dict.get("reps", None) is not None:
             self.reps = pref_dict["reps"]
         if pref_dict.get("pick_place_dispenser_id", -1) is not -1:
-            self.dispenser_manager.setPickPlaceDispenser(pref_dict["pick_place_dispenser_id"])
+            self.pick_place_dispenser_id = pref_dict["pick_place_dispenser_id"]
         if pref_dict.get("continuous_extrusion", None) is not None:
             self.continuous_extrusion = pref_dict["continuous_extrusion"]
             # Logger.log("d", f"self.continuous_extrusion: {self.continuous_extrusion}, {type(self.continuous_extrusion)}")
+        if pref_dict.get("travel_optimization", None) is not None:
+            self.travel_optimization = pref_dict["travel_optimization"]
+        if pref_dict.get("travel_toggle_threshold", None) is not None:
+            self.travel_toggle_threshold = pref_dict["travel_toggle_threshold"]
+        if pref_dict.get("unknown_command_policy", None) is not None:
+            self.unknown_command_policy = pref_dict["unknown_command_policy"]
+        if pref_dict.get("conversion_workers", None) is not None:
+            self.conversion_workers = pref_dict["conversion_workers"]
+        if pref_dict.get("position_sample_rate", None) is not None:
+            self.position_sample_rate = pref_dict["position_sample_rate"]
+        if pref_dict.get("command_log_sample_interval", None) is not None:
+            self.command_log_sample_interval = pref_dict["command_log_sample_interval"]
+        if pref_dict.get("log_level", None) is not None:
+            self.log_level = pref_dict["log_level"]
+        if pref_dict.get("rs232_trace", None) is not None:
+            self.rs232_trace = pref_dict["rs232_trace"]
+        if pref_dict.get("link_profiling", None) is not None:
+            self.link_profiling = pref_dict["link_profiling"]
+        if pref_dict.get("pause_z_lift", None) is not None:
+            self.pause_z_lift = pref_dict["pause_z_lift"]
+        if pref_dict.get("fleet_robots", None) is not None:
+            self.fleet_robots = pref_dict["fleet_robots"]
+        if self.dispenser_manager is not None:
+            self._applyDispenserPreferences()
+        self.applyLogSettings()
 
     def updatePreferencedValues(self):
         # update the stored preference values from the user entered values
+        if self.dispenser_manager is not None:
+            self.dispenser_com_ports = self.dispenser_manager.getPortNameDict()
+            self.pick_place_dispenser_id = self.dispenser_manager.getPickPlaceDispenserName()
         new_pref_dict = {
             "print_surface": self.print_surface.getAsTuple(),
             "com_port": self.com_port,
-            "dispenser_com_ports": self.dispenser_manager.getPortNameDict(),
+            "dispenser_com_ports": self.dispenser_com_ports,
             "pick_location": self.pick_location,
             "place_location": self.place_location,
             "vacuum_pressure": self.vacuum_pressure,
@@ -247,33 +421,65 @@ class FisnarRobotExtension(QObject, Extension):
             "pick_dwell": self.pick_dwell,
             "place_dwell": self.place_dwell,
             "reps": self.reps,
-            "pick_place_dispenser_id": self.dispenser_manager.getPickPlaceDispenserName(),
-            "continuous_extrusion": self.continuous_extrusion
+            "pick_place_dispenser_id": self.pick_place_dispenser_id,
+            "continuous_extrusion": self.continuous_extrusion,
+            "travel_optimization": self.travel_optimization,
+            "travel_toggle_threshold": self.travel_toggle_threshold,
+            "unknown_command_policy": self.unknown_command_policy,
+            "conversion_workers": self.conversion_workers,
+            "position_sample_rate": self.position_sample_rate,
+            "command_log_sample_interval": self.command_log_sample_interval,
+            "log_level": self.log_level,
+            "rs232_trace": self.rs232_trace,
+            "link_profiling": self.link_profiling,
+            "pause_z_lift": self.pause_z_lift,
+            "fleet_robots": self.fleet_robots
         }
         self.preferences.setValue("fisnar/setup", json.dumps(new_pref_dict))
 
+    def _onSceneChanged(self, source):
+        # set the disallowed areas again if cura has replaced them
+        node = self._cura_app.getBuildVolume()
+        if node is not None and not self._disallowedAreasAreCurrent(node):
+            self.resetDisallowedAreas()
+
+    def _disallowedAreasAreCurrent(self, node):
+        # True if the build volume still has the disallowed areas and height for the current print surface
+        if self._applied_disallowed_areas is None or self._applied_disallowed_areas is not self._disallowed_areas_cache.get(tuple(self.print_surface.getAsTuple()), None):
+            return False
+        areas = node.getDisallowedAreas()
+        if len(areas) != len(self._applied_disallowed_areas) or any(area is not applied_area for area, applied_area in zip(areas, self._applied_disallowed_areas)):
+            return False
+        return node.getHeight() == self.print_surface.getZMax()
+
     def resetDisallowedAreas(self):
+        node = self._cura_app.getBuildVolume()
+        if node is None:  # can happen if the _cura_app._volume is None
+            return
+
+        surface_tuple = tuple(self.print_surface.getAsTuple())
+        new_disallowed_areas = self._disallowed_areas_cache.get(surface_tuple, None)
+        if new_disallowed_areas is None:
+            new_disallowed_areas = self._disallowed_areas_cache[surface_tuple] = self.getDisallowedAreaPolygons()
+
+        # setting new disallowed areas and rebuilding (not sure if the rebuild is necessary)
+        self._applied_disallowed_areas = new_disallowed_areas
+        node.setDisallowedAreas(new_disallowed_areas)
+        node.setHeight(self.print_surface.getZMax())
+        node.rebuild()
+
+    def getDisallowedAreaPolygons(self):
         # turning fisnar coords to gcode coords (fisnar coords are inverted in each direction)
         # the following inversion is based on a (200, 200, 100) fisnar print area. Note: the printer in cura needs to be set up as such to look the best
         # also, the min and max nomenclatures are flipped (because the directions are inverted)
         # NOTE: for some reason, the build volume class takes the origin of the build plate to be at the center
         # NOTE: this code assumes a build volume x-y dimension of (200, 200). Any integers seen in this code are based off of this assumption
 
-        node = self._cura_app.getBuildVolume()
-        if node is None:  # can happen if the _cura_app._volume is None
-            return
-
-        # getting build volume dimensions and original disallowed areas, for documentation
-        orig_disallowed_areas = node.getDisallowedAreas()
-        x_dim = node.getWidth()  # NOTE: I think width corresponds to x, not sure
-        y_dim = node.getDepth()  # NOTE: same as above comment. I think this is right
-
         # converting coord system from fisnar to build volume coord system
         bv_x_min = 100 - self.print_surface.getXMax()
         bv_x_max = 100 - self.print_surface.getXMin()
         bv_y_min = self.print_surface.getYMin() - 100
         bv_y_max = self.print_surface.getYMax() - 100
-        new_z_dim = self.print_surface.getZMax()
 
         # establishing new dissalowed areas (list of Polygon objects)
         new_disallowed_areas = []
@@ -291,10 +497,7 @@ class FisnarRobotExtension(QObject, Extension):
             else:
                 i += 1
 
-        # setting new disallowed areas and rebuilding (not sure if the rebuild is necessary)
-        node.setDisallowedAreas(new_disallowed_areas)
-        node.setHeight(new_z_dim)
-        node.rebuild()
+        return new_disallowed_areas
 
     @pyqtSlot(str, result=str)
     def getTooltip(self, key):
@@ -420,21 +623,22 @@ class FisnarRobotExtension(QObject, Extension):
     dispenserSerialPortUpdated = pyqtSignal()
     @pyqtProperty(str, notify=dispenserSerialPortUpdated)
     def dispenser_1_serial_port(self):
-        return str(self.dispenser_manager.getDispenser("dispenser_1").getComPort())
+        return str(self.getDispenserManager().getDispenser("dispenser_1").getComPort())
 
     @pyqtProperty(str, notify=dispenserSerialPortUpdated)
     def dispenser_2_serial_port(self):
-        return str(self.dispenser_manager.getDispenser("dispenser_2").getComPort())
+        return str(self.getDispenserManager().getDispenser("dispenser_2").getComPort())
 
     @pyqtSlot(str, str)
     def updateDispenserPortName(self, dispenser_name, port_name):
-        disp = self.dispenser_manager.getDispenser(dispenser_name)
+        disp = self.getDispenserManager().getDispenser(dispenser_name)
         if disp is not None:
             Logger.log("d", f"********** {dispenser_name} set to port {port_name}")
             if port_name == "None":
                 disp.setComPort(None)
             else:
                 disp.setComPort(port_name)
+            self.dispenserSerialPortUpdated.emit()
         self.updatePreferencedValues()
 
 # ========== fisnar connection status ======================================
@@ -454,18 +658,18 @@ class FisnarRobotExtension(QObject, Extension):
 
     dispenserConnectionStatusChanged = pyqtSignal()
     def setDispenserConnectionState(self, dispenser_name, state):
-        if state != self.dispenser_manager.isConnected(dispenser_name):
+        if state != self.getDispenserManager().isConnected(dispenser_name):
             self.dispenser_connected = state
             self.dispenserConnectionStatusChanged.emit()
 
     @pyqtProperty(bool, notify=dispenserConnectionStatusChanged)
     def dispenser_1_connection_state(self):
-        status = self.dispenser_manager.isConnected("dispenser_1")
+        status = self.getDispenserManager().isConnected("dispenser_1")
         return False if not isinstance(status, bool) else status
 
     @pyqtProperty(bool, notify=dispenserConnectionStatusChanged)
     def dispenser_2_connection_state(self):
-        status = self.dispenser_manager.isConnected("dispenser_2")
+        status = self.getDispenserManager().isConnected("dispenser_2")
         return False if not isinstance(status, bool) else status
 
 # ============= continuous printing checkbox ==============================
@@ -485,6 +689,31 @@ class FisnarRobotExtension(QObject, Extension):
 
     const_extrusion = pyqtProperty(int, fset=setContinuousExtrusion, fget=getContinuousExtrusion, notify=continuousExtrusionUpdated)
 
+# ============= travel optimization checkbox ==============================
+    travelOptimizationUpdated = pyqtSignal()
+    def setTravelOptimization(self, state):
+        # state: 1 for checked, 0 for unchecked
+        self.travel_optimization = state == 1
+        self.updatePreferencedValues()
+
+    def getTravelOptimization(self):
+        # get checkstate as int (1: checked, 0: unchecked)
+        return 1 if self.travel_optimization else 0
+
+    travel_opt = pyqtProperty(int, fset=setTravelOptimization, fget=getTravelOptimization, notify=travelOptimizationUpdated)
+
+# ============= position sample rate entry ================================
+    positionSampleRateUpdated = pyqtSignal()
+    def setPositionSampleRate(self, sample_rate):
+        # sample rate in Hz, as entered in qml (0 to not sample the position while printing)
+        self.position_sample_rate = max(0.0, float(sample_rate))
+        self.updatePreferencedValues()
+
+    def getPositionSampleRate(self):
+        return str(self.position_sample_rate)
+
+    position_sample_rate_str = pyqtProperty(str, fset=setPositionSampleRate, fget=getPositionSampleRate, notify=positionSampleRateUpdated)
+
 # ==========================================================================
 
     def showDefineSetupWindow(self):
@@ -493,6 +722,26 @@ class FisnarRobotExtension(QObject, Extension):
             self.define_setup_window = self._createDialogue("DefineSetupWindow.qml")
         self.define_setup_window.show()
 
+    def showLinkProfile(self):
+        # export the RS232 link profiles (the plugin wide one and each robot's) as json to the cura
+        # storage folder and show a summary of them
+        profile_path = os.path.join(Resources.getStoragePathForType(Resources.Resources), "fisnar_link_profile.json")
+        profilers = self.getLinkProfilers()
+        text = "\n\n".join(f"{label}:\n{profiler.getSummary()}" for label, profiler in profilers)
+        try:
+            with open(profile_path, "w") as profile_file:
+                json.dump([dict(name=label, **profiler.toDict()) for label, profiler in profilers], profile_file, indent=2)
+            Logger.log("i", f"RS232 link profile exported to {profile_path}")
+            text += f"\n\nExported to {profile_path}"
+        except OSError:
+            Logger.log("w", f"could not export RS232 link profile to {profile_path}")
+        if not self.link_profiler.enabled:
+            text = "RS232 link profiling is off - set 'link_profiling' in the fisnar/setup preference to turn it on.\n\n" + text
+
+        msg = Message(text = catalog.i18nc("@message", text),
+                      title = catalog.i18nc("@message", "Fisnar RS232 Link Profile"))
+        msg.show()
+
     def _createDialogue(self, qml_file_name):
         # Logger.log("i", "***** Fisnar CSV Writer dialogue created")  # test
         qml_file_path = os.path.join(self.this_plugin_path, "resources", "qml", qml_file_name)
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class LatencyHistogram:
+    # HDR-style histogram of durations - values are stored in log-linear buckets of integer
+    # microseconds (16 linear sub-buckets per power of two), so any value is recorded with
+    # about 6% precision in a small, fixed amount of memory regardless of the number of values
+
+    SUB_BUCKETS = 16
+    SUB_BUCKET_BITS = 4
+
+    def __init__(self):
+        self._counts = []
+        self._total_count = 0
+        self._total = 0.0
+        self._min = None
+        self._max = None
+
+    @staticmethod
+    def _bucketIndex(microseconds):
+        if microseconds < LatencyHistogram.SUB_BUCKETS:
+            return microseconds
+        shift = microseconds.bit_length() - LatencyHistogram.SUB_BUCKET_BITS - 1
+        return (shift + 1) * LatencyHistogram.SUB_BUCKETS + (microseconds >> shift) - LatencyHistogram.SUB_BUCKETS
+
+    @staticmethod
+    def _bucketValue(index):
+        # get the middle of the given bucket, in seconds
+        if index < LatencyHistogram.SUB_BUCKETS:
+            return index / 1e6
+        shift = index // LatencyHistogram.SUB_BUCKETS - 1
+        lower = (LatencyHistogram.SUB_BUCKETS + index % LatencyHistogram.SUB_BUCKETS) << shift
+        return (lower + ((1 << shift) - 1) / 2) / 1e6
+
+    def record(self, seconds):
+        if seconds < 0.0:
+            seconds = 0.0
+        index = LatencyHistogram._bucketIndex(int(seconds * 1e6))
+        if index >= len(self._counts):
+            self._counts.extend([0] * (index + 1 - len(self._counts)))
+        self._counts[index] += 1
+
+        self._total_count += 1
+        self._total += seconds
+        if self._min is None or seconds < self._min:
+            self._min = seconds
+        if self._max is None or seconds > self._max:
+            self._max = seconds
+
+    def getCount(self):
+        return self._total_count
+
+    def getTotal(self):
+        return self._total
+
+    def getPercentile(self, percentile):
+        # get the value (sec) at the given percentile (0 to 100), or None if nothing has been recorded
+        if self._total_count == 0:
+            return None
+        target = max(1, int(round(self._total_count * percentile / 100.0)))
+        cumulative = 0
+        for i in range(len(self._counts)):
+            cumulative += self._counts[i]
+            if cumulative >= target:
+                return min(max(LatencyHistogram._bucketValue(i), self._min), self._max)
+        return self._max
+
+    def toDict(self):
+        return {
+            "count": self._total_count,
+            "total": self._total,
+            "min": self._min,
+            "max": self._max,
+            "mean": self._total / self._total_count if self._total_count > 0 else None,
+            "p50": self.getPercentile(50),
+            "p90": self.getPercentile(90),
+            "p99": self.getPercentile(99),
+            "buckets": {str(LatencyHistogram._bucketValue(i)): self._counts[i] for i in range(len(self._counts)) if self._counts[i] > 0}
+        }
+
+
+class LinkProfiler:
+    # class for recording where time goes on the fisnar RS232 link: the latency from sending a
+    # command until its 'ok!' (per opcode), how long commands wait in the send queue, how long
+    # dispenser toggles take, and how long readline() blocks without receiving anything.
+    # Several commands can be in flight at once, and the fisnar answers them in order, so each
+    # 'ok!' is matched to the oldest command sent that hasn't been answered yet.
+    #
+    # profiling is off unless the 'link_profiling' preference is set - check enabled (a plain
+    # attribute, like PluginLogger.debug_enabled) before calling anything, so it costs nothing when off
+
+    OPCODES = ("VA", "SP", "ID", "OU", "HM", "PX", "PY", "PZ")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self._histograms = {}
+        self._in_flight = deque()  # (opcode, send time) of each command awaiting its 'ok!', oldest first
+        self._start_time = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._in_flight.clear()
+            self._start_time = time.time()
+
+    def record(self, name, seconds):
+        # record a duration under the given histogram name
+        with self._lock:
+            histogram = self._histograms.get(name, None)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @staticmethod
+    def getOpcode(command):
+        opcode = command[:2].decode("ascii", "replace")
+        return opcode if opcode in LinkProfiler.OPCODES else "other"
+
+    def commandSent(self, command):
+        # call right after a command that the fisnar answers with 'ok!' is written to it
+        self._in_flight.append((LinkProfiler.getOpcode(command), time.perf_counter()))
+
+    def okReceived(self):
+        # call when 'ok!' is received from the fisnar - it answers the oldest command in flight
+        if len(self._in_flight) > 0:
+            opcode, send_time = self._in_flight.popleft()
+            self.record("latency_" + opcode, time.perf_counter() - send_time)
+
+    def clearInFlight(self):
+        # forget the commands in flight - for when the connection is closed or reopened
+        self._in_flight.clear()
+
+    def getHistogram(self, name):
+        return self._histograms.get(name, None)
+
+    def toDict(self):
+        with self._lock:
+            return {
+                "start_time": self._start_time,
+                "duration": time.time() - self._start_time,
+                "histograms": {name: histogram.toDict() for name, histogram in sorted(self._histograms.items())}
+            }
+
+    def toJson(self):
+        return json.dumps(self.toDict(), indent=2)
+
+    def getSummary(self):
+        # get a short human readable summary of the recorded histograms
+        lines = []
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                lines.append(f"{name}: n={histogram.getCount()}, total={histogram.getTotal():.2f}s, p50={1000 * histogram.getPercentile(50):.2f}ms, p99={1000 * histogram.getPercentile(99):.2f}ms")
+        if len(lines) == 0:
+            return "No RS232 activity recorded yet."
+        return "\n".join(lines)
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import deque
+from UM.Logger import Logger
+
+
+class PluginLogger:
+    # level-gated wrapper around the cura Logger. The level is checked before the message
+    # is formatted, so messages below the level cost a comparison and nothing else. Messages
+    # are given as a format string and arguments, which are only combined when logged
+
+    LEVELS = {"d": 10, "i": 20, "w": 30, "e": 40, "c": 50}
+
+    def __init__(self, level="i"):
+        self._level = PluginLogger.LEVELS["i"]
+        self.debug_enabled = False  # plain attribute, so hot paths can check it without a function call
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        # level: one of the cura log levels ('d', 'i', 'w', 'e', 'c')
+        if level not in PluginLogger.LEVELS:
+            Logger.log("w", f"unrecognized log level '{level}', using 'i'")
+            level = "i"
+        self._level = PluginLogger.LEVELS[level]
+        self.debug_enabled = self._level <= PluginLogger.LEVELS["d"]
+
+    def isEnabledFor(self, level):
+        return PluginLogger.LEVELS[level] >= self._level
+
+    def log(self, level, message, *args):
+        if PluginLogger.LEVELS[level] < self._level:
+            return
+        Logger.log(level, message % args if args else message)
+
+
+class TraceRing:
+    # bounded in-memory trace of the bytes sent to and received from a serial device, for
+    # post-mortem use. When a flush path is given the trace is also appended to that file by
+    # a background thread, so the thread doing the serial I/O never touches the file.
+    # Callers should check 'enabled' before calling add() - with tracing off that attribute
+    # check is the only cost
+
+    SEND = ">"
+    RECEIVE = "<"
+
+    def __init__(self, capacity=10000, flush_interval=2.0):
+        self.enabled = False
+        self._ring = deque(maxlen=capacity)
+        self._unflushed = deque(maxlen=capacity)  # oldest entries are dropped if the flush thread can't keep up
+        self._flush_interval = flush_interval
+        self._flush_path = None
+        self._flush_thread = None
+        self._stop_flushing = threading.Event()
+
+    def enable(self, flush_path=None):
+        # start tracing, flushing the trace to the given file if one is given
+        if self.enabled:
+            self.disable()
+        self._flush_path = flush_path
+        self.enabled = True
+        if flush_path is not None:
+            self._stop_flushing.clear()
+            self._flush_thread = threading.Thread(target=self._flushLoop, daemon=True, name="FisnarRobotPlugin Trace Flush")
+            self._flush_thread.start()
+
+    def disable(self):
+        # stop tracing. Anything not yet flushed is written before returning
+        self.enabled = False
+        if self._flush_thread is not None:
+            self._stop_flushing.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        self._flush_path = None
+
+    def add(self, direction, data):
+        # direction: TraceRing.SEND or TraceRing.RECEIVE, data: the bytes sent or received
+        entry = (time.time(), direction, data)
+        self._ring.append(entry)
+        if self._flush_path is not None:
+            self._unflushed.append(entry)
+
+    def getEntries(self):
+        return list(self._ring)
+
+    def clear(self):
+        self._ring.clear()
+        self._unflushed.clear()
+
+    @staticmethod
+    def formatEntry(entry):
+        return f"{entry[0]:.6f} {entry[1]} {entry[2]!r}"
+
+    def dump(self, path):
+        # write the whole in-memory trace to the given file
+        with open(path, "w") as dump_file:
+            for entry in self.getEntries():
+                dump_file.write(TraceRing.formatEntry(entry) + "\n")
+
+    def _flushLoop(self):
+        while not self._stop_flushing.wait(self._flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        if len(self._unflushed) == 0:
+            return
+        lines = []
+        while len(self._unflushed) > 0:
+            lines.append(TraceRing.formatEntry(self._unflushed.popleft()) + "\n")
+        try:
+            with open(self._flush_path, "a") as trace_file:
+                trace_file.writelines(lines)
+        except OSError:
+            Logger.log("w", f"could not write trace to {self._flush_path}")
@@ -0,0 +1,94 @@
+import numpy
+import threading
+import time
+
+
+class PositionTelemetry:
+    # class for storing position samples (time, x, y, z, command index, output states) taken
+    # while the fisnar is connected. Recent samples are kept at full resolution in a fixed size
+    # ring buffer, and every sample is also offered to a fixed size history buffer that keeps
+    # the whole print at a decreasing resolution (when it fills up, every other sample is
+    # dropped and only every other new sample is kept). Memory use is bounded no matter how
+    # long the print is, and readers can get a decimated view of either buffer for the UI
+
+    SAMPLE_DTYPE = numpy.dtype([
+        ("time", numpy.float64),
+        ("x", numpy.float32),
+        ("y", numpy.float32),
+        ("z", numpy.float32),
+        ("index", numpy.int64),
+        ("outputs", numpy.uint8)  # bit n is set if output n + 1 is on
+    ])
+
+    def __init__(self, capacity=4096, history_capacity=2048):
+        self._lock = threading.Lock()
+
+        self._samples = numpy.zeros(capacity, dtype=PositionTelemetry.SAMPLE_DTYPE)
+        self._num_samples = 0  # total number of samples ever added
+
+        self._history = numpy.zeros(history_capacity, dtype=PositionTelemetry.SAMPLE_DTYPE)
+        self._history_length = 0
+        self._history_stride = 1  # only every _history_stride'th sample is added to the history
+
+    def clear(self):
+        with self._lock:
+            self._num_samples = 0
+            self._history_length = 0
+            self._history_stride = 1
+
+    def addSample(self, position, command_index, outputs, sample_time=None):
+        # add a position sample. outputs is a list of output states (True if on)
+        output_bits = 0
+        for i in range(len(outputs)):
+            if outputs[i]:
+                output_bits |= 1 << i
+        sample = (time.time() if sample_time is None else sample_time, position[0], position[1], position[2], command_index, output_bits)
+
+        with self._lock:
+            self._samples[self._num_samples % len(self._samples)] = sample
+            if self._num_samples % self._history_stride == 0:
+                if self._history_length == len(self._history):  # history full - halve its resolution
+                    self._history[:self._history_length // 2] = self._history[0:self._history_length:2]
+                    self._history_length //= 2
+                    self._history_stride *= 2
+                self._history[self._history_length] = sample
+                self._history_length += 1
+            self._num_samples += 1
+
+    def getNumSamples(self):
+        # get the total number of samples that have been added - can be used to tell if
+        # there are new samples since the last read
+        return self._num_samples
+
+    def getLatest(self):
+        # get the most recent sample, or None if there are no samples
+        with self._lock:
+            if self._num_samples == 0:
+                return None
+            return self._samples[(self._num_samples - 1) % len(self._samples)].copy()
+
+    def getRecent(self, max_points=None):
+        # get the samples in the ring buffer (oldest first), decimated to at most max_points samples
+        with self._lock:
+            if self._num_samples <= len(self._samples):
+                samples = self._samples[:self._num_samples].copy()
+            else:
+                split = self._num_samples % len(self._samples)
+                samples = numpy.concatenate((self._samples[split:], self._samples[:split]))
+        return PositionTelemetry.decimate(samples, max_points)
+
+    def getHistory(self, max_points=None):
+        # get samples covering everything since the last clear (oldest first), decimated to at most max_points samples
+        with self._lock:
+            samples = self._history[:self._history_length].copy()
+        return PositionTelemetry.decimate(samples, max_points)
+
+    @staticmethod
+    def decimate(samples, max_points):
+        # evenly pick at most max_points samples from the given samples, always keeping the last one
+        if max_points is None or len(samples) <= max_points:
+            return samples
+        if max_points <= 0:
+            return samples[:0]
+        indices = numpy.linspace(0, len(samples) - 1, max_points).round().astype(int)
+        return samples[indices]
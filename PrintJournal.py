@@ -0,0 +1,211 @@
+import hashlib
+import os
+import time
+from collections import deque
+from UM.Logger import Logger
+from .FisnarCommands import FisnarCommands
+
+
+class PrintJournal:
+    # append-only journal of print progress, so a print that is interrupted by a disconnect or
+    # crash can be resumed. When a print starts, the compiled program (list of command bytes)
+    # is saved next to the journal, and the journal records its hash. As commands are
+    # acknowledged by the fisnar the last acknowledged index is appended, but the file is only
+    # written and fsynced in batches so the RS232 thread isn't slowed down. A finished or
+    # terminated print is marked as done, so only interrupted prints can be resumed.
+    #
+    # the fisnar answers every command it's sent with an 'ok!', in order, but more than one
+    # command can be in flight (a print keeps two, and output commands go to the dispensers
+    # without waiting for the fisnar). So the program index of each command sent is queued
+    # with commandSent(), and each 'ok!' acknowledges the oldest one (see okReceived()).
+    #
+    # journal lines: 'program <hash> <number of commands>', 'resume <index>', 'ack <index>', 'done'
+
+    ACK_BATCH_SIZE = 250  # commands acknowledged between journal writes
+    ACK_BATCH_INTERVAL = 2.0  # sec - max time between journal writes while printing
+
+    def __init__(self, journal_path):
+        self._journal_path = journal_path
+        self._program_path = journal_path + ".program"
+        self._journal_file = None
+        self._last_ack = -1
+        self._last_written_ack = -1
+        self._last_write_time = 0.0
+        self._in_flight = deque()  # program index of each command awaiting its 'ok!', oldest first (None if not part of the program)
+
+    @staticmethod
+    def getProgramHash(command_bytes):
+        program_hash = hashlib.sha1()
+        for command in command_bytes:
+            program_hash.update(command)
+            program_hash.update(b"\n")
+        return program_hash.hexdigest()
+
+    def begin(self, command_bytes, start_index=0):
+        # start journaling a print of the given compiled program, from the given index
+        self._closeJournalFile()
+        self._last_ack = self._last_written_ack = start_index - 1
+        for i in range(len(self._in_flight)):  # commands still in flight belong to whatever was sent before this print
+            self._in_flight[i] = None
+        try:
+            if start_index == 0:  # new print - save the program and start a new journal
+                with open(self._program_path, "wb") as program_file:
+                    program_file.write(b"\n".join(command_bytes))
+                    program_file.flush()
+                    os.fsync(program_file.fileno())
+                self._journal_file = open(self._journal_path, "w")
+                self._journal_file.write(f"program {PrintJournal.getProgramHash(command_bytes)} {len(command_bytes)}\n")
+            else:  # resumed print - keep appending to the existing journal
+                self._journal_file = open(self._journal_path, "a")
+                self._journal_file.write(f"resume {start_index}\n")
+            self._sync()
+        except OSError:
+            Logger.log("w", f"could not write print journal to {self._journal_path}, print won't be resumable")
+            self._closeJournalFile()
+
+    def commandSent(self, index=None):
+        # record that a command was written to the fisnar - index is its index in the program, or
+        # None for commands that aren't part of the program (position queries, pause moves, etc.)
+        self._in_flight.append(index)
+
+    def okReceived(self):
+        # the fisnar answered the oldest command in flight - acknowledge it if it's part of the program
+        if len(self._in_flight) == 0:
+            return
+        index = self._in_flight.popleft()
+        if index is not None:
+            self.acknowledge(index)
+
+    def clearInFlight(self):
+        # forget the commands in flight - for when the connection is closed or reopened
+        self._in_flight.clear()
+
+    def acknowledge(self, index):
+        # record that the command at the given index has been acknowledged by the fisnar
+        self._last_ack = index
+        if self._journal_file is None:
+            return
+        if index - self._last_written_ack >= PrintJournal.ACK_BATCH_SIZE or time.monotonic() - self._last_write_time >= PrintJournal.ACK_BATCH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        # write the last acknowledged index to the journal now
+        if self._journal_file is None or self._last_ack == self._last_written_ack:
+            return
+        try:
+            self._journal_file.write(f"ack {self._last_ack}\n")
+            self._sync()
+            self._last_written_ack = self._last_ack
+        except OSError:
+            Logger.log("w", f"could not write to print journal {self._journal_path}")
+
+    def finish(self):
+        # mark the print as done (finished or terminated by the user), so it can't be resumed
+        if self._journal_file is None:
+            return
+        try:
+            self._journal_file.write("done\n")
+            self._sync()
+        except OSError:
+            Logger.log("w", f"could not write to print journal {self._journal_path}")
+        self._closeJournalFile()
+
+    def interrupt(self):
+        # the print was interrupted - write everything acknowledged so far and close the journal
+        self.flush()
+        self._closeJournalFile()
+
+    def _sync(self):
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+        self._last_write_time = time.monotonic()
+
+    def _closeJournalFile(self):
+        if self._journal_file is not None:
+            try:
+                self._journal_file.close()
+            except OSError:
+                pass
+            self._journal_file = None
+
+    def getInterruptedPrint(self):
+        # get (command bytes, last acknowledged index) of an interrupted print, or None if
+        # there isn't one or the saved program doesn't match the journal
+        if self._journal_file is not None or not os.path.isfile(self._journal_path) or not os.path.isfile(self._program_path):
+            return None
+
+        program_hash = None
+        num_commands = None
+        last_ack = -1
+        try:
+            with open(self._journal_path, "r") as journal_file:
+                for line in journal_file:
+                    fields = line.split()
+                    if len(fields) == 0:
+                        continue
+                    elif fields[0] == "program" and len(fields) == 3:
+                        program_hash, num_commands, last_ack = fields[1], int(fields[2]), -1
+                    elif fields[0] in ("ack", "resume") and len(fields) == 2:
+                        last_ack = max(last_ack, int(fields[1]) - (1 if fields[0] == "resume" else 0))
+                    elif fields[0] == "done":
+                        return None
+            with open(self._program_path, "rb") as program_file:
+                command_bytes = program_file.read().split(b"\n")
+        except (OSError, ValueError):
+            Logger.log("w", f"could not read print journal {self._journal_path}")
+            return None
+
+        if program_hash is None or len(command_bytes) != num_commands or PrintJournal.getProgramHash(command_bytes) != program_hash:
+            Logger.log("w", "print journal doesn't match the saved program, print can't be resumed")
+            return None
+        if last_ack < 0:
+            return None  # nothing was printed
+        return command_bytes, last_ack
+
+    def discard(self):
+        # discard an interrupted print so it isn't offered again
+        self._closeJournalFile()
+        for path in (self._journal_path, self._program_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def getResumePoint(command_bytes, last_ack):
+        # get the index to resume a print at, given the last acknowledged command index, and the
+        # commands to send before resuming. The resume index is the first command after the last
+        # acknowledged ID - the move queue is empty there and every move before it has been
+        # executed, so it's the last safe extrusion segment boundary. The commands to send first
+        # restore the fisnar state at that index: the line speed, a move to the position (with
+        # the outputs off) and the outputs that should be on
+        outputs_on = {}
+        line_speed_command = None
+        position_command = None
+        resume_index = None
+        resume_state = None
+        for i in range(min(last_ack + 1, len(command_bytes))):
+            command = command_bytes[i]
+            if command[:3] == b"OU ":
+                outputs_on[command[3:4]] = command[6:7] == b"1"
+            elif command[:3] == b"SP ":
+                line_speed_command = command
+            elif command[:3] == b"VA ":
+                position_command = command
+            elif command[:2] == b"ID":
+                resume_index = i + 1
+                resume_state = (line_speed_command, position_command, [output for output in sorted(outputs_on) if outputs_on[output]])
+
+        if resume_index is None:  # nothing has been executed, so start from the beginning
+            return 0, []
+
+        line_speed_command, position_command, outputs = resume_state
+        restore_commands = []
+        if line_speed_command is not None:
+            restore_commands.append(line_speed_command)
+        if position_command is not None:
+            restore_commands.append(position_command)
+            restore_commands.append(FisnarCommands.ID())
+        for output in outputs:
+            restore_commands.append(FisnarCommands.OU(int(output), 1))
+        return resume_index, restore_commands
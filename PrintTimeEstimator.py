@@ -0,0 +1,106 @@
+import numpy
+from .FisnarCommands import FisnarCommands
+
+
+class PrintTimeEstimator:
+    # class for estimating the time a compiled fisnar program (list of command bytes, as
+    # returned by Converter.fisnarCommandsToBytes()) takes to print. Movement time is
+    # calculated from the length of each VA move and the line speed in effect, and each
+    # command adds a fixed overhead for the RS232 round trip (and the stop for ID, and the
+    # dispenser command for output toggles). All calculations are done once, up front, so
+    # the progress and time remaining for any command index are just lookups
+
+    COMMAND_ROUND_TRIP_TIME = 0.01  # sec - sending a command and receiving 'ok!'
+    ID_STOP_TIME = 0.05  # sec - decelerating to a full stop and accelerating again
+    DISPENSER_TOGGLE_TIME = 0.02  # sec - sending the toggle command to the UltimusV
+    DEFAULT_LINE_SPEED = 30.0  # mm/sec - fisnar speed before any SP command is sent
+
+    def __init__(self, command_bytes):
+        num_commands = len(command_bytes)
+        points = numpy.full((num_commands, 3), numpy.nan)
+        speeds = numpy.full(num_commands, numpy.nan)
+        overheads = numpy.full(num_commands, PrintTimeEstimator.COMMAND_ROUND_TRIP_TIME)
+        output_states = {}
+
+        for i in range(num_commands):
+            command = command_bytes[i]
+            if command[:3] == b"VA ":
+                points[i] = [float(coord) for coord in command[3:-1].split(b",")]
+            elif command[:3] == b"SP ":
+                speeds[i] = float(command[3:-1])
+            elif command == FisnarCommands.ID():
+                overheads[i] += PrintTimeEstimator.ID_STOP_TIME
+            elif command[:3] == b"OU ":  # handled by the dispensers - only costs time on a change in state
+                output, state = command[3:-1].split(b",")
+                if output_states.get(output, b" 0") != state:
+                    overheads[i] = PrintTimeEstimator.DISPENSER_TOGGLE_TIME
+                else:
+                    overheads[i] = 0.0
+                output_states[output] = state
+
+        # forward filling positions and speeds so every command knows the current position and speed
+        is_move = ~numpy.isnan(points[:, 0])
+        last_point_index = numpy.maximum.accumulate(numpy.where(is_move, numpy.arange(num_commands), 0))
+        filled_points = points[last_point_index]
+        if num_commands > 0 and numpy.any(is_move):
+            filled_points[:numpy.argmax(is_move)] = points[numpy.argmax(is_move)]  # no movement before the first VA
+        is_speed = ~numpy.isnan(speeds)
+        last_speed_index = numpy.maximum.accumulate(numpy.where(is_speed, numpy.arange(num_commands), -1)) if num_commands > 0 else numpy.array([], dtype=int)
+        filled_speeds = numpy.where(last_speed_index >= 0, speeds[numpy.maximum(last_speed_index, 0)], PrintTimeEstimator.DEFAULT_LINE_SPEED)
+
+        # movement time of each VA
+        move_lengths = numpy.zeros(num_commands)
+        if num_commands > 1:
+            move_lengths[1:] = numpy.linalg.norm(numpy.diff(filled_points, axis=0), axis=1)
+        move_lengths = numpy.nan_to_num(move_lengths)
+        move_times = numpy.where(is_move, move_lengths / numpy.maximum(filled_speeds, 1e-6), 0.0)
+
+        self._command_times = overheads + move_times
+        self._cumulative_times = numpy.concatenate(([0.0], numpy.cumsum(self._command_times)))
+
+        # grouping commands into layers by fisnar z, numbered in the order the heights are first reached
+        layer_z = numpy.round(numpy.nan_to_num(filled_points[:, 2]), 3)
+        unique_z, first_index, inverse = numpy.unique(layer_z, return_index=True, return_inverse=True)
+        order = numpy.argsort(first_index)
+        layer_numbers = numpy.empty(len(order), dtype=int)
+        layer_numbers[order] = numpy.arange(len(order))
+        self._command_layers = layer_numbers[inverse.ravel()]
+        self._layer_z = unique_z[order]
+        self._layer_times = numpy.bincount(inverse.ravel(), weights=self._command_times, minlength=len(order))[order]
+
+    def getTotalTime(self):
+        # get the estimated total print time in seconds
+        return float(self._cumulative_times[-1])
+
+    def getElapsedTime(self, command_index):
+        # get the estimated time (sec) taken to send all commands before the given index
+        command_index = min(max(command_index, 0), len(self._cumulative_times) - 1)
+        return float(self._cumulative_times[command_index])
+
+    def getRemainingTime(self, command_index):
+        # get the estimated time (sec) remaining after all commands before the given index are sent
+        return self.getTotalTime() - self.getElapsedTime(command_index)
+
+    def getProgress(self, command_index):
+        # get the time-weighted progress (0 to 1) of the print at the given command index
+        total_time = self.getTotalTime()
+        if total_time == 0.0:
+            return None
+        return self.getElapsedTime(command_index) / total_time
+
+    def getLayerTimes(self):
+        # get the estimated time spent at each height as a list of [fisnar z, time (sec)], in the order
+        # the heights are first reached. Fisnar z is inverted, so layers go from high to low z values
+        return [[float(z), float(layer_time)] for z, layer_time in zip(self._layer_z, self._layer_times)]
+
+    def getNumLayers(self):
+        # get the number of layers (heights) in the program
+        return len(self._layer_times)
+
+    def getLayer(self, command_index):
+        # get the number (0 based, in the order of getLayerTimes()) of the layer the command at the
+        # given index is in, or None if the program is empty
+        if len(self._command_layers) == 0:
+            return None
+        command_index = min(max(command_index, 0), len(self._command_layers) - 1)
+        return int(self._command_layers[command_index])
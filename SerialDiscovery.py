@@ -0,0 +1,281 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import threading
+import time
+from UM.Logger import Logger
+
+try:
+    from serial.tools import list_ports
+except ImportError:  # port enumeration isn't available, so every configured port is assumed to be present
+    list_ports = None
+
+
+class SerialPortWatcher:
+    # watches for serial ports being added or removed. On linux, inotify is used to wake up as
+    # soon as a device node is created or deleted in /dev. Everywhere else (or if inotify isn't
+    # available) the port list is polled, which is cheap enough to do a couple of times a second
+
+    POLL_INTERVAL = 0.5  # sec
+    SETTLE_TIME = 0.1  # sec - time for udev to finish setting up a new device node
+
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    def __init__(self, on_ports_changed):
+        # on_ports_changed: called with (added ports, removed ports) from the watcher thread
+        self._on_ports_changed = on_ports_changed
+        self._ports = SerialPortWatcher.listPorts()
+        self._running = False
+        self._inotify_fd = None
+        self._thread = None
+
+    @staticmethod
+    def listPorts():
+        # get the set of serial port device names currently present
+        if list_ports is None:
+            return set()
+        try:
+            return set(port.device for port in list_ports.comports())
+        except Exception as e:  # enumeration can fail on some platforms - ports will be assumed present
+            Logger.log("w", f"could not enumerate serial ports: {str(e)}")
+            return set()
+
+    def getPorts(self):
+        return set(self._ports)
+
+    def isPresent(self, port_name):
+        # True if the port is present (or might be - ports that can't be enumerated are assumed present)
+        return list_ports is None or port_name in self._ports or os.path.exists(port_name)
+
+    def start(self):
+        self._running = True
+        self._inotify_fd = SerialPortWatcher._openInotify()
+        Logger.log("i", "serial port watcher using " + ("inotify" if self._inotify_fd is not None else f"polling every {SerialPortWatcher.POLL_INTERVAL} sec"))
+        self._thread = threading.Thread(target=self._run, daemon=True, name="FisnarRobotPlugin Serial Port Watcher")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    @staticmethod
+    def _openInotify():
+        # get an inotify file descriptor watching /dev, or None if inotify isn't available
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, b"/dev", SerialPortWatcher.IN_CREATE | SerialPortWatcher.IN_DELETE) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _run(self):
+        while self._running:
+            if self._inotify_fd is not None:
+                readable, _, _ = select.select([self._inotify_fd], [], [], 1.0)
+                if len(readable) == 0:
+                    continue
+                try:
+                    while len(os.read(self._inotify_fd, 4096)) > 0:  # discard the events, the ports are enumerated again anyways
+                        pass
+                except (BlockingIOError, OSError):
+                    pass
+                time.sleep(SerialPortWatcher.SETTLE_TIME)
+            else:
+                time.sleep(SerialPortWatcher.POLL_INTERVAL)
+
+            ports = SerialPortWatcher.listPorts()
+            if ports != self._ports:
+                added, removed = ports - self._ports, self._ports - ports
+                self._ports = ports
+                Logger.log("i", f"serial ports changed - added: {sorted(added)}, removed: {sorted(removed)}")
+                self._on_ports_changed(added, removed)
+
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+
+class SerialDiscoveryService:
+    # keeps serial devices (the fisnars and dispensers) connected. Each device is registered as
+    # a target with functions to get its port name, check if it's connected, connect it and
+    # (optionally) close it. Connection attempts are made as soon as a target's port appears (or
+    # its port name is changed), each on its own thread so a slow device doesn't hold up the others. Each target
+    # has its own timeout, and attempts in progress can be cancelled. Failed attempts are
+    # retried with exponential backoff. The time taken for the first round of attempts (from
+    # start() until every target tried has connected or failed) is the startup time. When a
+    # target's port disappears (the device was unplugged), it's closed straight away, so it's
+    # reconnected as soon as the port appears again instead of keeping a dead handle
+
+    INITIAL_BACKOFF = 0.25  # sec
+    MAX_BACKOFF = 30.0  # sec
+    HOUSEKEEPING_INTERVAL = 1.0  # sec - max time between checks for disconnected targets
+
+    class Target:
+        def __init__(self, name, get_port_name, is_connected, connect, on_connected, timeout, close):
+            self.name = name
+            self.get_port_name = get_port_name
+            self.is_connected = is_connected
+            self.connect = connect
+            self.close = close
+            self.on_connected = on_connected
+            self.timeout = timeout
+            self.cancel = None  # cancel event of the attempt in progress
+            self.backoff = 0.0
+            self.next_attempt_time = 0.0
+            self.last_port_name = None
+            self.attempting = False
+
+    def __init__(self):
+        self._targets = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._watcher = SerialPortWatcher(self._onPortsChanged)
+        self._thread = None
+
+        # startup time metric
+        self._start_time = None
+        self._startup_targets = None  # targets tried in the first round that haven't finished yet
+        self._startup_time = None
+        self.on_startup_complete = None  # called with (startup time, names connected, names not connected)
+        self._startup_results = ([], [])
+
+    def addTarget(self, name, get_port_name, is_connected, connect, on_connected=None, timeout=None, close=None):
+        # get_port_name() -> str or None, is_connected() -> bool, connect(port_name, timeout, cancel)
+        # blocks until connected, failed, timed out or cancelled, on_connected(port_name) is
+        # called after a successful attempt, and close() is called when the target's port is removed
+        with self._lock:
+            self._targets.append(SerialDiscoveryService.Target(name, get_port_name, is_connected, connect, on_connected, timeout, close))
+        self.wake()
+
+    def cancel(self, name=None):
+        # cancel the attempt in progress for the target with the given name (all targets by default)
+        with self._lock:
+            for target in self._targets:
+                if target.cancel is not None and (name is None or target.name == name):
+                    target.cancel.set()
+
+    def getStartupTime(self):
+        # time (sec) the first round of connection attempts took, or None if it isn't done yet
+        return self._startup_time
+
+    def start(self):
+        self._running = True
+        self._start_time = time.monotonic()
+        self._watcher.start()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="FisnarRobotPlugin Serial Discovery")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._watcher.stop()
+        self.cancel()
+        self._wake.set()
+
+    def wake(self, *args):
+        # check the targets now (e.g. after a port name was changed) - any arguments are ignored, so this can be connected to signals
+        self._wake.set()
+
+    def _onPortsChanged(self, added, removed):
+        unplugged = []  # connected targets whose port was removed
+        with self._lock:
+            for target in self._targets:
+                port_name = target.get_port_name()
+                if port_name in removed:  # device unplugged - any handle to it is dead
+                    if target.cancel is not None:
+                        target.cancel.set()
+                    if target.close is not None and target.is_connected():
+                        unplugged.append((target, port_name))
+                if port_name in added:  # a target whose port just appeared is tried straight away
+                    target.backoff = 0.0
+                    target.next_attempt_time = 0.0
+
+        for target, port_name in unplugged:  # closed without the lock held, as closing can take a moment
+            Logger.log("i", f"{target.name} port {port_name} was removed, closing it")
+            try:
+                target.close()
+            except Exception as e:
+                Logger.log("w", f"unexpected error while closing {target.name}: {str(e)}")
+        self._wake.set()
+
+    def _run(self):
+        while self._running:
+            now = time.monotonic()
+            next_check = now + SerialDiscoveryService.HOUSEKEEPING_INTERVAL
+            with self._lock:
+                first_round = self._startup_targets is None
+                if first_round:
+                    self._startup_targets = set()
+                for target in self._targets:
+                    if target.attempting or target.is_connected():
+                        continue
+                    port_name = target.get_port_name()
+                    if port_name in (None, "None"):
+                        continue
+                    if port_name != target.last_port_name:  # port changed by the user - try it straight away
+                        target.last_port_name = port_name
+                        target.backoff = 0.0
+                        target.next_attempt_time = 0.0
+                    if not self._watcher.isPresent(port_name):
+                        continue  # tried as soon as it appears
+                    if target.next_attempt_time <= now:
+                        target.attempting = True
+                        target.cancel = threading.Event()
+                        if first_round:
+                            self._startup_targets.add(target)
+                        threading.Thread(target=self._attempt, args=(target, port_name), daemon=True, name=f"FisnarRobotPlugin Connect {target.name}").start()
+                    else:
+                        next_check = min(next_check, target.next_attempt_time)
+                if first_round and len(self._startup_targets) == 0:
+                    self._onStartupComplete()
+
+            self._wake.wait(max(next_check - time.monotonic(), 0.0))
+            self._wake.clear()
+
+    def _attempt(self, target, port_name):
+        attempt_start = time.monotonic()
+        try:
+            target.connect(port_name, target.timeout, target.cancel)
+        except Exception as e:
+            Logger.log("w", f"unexpected error while connecting {target.name} via {port_name}: {str(e)}")
+
+        with self._lock:
+            target.attempting = False
+            target.cancel = None
+            connected = target.is_connected()
+            Logger.log("i", f"{target.name} connection attempt via {port_name} {'succeeded' if connected else 'failed'} in {time.monotonic() - attempt_start:.2f} sec")
+            if target in self._startup_targets:
+                self._startup_targets.discard(target)
+                self._startup_results[0 if connected else 1].append(target.name)
+                if len(self._startup_targets) == 0:
+                    self._onStartupComplete()
+            if connected:
+                target.backoff = 0.0
+                target.next_attempt_time = 0.0
+            else:
+                target.backoff = min(max(2 * target.backoff, SerialDiscoveryService.INITIAL_BACKOFF), SerialDiscoveryService.MAX_BACKOFF)
+                target.next_attempt_time = time.monotonic() + target.backoff
+                Logger.log("d", f"{target.name} didn't connect via {port_name}, will retry in {target.backoff} sec")
+
+        if target.is_connected() and target.on_connected is not None:
+            target.on_connected(port_name)
+        self._wake.set()
+
+    def _onStartupComplete(self):
+        # called (with the lock held) when every target tried in the first round has finished
+        if self._startup_time is not None:
+            return
+        self._startup_time = time.monotonic() - self._start_time
+        connected, not_connected = self._startup_results
+        Logger.log("i", f"startup connections done in {self._startup_time:.2f} sec - connected: {connected}, not connected: {not_connected}")
+        if self.on_startup_complete is not None:
+            self.on_startup_complete(self._startup_time, list(connected), list(not_connected))
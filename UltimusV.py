@@ -115,7 +115,9 @@ class UltimusV(Peripheral):
     def getComPort(self):
         return self._serial_port_name
 
-    def connect(self, port_name=None):
+    def connect(self, port_name=None, timeout=None, cancel=None):
+        # connect to the dispenser. timeout (sec, optional) is how long the dispenser has to respond
+        # to the test command, and the attempt is given up if the cancel event (optional) is set
         if port_name is None and self._serial_port_name is None:
             return
         else:
@@ -126,7 +128,7 @@ class UltimusV(Peripheral):
 
         if self._serial is None:
             try:
-                self._serial = Serial(self._serial_port_name, self._baud_rate, timeout=self._timeout, write_timeout=self._timeout)
+                self._serial = Serial(self._serial_port_name, self._baud_rate, timeout=self._timeout if timeout is None else timeout, write_timeout=self._timeout)
                 Logger.log("i", f"Serial port {self._serial_port_name} is open. Testing if the UltimusV dispenser is on...")
             except SerialException:
                 Logger.log("w", "Exception occured when trying to create serial connection")
@@ -141,9 +143,15 @@ class UltimusV(Peripheral):
                 err_msg.show()
                 return
 
+        if cancel is not None and cancel.is_set():
+            Logger.log("i", f"{self.display_name} connection attempt cancelled")
+            self.close()
+            return
+
         self.setConnectionState(ConnectionState.Connecting)
         success = self.testConnection()
         if success:  # successfully initialized
+            self._serial.timeout = self._timeout
             Logger.log("i", f"{self.display_name} succesfully connected via {self._serial_port_name}")
             self.setConnectionState(ConnectionState.Connected)
         else:
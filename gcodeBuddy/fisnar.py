@@ -1,3 +1,21 @@
+# integer opcodes for the commands in fisnar programs made by the converter. They carry on from
+# the g-code opcodes in marlin.py, so an opcode names one command whichever side it's from. Fisnar
+# programs are lists of [opcode, parameters...] from conversion to the byte compiler - the
+# command names are only used in the CSV format
+OP_DUMMY_POINT = 8
+OP_LINE_START = 9
+OP_LINE_PASSING = 10
+OP_LINE_END = 11
+OP_OUTPUT = 12
+OP_LINE_SPEED = 13
+OP_Z_CLEARANCE = 14
+OP_END_PROGRAM = 15
+
+COMMAND_NAMES = {OP_DUMMY_POINT: "Dummy Point", OP_LINE_START: "Line Start", OP_LINE_PASSING: "Line Passing", OP_LINE_END: "Line End",
+                 OP_OUTPUT: "Output", OP_LINE_SPEED: "Line Speed", OP_Z_CLEARANCE: "Z Clearance", OP_END_PROGRAM: "End Program"}
+NAME_OPCODES = {name: opcode for opcode, name in COMMAND_NAMES.items()}
+
+
 def get_fisnar_commands(**kwargs):
     """
     get a list of the fisnar commands with a specified filter
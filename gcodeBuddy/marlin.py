@@ -1,18 +1,55 @@
 import sys
+from array import array
+from math import isnan
+from types import MappingProxyType
 import numpy as np
 
 from . import angle, Arc, centers_from_params
 
 from UM.Logger import Logger
 
+# integer opcodes for the commands that g-code conversion acts on, so that the converter
+# compares small ints instead of command strings. All other commands are OP_OTHER
+OP_OTHER = 0
+OP_G0 = 1
+OP_G1 = 2
+OP_G2 = 3
+OP_G3 = 4
+OP_G90 = 5
+OP_G91 = 6
+OP_TOOL_CHANGE = 7
+
+OPCODES = {"G0": OP_G0, "G1": OP_G1, "G2": OP_G2, "G3": OP_G3, "G90": OP_G90, "G91": OP_G91}
+
+
+class UnknownCommandError(ValueError):
+    """
+    raised when a line of g-code isn't a recognized Marlin command
+    """
+
+
 class Command:
     """
     represents line of Marlin g-code
 
+    the common parameters (X, Y, Z, E, F, I, J and R) are stored in slots, and are None if the
+    command doesn't have them. Any other parameters are kept in a dictionary that is only created
+    for commands that have them, so parsing large files doesn't allocate a dictionary per line.
+    The order the parameters appeared in is kept as a tuple of parameter keys, shared by all
+    commands with the same order (see PARAM_ORDERS). To parse a whole file, use CommandTable
+
     :param init_string: line of Marlin g-code
     :type init_string: str
     """
 
+    __slots__ = ("command", "opcode", "tool", "x", "y", "z", "e", "f", "i", "j", "r", "other_params", "order")
+
+    # slot names of the common parameters
+    PARAM_SLOTS = {"X": "x", "Y": "y", "Z": "z", "E": "e", "F": "f", "I": "i", "J": "j", "R": "r"}
+
+    # every distinct parameter order seen, so that commands share one tuple per order
+    PARAM_ORDERS = {(): ()}
+
     def __init__(self, init_string):
         """
         initialization method
@@ -20,46 +57,80 @@ class Command:
 
         err_msg = "Error in marlin.gcode_command.__init__(): "
 
-        no_parameter_commands = ["M84"]  # list of commands that don't require a value after the parameters
+        no_parameter_commands = ("M84",)  # commands that don't require a value after the parameters
 
         if len(init_string) == 0:
             raise ValueError("initialization string can't be empty")
 
-        # removing extraneous spaces
-        command_string = init_string
-        while command_string[0] == " ":
-            command_string = command_string[1:]
-        while command_string[-1] == " ":
-            command_string = command_string[:-1]
-        ind = 0
-        while (ind + 1) < len(command_string):
-            if command_string[ind] == " " and command_string[ind + 1] == " ":
-                command_string = command_string[:ind] + command_string[(ind + 1):]
-            else:
-                ind += 1
+        # splitting on (any amount of) spaces
+        command_list = init_string.split()
+        if len(command_list) == 0:
+            raise ValueError("initialization string can't be only spaces")
 
         # ensuring valid command
-        command_list = command_string.split(" ")
-        if command_list[0] in marlin_commands():
-            self.command = command_list[0]
-            command_list = command_list[1:]
+        if command_list[0] in MARLIN_COMMANDS:
+            self.command = sys.intern(command_list[0])
+        else:
+            raise UnknownCommandError("Unrecognized Marlin command passed in argument 'init_string': " + str(command_list[0]))
+
+        # opcode, and tool number for tool changes (None otherwise)
+        self.tool = None
+        if self.command[0] == "T":
+            self.opcode = OP_TOOL_CHANGE
+            self.tool = int(self.command[1:])
         else:
-            raise ValueError("Unrecognized Marlin command passed in argument 'init_string': " + str(command_list[0]))
+            self.opcode = OPCODES.get(self.command, OP_OTHER)
 
-        self.params = dict()  # a dictionary storing param - values pairs (ie. {"x": 0, ... }
-        for parameter_str in command_list:
+        self.x = self.y = self.z = self.e = self.f = self.i = self.j = self.r = None
+        self.other_params = None
+        order = []
+        for parameter_str in command_list[1:]:
             if parameter_str[0].isalpha():
                 if self.command in no_parameter_commands:
-                    self.params[parameter_str.upper()] = 0
+                    param_key, value = parameter_str.upper(), 0
                 else:
                     try:
-                        float(parameter_str[1:])
+                        value = float(parameter_str[1:])
                     except ValueError:
                         raise TypeError("Marlin parameter passed in argument 'init_string' of non-int/non-float type")
-                    else:
-                        self.params[parameter_str[0].upper()] = float(parameter_str[1:])
+                    param_key = parameter_str[0].upper()
+                if self._get(param_key) is None:
+                    order.append(param_key)
+                self._set(param_key, value)
             else:
                 raise ValueError("Unrecognized Marlin parameter passed in argument 'init_string'")
+        self.order = Command.PARAM_ORDERS.setdefault(tuple(order), tuple(order))
+
+    def _set(self, param_key, param_val):
+        # store a parameter value in its slot, or in other_params
+        slot = Command.PARAM_SLOTS.get(param_key)
+        if slot is not None:
+            setattr(self, slot, param_val)
+        else:
+            if self.other_params is None:
+                self.other_params = dict()
+            self.other_params[param_key] = param_val
+
+    def _get(self, param_key):
+        # get a parameter value, or None if the command doesn't have it
+        slot = Command.PARAM_SLOTS.get(param_key)
+        if slot is not None:
+            return getattr(self, slot)
+        if self.other_params is not None:
+            return self.other_params.get(param_key)
+        return None
+
+    @property
+    def params(self):
+        """
+        read-only, as the parameters aren't stored in a dictionary - use set_param() to change a value.
+        This used to be the command's own dictionary, so writing to it changed the command - that
+        now raises a TypeError
+
+        :return: parameter - value pairs, in the order they appeared in the g-code (ie. {"X": 0, ... }
+        :rtype: MappingProxyType
+        """
+        return MappingProxyType({param_key: self._get(param_key) for param_key in self.order})
 
     def get_command(self):
         """
@@ -68,6 +139,13 @@ class Command:
         """
         return self.command
 
+    def get_opcode(self):
+        """
+        :return: integer opcode of the g-code command (one of the OP_ constants)
+        :rtype: int
+        """
+        return self.opcode
+
     def has_param(self, param_char):
         """
         :param param_char: parameter character to search for in g-code command
@@ -78,7 +156,7 @@ class Command:
         err_msg = "Error in marlin.gcode_command.has_param(): "
         # ensuring string passed
         if isinstance(param_char, str):
-            return param_char.upper() in self.params
+            return self._get(param_char.upper()) is not None
         else:
             raise TypeError("Argument 'param_char' of non-string type")
 
@@ -90,10 +168,11 @@ class Command:
         :rtype: float
         """
         err_msg = "Error in marlin.gcode_command.get_param(): "
-        # ensuring param_char is string, and is in self.params
+        # ensuring param_char is string, and is in the command
         if isinstance(param_char, str):
-            if param_char in self.params:
-                return self.params[param_char]
+            value = self._get(param_char)
+            if value is not None:
+                return value
             else:
                 raise ValueError("Command does not contain Marlin parameter given in argument 'param_char'")
         else:
@@ -109,11 +188,11 @@ class Command:
         :type param_val: int, float
         """
         err_msg = "Error in marlin.gcode_command.set_param(): "
-        # ensuring param_char is string and is in self.params and param_val is number
+        # ensuring param_char is string and is in the command and param_val is number
         if isinstance(param_char, str):
             if isinstance(param_val, (int, float)):
-                if param_char in self.params:
-                    self.params[param_char] = param_val
+                if self._get(param_char) is not None:
+                    self._set(param_char, param_val)
                 else:
                     raise ValueError("Command does not contain Marlin parameter given in argument 'param_char'")
             else:
@@ -127,11 +206,141 @@ class Command:
         :rtype: string
         """
         ret_val = self.command
-        for param_key in self.params:
-            ret_val += " " + param_key + str(self.params[param_key])
+        for param_key in self.order:
+            ret_val += " " + param_key + str(self._get(param_key))
         return ret_val
 
 
+class CommandTable:
+    """
+    compact table of parsed Marlin g-code lines, for holding a whole file
+
+    rather than one Command object per line, the table keeps parallel arrays: the opcode, the
+    X, Y, Z, E and F parameters (NaN if the line doesn't have them), and indices into lists of
+    the distinct command names and parameter orders. The rarer parameters (I, J, R and any
+    others) and the tool numbers of tool changes are kept in dictionaries by row. Indexing the
+    table returns a CommandTableRow (a Command for that row), so get_command(), has_param(),
+    get_param() and get_string() still work, and set_param() changes the row in the table. The
+    converter reads the arrays directly
+    """
+
+    # parameters stored in arrays (the rest are kept by row in other_params)
+    ARRAY_PARAMS = ("X", "Y", "Z", "E", "F")
+
+    def __init__(self):
+        """
+        initialization method
+        """
+        self.opcodes = array("b")
+        self.x = array("d")
+        self.y = array("d")
+        self.z = array("d")
+        self.e = array("d")
+        self.f = array("d")
+        self.command_indices = array("H")
+        self.order_indices = array("I")
+        self.commands = []  # distinct command names
+        self.orders = []  # distinct parameter orders
+        self.tools = dict()  # tool number of tool change commands, by row
+        self.other_params = dict()  # I, J, R and other parameters, by row
+        self._command_index = dict()
+        self._order_index = dict()
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, row):
+        """
+        :param row: row of the table
+        :type row: int
+        :return: command of the given row
+        :rtype: Command
+        """
+        if row < 0:
+            row += len(self)
+        command = CommandTableRow.__new__(CommandTableRow)
+        command.command = self.commands[self.command_indices[row]]
+        command.opcode = self.opcodes[row]
+        command.tool = self.tools.get(row)
+        command.order = self.orders[self.order_indices[row]]
+        for slot in ("x", "y", "z", "e", "f"):
+            value = getattr(self, slot)[row]
+            setattr(command, slot, None if isnan(value) else value)
+        command.i = command.j = command.r = None
+        command.other_params = None
+        for param_key, param_val in self.other_params.get(row, dict()).items():
+            Command._set(command, param_key, param_val)
+        command.table = self
+        command.row = row
+        return command
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def append(self, command):
+        """
+        adds a command to the end of the table
+
+        :param command: command to add
+        :type command: Command
+        """
+        row = len(self.opcodes)
+        self.opcodes.append(command.opcode)
+        nan = float("nan")
+        self.x.append(nan if command.x is None else command.x)
+        self.y.append(nan if command.y is None else command.y)
+        self.z.append(nan if command.z is None else command.z)
+        self.e.append(nan if command.e is None else command.e)
+        self.f.append(nan if command.f is None else command.f)
+
+        command_index = self._command_index.get(command.command)
+        if command_index is None:
+            command_index = self._command_index[command.command] = len(self.commands)
+            self.commands.append(command.command)
+        self.command_indices.append(command_index)
+
+        order_index = self._order_index.get(command.order)
+        if order_index is None:
+            order_index = self._order_index[command.order] = len(self.orders)
+            self.orders.append(command.order)
+        self.order_indices.append(order_index)
+
+        if command.tool is not None:
+            self.tools[row] = command.tool
+        if command.i is not None or command.j is not None or command.r is not None or command.other_params is not None:
+            self.other_params[row] = {param_key: command._get(param_key) for param_key in command.order if param_key not in CommandTable.ARRAY_PARAMS}
+
+    def set_param(self, row, param_char, param_val):
+        """
+        sets the value of a parameter the command in the given row already has
+
+        :param row: row of the table
+        :type row: int
+        :param param_char: parameter character to change value
+        :type param_char: str
+        :param param_val: parameter value to set
+        :type param_val: int, float
+        """
+        if param_char in CommandTable.ARRAY_PARAMS:
+            getattr(self, param_char.lower())[row] = param_val
+        else:
+            self.other_params[row][param_char] = param_val
+
+
+class CommandTableRow(Command):
+    """
+    Command for a row of a CommandTable, as returned by indexing the table - set_param() also
+    changes the row in the table, so changes aren't lost when the row is indexed again
+    """
+
+    __slots__ = ("table", "row")
+
+    def _set(self, param_key, param_val):
+        Command._set(self, param_key, param_val)
+        self.table.set_param(self.row, param_key, param_val)
+
+
 def command_to_arc(curr_pos, command):
     """
     converts G2/G3 Marlin g-code command to Arc object
@@ -648,6 +857,10 @@ def marlin_commands():
             "T6")
 
 
+# the commands from marlin_commands(), built once for constant time lookups
+MARLIN_COMMANDS = frozenset(marlin_commands())
+
+
 # station to pull commands periodically, to update return value of marlin_commands
 if __name__ == "__main__":
     commands = marlin_commands()
@@ -31,6 +31,10 @@ UM.Dialog {
         main.updateDispenserPortName("dispenser_2", val);
       } else if (valId == "continuous_extrusion") {
         main.const_extrusion = val;
+      } else if (valId == "travel_optimization") {
+        main.travel_opt = val;
+      } else if (valId == "position_sample_rate") {
+        main.position_sample_rate_str = val;
       }
     }
 
@@ -351,6 +355,48 @@ UM.Dialog {
 
             onCheckedChanged: base.updateVal("continuous_extrusion", checked)
           }
+
+          UM.Label {  // travel optimization label
+            id: travelOptimizationLabel
+            text: "Optimize Travel Moves"
+            font: UM.Theme.getFont("default")
+            height: UM.Theme.getSize("default_margin").height
+            anchors.left: parent.left
+            anchors.top: continuousExtrudingLabel.bottom
+            anchors.topMargin: UM.Theme.getSize("default_margin").height
+          }
+
+          UM.CheckBox{
+            id: travelOptimizationCheckbox
+            checked: main.travel_opt
+            height: UM.Theme.getSize("default_margin").height
+            anchors.left: travelOptimizationLabel.right
+            anchors.leftMargin: UM.Theme.getSize("default_margin").width
+            anchors.top: travelOptimizationLabel.top
+
+            onCheckedChanged: base.updateVal("travel_optimization", checked)
+          }
+
+          UM.Label {  // position sample rate label
+            id: positionSampleRateLabel
+            text: "Position Sample Rate"
+            font: UM.Theme.getFont("default")
+            height: UM.Theme.getSize("setting_control").height
+            anchors.right: positionSampleRateEntry.left
+            anchors.rightMargin: UM.Theme.getSize("default_margin").width
+            anchors.top: parent.top
+          }
+
+          SettingEntry {  // position sample rate entry
+            id: positionSampleRateEntry
+            anchors.right: parent.right
+            anchors.top: parent.top
+            text: main.position_sample_rate_str
+            valId: "position_sample_rate"
+            topLim: 20.0
+            label: "Hz"
+            tooltipId: "position_sample_rate"
+          }
         }
       }
     }
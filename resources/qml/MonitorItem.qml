@@ -189,6 +189,7 @@ Component
                       color: base.debug ? "red" : "#00000000"
 
                       Row {  // current position coordinates row
+                        id: positionRow
                         spacing: UM.Theme.getSize("default_margin").width
 
                         UM.Label {
@@ -227,6 +228,58 @@ Component
                           color: UM.Theme.getColor("text_inactive")
                         }
                       }
+
+                      Canvas {  // x-y path of the current print, from the decimated position history
+                        id: positionHistoryCanvas
+                        property var history: OutputDevice.position_history
+                        visible: history.length > 1
+                        width: parent.width - UM.Theme.getSize("default_margin").width
+                        height: visible ? width / 2 : 0
+                        anchors.top: positionRow.bottom
+                        anchors.topMargin: visible ? UM.Theme.getSize("default_margin").height : 0
+
+                        onHistoryChanged: requestPaint()
+
+                        onPaint: {
+                          var ctx = getContext("2d");
+                          ctx.reset();
+                          if (history.length < 2) {
+                            return;
+                          }
+
+                          // scaling the path to fit the canvas, keeping its aspect ratio
+                          var xMin = history[0][0], xMax = history[0][0], yMin = history[0][1], yMax = history[0][1];
+                          for (var i = 1; i < history.length; i++) {
+                            xMin = Math.min(xMin, history[i][0]);
+                            xMax = Math.max(xMax, history[i][0]);
+                            yMin = Math.min(yMin, history[i][1]);
+                            yMax = Math.max(yMax, history[i][1]);
+                          }
+                          var margin = UM.Theme.getSize("default_lining").width * 2;
+                          var scale = Math.min((width - 2 * margin) / Math.max(xMax - xMin, 1), (height - 2 * margin) / Math.max(yMax - yMin, 1));
+
+                          ctx.lineWidth = UM.Theme.getSize("default_lining").width;
+                          ctx.strokeStyle = UM.Theme.getColor("text_inactive");
+                          ctx.beginPath();
+                          for (var j = 0; j < history.length; j++) {
+                            var px = margin + (history[j][0] - xMin) * scale;
+                            var py = height - margin - (history[j][1] - yMin) * scale;
+                            if (j == 0) {
+                              ctx.moveTo(px, py);
+                            } else {
+                              ctx.lineTo(px, py);
+                            }
+                          }
+                          ctx.stroke();
+
+                          // current position
+                          var last = history[history.length - 1];
+                          ctx.fillStyle = UM.Theme.getColor("primary");
+                          ctx.beginPath();
+                          ctx.arc(margin + (last[0] - xMin) * scale, height - margin - (last[1] - yMin) * scale, 2 * margin, 0, 2 * Math.PI);
+                          ctx.fill();
+                        }
+                      }
                     }
                   }
 
@@ -1072,6 +1125,26 @@ Component
                 anchors.leftMargin: UM.Theme.getSize("default_margin").width
               }
 
+              UM.Label {  // Time remaining label
+                id: timeRemainingLabel
+                text: "Time remaining: " + OutputDevice.print_time_remaining
+                font: UM.Theme.getFont("default")
+                color: UM.Theme.getColor("text")
+                anchors.top: progressTextLabel.bottom
+                anchors.left: parent.left
+                anchors.leftMargin: UM.Theme.getSize("thick_margin").width
+              }
+
+              UM.Label {  // Layer label
+                id: layerLabel
+                text: "Layer: " + OutputDevice.print_layer
+                font: UM.Theme.getFont("default")
+                color: UM.Theme.getColor("text")
+                anchors.top: timeRemainingLabel.bottom
+                anchors.left: parent.left
+                anchors.leftMargin: UM.Theme.getSize("thick_margin").width
+              }
+
               Row {
                 id: bottomRightButtonsRow
                 height: terminateButton.height
@@ -0,0 +1,138 @@
+# benchmark comparing the number of full stops and the print time of continuous extrusion
+# programs compiled with an ID after every VA (the old behaviour) and with ID only at
+# synchronization points. Programs are 'printed' on a simple simulated Fisnar controller.
+#
+# relies on Uranium (UM) and numpy being importable, so should be run from a python environment
+# that Cura runs from source in. usage: python continuousExtrusionBenchmark.py [num layers]
+
+import importlib
+import importlib.util
+import math
+import os
+import sys
+import time
+
+
+PLUGIN_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+
+def loadPluginModule(name):
+    # import a plugin module without running the plugin __init__ (which needs a running Cura)
+    if "fisnar_plugin" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("fisnar_plugin", os.path.join(PLUGIN_DIR, "__init__.py"), submodule_search_locations=[PLUGIN_DIR])
+        sys.modules["fisnar_plugin"] = importlib.util.module_from_spec(spec)
+    return importlib.import_module("fisnar_plugin." + name)
+
+
+class SimulatedFisnar:
+    # very simple model of the F5200N: VA commands are queued and blended together at the
+    # line speed, and the robot only stops (decelerating and accelerating with a trapezoidal
+    # profile) when an ID command makes it wait for the queued moves to finish. Every command
+    # costs one RS232 round trip, and output commands cost one dispenser command
+
+    ROUND_TRIP_TIME = 0.01  # sec
+    DISPENSER_TIME = 0.02  # sec
+    ACCELERATION = 500.0  # mm/sec^2
+
+    def __init__(self):
+        self.position = None
+        self.speed = 30.0
+        self.queued_moves = []  # (length, speed)
+        self.stops = 0
+        self.time = 0.0
+
+    def _runQueuedMoves(self):
+        if len(self.queued_moves) == 0:
+            return
+        self.stops += 1
+        for length, speed in self.queued_moves:
+            self.time += length / speed
+        # accelerating from and decelerating to a stop at the ends of the blended path
+        run_length = sum(move[0] for move in self.queued_moves)
+        speed = self.queued_moves[0][1]
+        if run_length > speed**2 / SimulatedFisnar.ACCELERATION:
+            self.time += speed / SimulatedFisnar.ACCELERATION
+        else:
+            self.time += 2 * math.sqrt(run_length / SimulatedFisnar.ACCELERATION) - run_length / speed
+        self.queued_moves = []
+
+    def send(self, command):
+        self.time += SimulatedFisnar.ROUND_TRIP_TIME
+        if command.startswith(b"VA "):
+            point = [float(coord) for coord in command[3:-1].split(b",")]
+            if self.position is not None:
+                self.queued_moves.append((math.dist(self.position, point), self.speed))
+            self.position = point
+        elif command.startswith(b"SP "):
+            self.speed = float(command[3:-1])
+        elif command.startswith(b"ID"):
+            self._runQueuedMoves()
+        elif command.startswith(b"OU "):
+            self.time += SimulatedFisnar.DISPENSER_TIME
+
+    def finish(self):
+        self._runQueuedMoves()
+
+
+def legacyContinuousBytes(fisnar_commands, FisnarCommands, fisnar):
+    # the old continuous extrusion compiler - an ID after every VA
+    ret_bytes = []
+    for command in fisnar_commands:
+        if command[0] == fisnar.OP_OUTPUT:
+            ret_bytes.append(FisnarCommands.OU(command[1], command[2]))
+        elif command[0] == fisnar.OP_LINE_SPEED:
+            ret_bytes.append(FisnarCommands.SP(command[1]))
+        elif command[0] == fisnar.OP_DUMMY_POINT:
+            ret_bytes.append(FisnarCommands.VA(command[1], command[2], command[3]))
+            ret_bytes.append(FisnarCommands.ID())
+    return ret_bytes
+
+
+def syntheticGcode(num_layers):
+    # concentric circles on each layer, with a travel between each one
+    lines = ["G90", "M82", "T0", "G0 F3000 X100 Y100 Z0.3"]
+    e = 0.0
+    for layer in range(num_layers):
+        z = 0.3 * (layer + 1)
+        for ring in range(1, 11):
+            radius = 3.0 * ring
+            lines.append(f"G0 F3000 X{100 + radius:.3f} Y100 Z{z:.3f}")
+            lines.append("G1 F1200")
+            for step in range(1, 73):
+                angle = 2 * math.pi * step / 72
+                e += 0.05
+                lines.append(f"G1 X{100 + radius * math.cos(angle):.3f} Y{100 + radius * math.sin(angle):.3f} E{e:.4f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    num_layers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    Converter = loadPluginModule("Converter").Converter
+    FisnarCommands = loadPluginModule("FisnarCommands").FisnarCommands
+    PrintSurface = loadPluginModule("PrinterAttributes").PrintSurface
+    fisnar = loadPluginModule("gcodeBuddy.fisnar")
+
+    converter = Converter()
+    converter.setPrintSurface(PrintSurface(0.0, 200.0, 0.0, 200.0, 150.0))
+    converter.setContinuousExtrusion(True)
+    converter.setGcode(syntheticGcode(num_layers))
+    fisnar_commands = converter.getFisnarCommands()
+
+    for name, compile_func in (("ID after every VA", lambda: legacyContinuousBytes(fisnar_commands, FisnarCommands, fisnar)),
+                               ("ID at sync points", lambda: Converter.fisnarCommandsToBytes(fisnar_commands, True))):
+        compile_start = time.perf_counter()
+        command_bytes = compile_func()
+        compile_time = time.perf_counter() - compile_start
+
+        robot = SimulatedFisnar()
+        for command in command_bytes:
+            robot.send(command)
+        robot.finish()
+
+        print(f"{name}:")
+        print(f"    commands sent:    {len(command_bytes)}")
+        print(f"    ID commands:      {command_bytes.count(FisnarCommands.ID())}")
+        print(f"    full stops:       {robot.stops}")
+        print(f"    print time (sec): {robot.time:.1f}")
+        print(f"    compile time (s): {compile_time:.3f}")
@@ -0,0 +1,126 @@
+# checks that the print journal acknowledges each 'ok!' against the command it answers when
+# more than one command is in flight, so an interrupted print resumes at the right segment
+# boundary. The RS232 thread is simulated: a print keeps two commands in flight, output
+# commands go to the dispensers without waiting for the fisnar, and the fisnar answers the
+# commands it's sent in order.
+#
+# relies on Uranium (UM) being importable, so should be run from a python environment that
+# Cura runs from source in. usage: python printJournalTesting.py
+
+import importlib
+import importlib.util
+import os
+import sys
+import tempfile
+
+
+PLUGIN_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+
+def loadPluginModule(name):
+    # import a plugin module without running the plugin __init__ (which needs a running Cura)
+    if "fisnar_plugin" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("fisnar_plugin", os.path.join(PLUGIN_DIR, "__init__.py"), submodule_search_locations=[PLUGIN_DIR])
+        sys.modules["fisnar_plugin"] = importlib.util.module_from_spec(spec)
+    return importlib.import_module("fisnar_plugin." + name)
+
+
+FisnarCommands = loadPluginModule("FisnarCommands").FisnarCommands
+PrintJournal = loadPluginModule("PrintJournal").PrintJournal
+
+
+class SimulatedLink:
+    # the sending side of FisnarOutputDevice._update(), with the fisnar answering in order
+
+    def __init__(self, journal, program):
+        self.journal = journal
+        self.program = program
+        self.current_index = 0
+        self.in_flight = []  # indices the fisnar hasn't answered yet, oldest first
+
+    def sendNext(self):
+        # send the next program command - output commands don't wait for the fisnar, so the one after is sent too
+        while self.current_index < len(self.program):
+            index = self.current_index
+            self.current_index += 1
+            if self.program[index][:3] == b"OU ":
+                continue
+            self.journal.commandSent(index)
+            self.in_flight.append(index)
+            return
+
+    def start(self):
+        for i in range(2):  # same as printProgram() - two commands before the first 'ok!'
+            self.sendNext()
+
+    def receiveOk(self):
+        # the fisnar answers the oldest command in flight, and the next command is sent
+        answered = self.in_flight.pop(0)
+        self.journal.okReceived()
+        self.sendNext()
+        return answered
+
+
+def testInterruptedMidSegment(journal_dir):
+    # two extrusion segments, each ending with an ID. The print is interrupted when the last VA
+    # of the second segment is answered - its ID is still in flight, so the second segment
+    # hasn't finished and has to be printed again
+    program = [
+        FisnarCommands.SP(10),
+        FisnarCommands.VA(0, 0, 10),
+        FisnarCommands.ID(),
+        FisnarCommands.OU(1, 1),
+        FisnarCommands.VA(10, 0, 10),
+        FisnarCommands.VA(10, 10, 10),
+        FisnarCommands.ID(),  # 6 - end of the first segment
+        FisnarCommands.OU(1, 0),
+        FisnarCommands.VA(20, 10, 10),
+        FisnarCommands.ID(),  # 9
+        FisnarCommands.OU(1, 1),
+        FisnarCommands.VA(20, 20, 10),
+        FisnarCommands.VA(30, 20, 10),  # 12 - last VA of the second segment
+        FisnarCommands.ID(),  # 13 - end of the second segment
+        FisnarCommands.OU(1, 0),
+        FisnarCommands.HM()
+    ]
+
+    journal = PrintJournal(os.path.join(journal_dir, "mid_segment_journal"))
+    journal.begin(program)
+    link = SimulatedLink(journal, program)
+    link.start()
+    while link.receiveOk() != 12:
+        pass
+    assert link.in_flight[0] == 13, f"expected the second segment's ID to be in flight, not {link.in_flight}"
+    journal.interrupt()
+
+    command_bytes, last_ack = journal.getInterruptedPrint()
+    assert last_ack == 12, f"last acknowledged command should be the last VA (12), not {last_ack}"
+    resume_index, restore_commands = PrintJournal.getResumePoint(command_bytes, last_ack)
+    assert resume_index == 10, f"print should resume at the start of the second segment (10), not {resume_index}"
+    assert restore_commands == [FisnarCommands.SP(10), FisnarCommands.VA(20, 10, 10), FisnarCommands.ID()], f"unexpected restore commands {restore_commands}"
+
+
+def testInterruptedAfterSegment(journal_dir):
+    # once the second segment's ID has been answered, the print resumes after it
+    program = [FisnarCommands.SP(10), FisnarCommands.VA(0, 0, 10), FisnarCommands.ID(), FisnarCommands.OU(1, 1),
+               FisnarCommands.VA(10, 0, 10), FisnarCommands.ID(), FisnarCommands.VA(20, 0, 10), FisnarCommands.ID()]
+
+    journal = PrintJournal(os.path.join(journal_dir, "after_segment_journal"))
+    journal.begin(program)
+    link = SimulatedLink(journal, program)
+    link.start()
+    while link.receiveOk() != 5:
+        pass
+    journal.interrupt()
+
+    command_bytes, last_ack = journal.getInterruptedPrint()
+    resume_index, restore_commands = PrintJournal.getResumePoint(command_bytes, last_ack)
+    assert resume_index == 6, f"print should resume after the answered ID (6), not {resume_index}"
+    assert restore_commands[-1] == FisnarCommands.OU(1, 1), f"output 1 should be turned back on, restore commands were {restore_commands}"
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as journal_dir:
+        testInterruptedMidSegment(journal_dir)
+        testInterruptedAfterSegment(journal_dir)
+    print("print journal acknowledges every 'ok!' against the command it answers")
@@ -0,0 +1,151 @@
+# benchmark of how much time loading the plugin adds to cura's launch. Each run is done in
+# a fresh interpreter: the modules cura has already loaded by the time it registers plugins
+# (numpy, PyQt6, Uranium and cura) are imported first, then the three modules the plugin's
+# __init__ imports and FisnarOutputDevicePlugin.start() (which cura calls while launching) are
+# timed, and the plugin modules that were loaded are listed. The conversion (Converter,
+# gcodeBuddy, PickAndPlaceGenerator) and serial (FisnarOutputDevice, FisnarFleet,
+# SerialDiscovery, DispenserManager, UltimusV, pyserial) modules should only be loaded on first
+# use. start() is run on a stand-in for the plugin object, as the real one needs a running cura.
+#
+# relies on Uranium (UM), cura and PyQt6 being importable, so should be run from a python
+# environment that Cura runs from source in.
+# usage: python startupImportBenchmark.py [num runs] [git revision to compare against]
+
+import importlib
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PLUGIN_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+# already loaded by cura before any plugin is registered, so not counted against the plugin
+CURA_MODULES = [
+    "numpy",
+    "PyQt6.QtCore",
+    "PyQt6.QtQml",
+    "UM.Application",
+    "UM.Extension",
+    "UM.Mesh.MeshWriter",
+    "UM.OutputDevice.OutputDevicePlugin",
+    "cura.CuraApplication",
+    "cura.BuildVolume",
+    "cura.PrinterOutput.PrinterOutputDevice"
+]
+
+# imported by the plugin __init__ when cura registers it
+REGISTERED_MODULES = ["FisnarCSVWriter", "FisnarRobotExtension", "FisnarOutputDevicePlugin"]
+
+# should only be imported the first time they are used
+DEFERRED_MODULES = ["Converter", "gcodeBuddy", "PickAndPlaceGenerator", "FisnarOutputDevice", "FisnarFleet", "SerialDiscovery", "DispenserManager", "UltimusV"]
+
+
+class StandInApplication:
+    # records the functions start() schedules instead of running them
+    def __init__(self):
+        self.called_later = []
+
+    def callLater(self, func, *args, **kwargs):
+        self.called_later.append(func)
+
+
+class StandInExtension:
+    def addMenuItem(self, name, func):
+        pass
+
+
+class StandInPlugin:
+    # the attributes FisnarOutputDevicePlugin.start() uses
+    def __init__(self):
+        self._application = StandInApplication()
+        self._fre_instance = StandInExtension()
+        self._stopped = False
+        self._submitCurrentScene = None
+        self._broadcastCurrentScene = None
+        self._startDevices = None
+
+
+def loadPluginModule(plugin_dir, name):
+    # import a plugin module without running the plugin __init__ (which needs a running Cura)
+    if "fisnar_plugin" not in sys.modules:
+        spec = importlib.util.spec_from_file_location("fisnar_plugin", os.path.join(plugin_dir, "__init__.py"), submodule_search_locations=[plugin_dir])
+        sys.modules["fisnar_plugin"] = importlib.util.module_from_spec(spec)
+    return importlib.import_module("fisnar_plugin." + name)
+
+
+def childRun(plugin_dir):
+    # run in the child interpreter - prints the import time (sec) and the deferred modules that were loaded
+    for name in CURA_MODULES:
+        importlib.import_module(name)
+
+    start = time.perf_counter()
+    for name in REGISTERED_MODULES:
+        loadPluginModule(plugin_dir, name)
+    output_device_plugin = sys.modules["fisnar_plugin.FisnarOutputDevicePlugin"].FisnarOutputDevicePlugin
+    if hasattr(output_device_plugin, "start"):
+        try:
+            output_device_plugin.start(StandInPlugin())
+        except Exception:  # older revisions set up their devices in start(), which fails here - time the imports it does
+            for name in ("FisnarFleet", "FisnarOutputDevice", "SerialDiscovery"):
+                loadPluginModule(plugin_dir, name)
+    import_time = time.perf_counter() - start
+
+    loaded = [name for name in DEFERRED_MODULES if "fisnar_plugin." + name in sys.modules]
+    if "serial" in sys.modules:
+        loaded.append("pyserial")
+    print(import_time)
+    print(",".join(loaded))
+
+
+def benchmark(plugin_dir, num_runs):
+    # import the plugin num_runs times in fresh interpreters, returning (import times, deferred modules loaded)
+    import_times = []
+    loaded = []
+    for i in range(num_runs):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", plugin_dir], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(result.stderr)
+            raise RuntimeError(f"importing the plugin from {plugin_dir} failed")
+        lines = result.stdout.strip().split("\n")
+        import_times.append(float(lines[0]))
+        loaded = [name for name in lines[1].split(",") if name] if len(lines) > 1 else []
+    return import_times, loaded
+
+
+def exportRevision(revision, directory):
+    # write the plugin files at a git revision to directory
+    archive = subprocess.run(["git", "-C", PLUGIN_DIR, "archive", "--format=tar", revision], capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+
+
+def printResult(label, import_times, loaded):
+    print(f"{label}:")
+    print(f"    median import time: {statistics.median(import_times) * 1000:.1f} ms (min {min(import_times) * 1000:.1f} ms, max {max(import_times) * 1000:.1f} ms)")
+    print(f"    deferred modules loaded at registration and start(): {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        childRun(sys.argv[2])
+        sys.exit(0)
+
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    compare_revision = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print(f"plugin import time added to cura launch, {num_runs} runs each\n")
+    if compare_revision is not None:
+        with tempfile.TemporaryDirectory() as old_plugin_dir:
+            exportRevision(compare_revision, old_plugin_dir)
+            before_times, before_loaded = benchmark(old_plugin_dir, num_runs)
+        printResult(f"before ({compare_revision})", before_times, before_loaded)
+
+    after_times, after_loaded = benchmark(PLUGIN_DIR, num_runs)
+    printResult("after (working tree)", after_times, after_loaded)
+
+    if compare_revision is not None:
+        saved = statistics.median(before_times) - statistics.median(after_times)
+        print(f"\nlaunch time saved: {saved * 1000:.1f} ms ({saved / statistics.median(before_times) * 100:.0f}%)")